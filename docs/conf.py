@@ -20,7 +20,7 @@
 
 import os
 import sys
-from pkg_resources import get_distribution
+from importlib.metadata import version as get_version
 
 
 sys.path.insert(0, os.path.abspath('../rowgenerators'))
@@ -61,9 +61,9 @@ author = 'Eric Busboom'
 # built documents.
 #
 # The short X.Y version.
-version = get_distribution('rowgenerators').version
+version = get_version('rowgenerators')
 # The full version, including alpha/beta/rc tags.
-release = get_distribution('rowgenerators').version
+release = get_version('rowgenerators')
 
 # The language for content autogenerated by Sphinx. Refer to documentation
 # for a list of supported languages.
@@ -4,17 +4,29 @@ DEFAULT_EPSG=4326
 
 from .appurl.url import parse_app_url, Url
 from .appurl.util import get_cache, set_default_cache_name
-from .core import get_generator, dataframe, geoframe, iterator
+from .core import get_generator, resolve_generator, dataframe, geoframe, iterator
 from .source import  Source, RowGenerator
 from .appurl.web.download import Downloader
 from .exceptions import SourceError
 
 
-from pkg_resources import get_distribution, DistributionNotFound
-try:
-    __version__ = get_distribution(__name__).version
-except DistributionNotFound:
-    # package is not installed
-    pass
+def __getattr__(name):
+    # The version is looked up on first access, since reading the package
+    # metadata is slow, and most programs never ask for it.
+    if name == '__version__':
+        import sys
+
+        if sys.version_info >= (3, 10):
+            from importlib.metadata import version, PackageNotFoundError
+        else:
+            from importlib_metadata import version, PackageNotFoundError
+
+        try:
+            return version(__name__)
+        except PackageNotFoundError:
+            # package is not installed
+            pass
+
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
 
 
@@ -6,5 +6,5 @@
 
 """
 
-from .url import Url, parse_app_url, match_url_classes
+from .url import Url, parse_app_url, match_url_classes, refresh_registry
 from .util import get_cache
@@ -91,7 +91,7 @@ class ZipUrl(FileUrl):
 
         from rowgenerators.appurl.url import parse_app_url
         from zipfile import ZipFile, BadZipFile
-        from rowgenerators.appurl.util import copy_file_or_flo, ensure_dir
+        from rowgenerators.appurl.util import copy_file_or_flo, ensure_dir, publish_file
         from pathlib import Path
         from time import time
 
@@ -118,10 +118,14 @@ class ZipUrl(FileUrl):
 
         # Unpack the file if it dos not exist, or if the zile file is newer
         if not target_path.exists() or age(target_path) > age(Path(self.fspath)):
-            with target_path.open('wb') as f, zf.open(self.target_file) as flo:
+            # Extract to a temporary file, then rename it, so other processes never see a partial file
+            with publish_file(target_path) as f, zf.open(self.target_file) as flo:
                 copy_file_or_flo(flo, f)
+
+            self._index_target(target_path)
             disp = 'copied'
         else:
+            self._index_target(target_path, 'touch')
             disp = 'extant'
 
         fq = self.frag_dict
@@ -152,6 +156,26 @@ class ZipUrl(FileUrl):
 
         return tu
 
+    def _index_target(self, target_path, method='record'):
+        """Add an extracted file to the cache index, or record a use of it, if it is in the cache"""
+        import os
+        from fs.errors import NoSysPath
+
+        try:
+            path = os.path.relpath(str(target_path), self.downloader.cache.getsyspath('/'))
+        except NoSysPath:
+            return
+
+        if path.startswith('..'):
+            return
+
+        path = path.replace(os.sep, '/')
+
+        if method == 'record':
+            self.downloader._update_index('record', path, str(self))
+        else:
+            self.downloader._update_index(method, path)
+
     def list(self):
         """List the files in the referenced Zip file"""
 
@@ -0,0 +1,250 @@
+# Copyright (c) 2017 Civic Knowledge. This file is licensed under the terms of the
+# MIT, included in this distribution as LICENSE
+
+"""An index of the files in a cache, in a SQLite database at the root of the cache, which records the size,
+origin URL, last access time and number of uses of each file. Eviction works from the index, so it doesn't have
+to walk the cache directory tree.
+"""
+
+import logging
+
+logger = logging.getLogger('rowgenerators.appurl.cache_index')
+
+INDEX_NAME = 'cache_index.sqlite'
+
+# Files in the cache that are not cache entries
+_sidecar_suffixes = ('.meta', '.lock', '.part', '.tmp')
+
+_schema = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    url TEXT,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+"""
+
+policies = {
+    'lru': 'accessed',
+    'lfu': 'hits, accessed'
+}
+
+
+class CacheIndex(object):
+    """Index of the entries in a pyfilesystem cache. For caches without a system path, like memory caches, the
+    index is an in-memory database. Each operation uses its own connection, so an index can be shared by threads
+    and processes. """
+
+    def __init__(self, cache):
+        from fs.errors import NoSysPath
+        from threading import Lock
+
+        self.cache = cache
+        self._lock = Lock()
+        self._memory_conn = None
+
+        try:
+            self.db_path = cache.getsyspath(INDEX_NAME)
+        except NoSysPath:
+            self.db_path = None
+
+        # True if the index is new, so it may not have entries for files already in the cache
+        self.created = not cache.exists(INDEX_NAME)
+
+        with self._connect() as conn:
+            conn.executescript(_schema)
+
+    def _connect(self):
+        """Return a context manager for a connection, which commits on success and closes when it exits"""
+        import sqlite3
+        from contextlib import contextmanager
+
+        @contextmanager
+        def connect():
+            if self.db_path is None:
+                with self._lock:
+                    if self._memory_conn is None:
+                        self._memory_conn = sqlite3.connect(':memory:', check_same_thread=False)
+
+                    with self._memory_conn:
+                        yield self._memory_conn
+                return
+
+            conn = sqlite3.connect(self.db_path, timeout=30)
+
+            try:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+
+        return connect()
+
+    def record(self, path, url=None, size=None):
+        """Add or replace the entry for a file that was just written to the cache"""
+        import time
+
+        now = time.time()
+
+        if size is None:
+            size = self.cache.getsize(path)
+
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO entries (path, url, size, created, accessed, hits) '
+                         'VALUES (?, ?, ?, ?, ?, 0)', (path, url, size, now, now))
+
+    def touch(self, path):
+        """Record a use of a cached file"""
+        import time
+
+        with self._connect() as conn:
+            conn.execute('UPDATE entries SET accessed = ?, hits = hits + 1 WHERE path = ?', (time.time(), path))
+
+    def remove(self, path):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM entries WHERE path = ?', (path,))
+
+    def get(self, path):
+        """Return the entry for a path, as a dict, or None"""
+
+        with self._connect() as conn:
+            r = conn.execute('SELECT path, url, size, created, accessed, hits FROM entries WHERE path = ?',
+                             (path,)).fetchone()
+
+        return dict(zip(('path', 'url', 'size', 'created', 'accessed', 'hits'), r)) if r else None
+
+    def stats(self):
+        """Return a dict with the number of entries, their total size, and the oldest and newest access times"""
+
+        with self._connect() as conn:
+            entries, size, oldest, newest = conn.execute(
+                'SELECT count(*), coalesce(sum(size), 0), min(accessed), max(accessed) FROM entries').fetchone()
+
+        return {'entries': entries, 'bytes': size, 'oldest_access': oldest, 'newest_access': newest}
+
+    def _walk(self):
+        """Yield the path, origin URL, size, access time and modification time of the files in the cache"""
+        import json
+        import time
+
+        now = time.time()
+
+        for path, info in self.cache.walk.info(namespaces=['details']):
+            path = path.lstrip('/')
+
+            if info.is_dir or path.startswith(INDEX_NAME) or path.endswith(_sidecar_suffixes):
+                continue
+
+            try:
+                url = json.loads(self.cache.readtext(path + '.meta')).get('url')
+            except Exception:
+                url = None
+
+            modified = info.modified.timestamp() if info.modified else now
+            accessed = info.accessed.timestamp() if info.accessed else modified
+
+            yield path, url, info.size, accessed, modified
+
+    def rebuild(self):
+        """Replace the index with the files found by walking the cache. This is only needed for caches that
+        were filled before they had an index. Returns the number of entries. """
+
+        rows = [(path, url, size, accessed, accessed) for path, url, size, accessed, _ in self._walk()]
+
+        with self._connect() as conn:
+            conn.execute('DELETE FROM entries')
+            conn.executemany('INSERT INTO entries (path, url, size, created, accessed, hits) '
+                             'VALUES (?, ?, ?, ?, ?, 0)', rows)
+
+        self.created = False
+
+        return len(rows)
+
+    def add_unindexed(self):
+        """Add entries for files in the cache that aren't in the index, like ones written by code that
+        doesn't record them, using their modification time as the last access. Returns the number of
+        entries added. """
+
+        with self._connect() as conn:
+            indexed = {r[0] for r in conn.execute('SELECT path FROM entries')}
+
+        rows = [(path, url, size, modified, modified) for path, url, size, _, modified in self._walk()
+                if path not in indexed]
+
+        with self._connect() as conn:
+            conn.executemany('INSERT OR IGNORE INTO entries (path, url, size, created, accessed, hits) '
+                             'VALUES (?, ?, ?, ?, ?, 0)', rows)
+
+        return len(rows)
+
+    def _remove_files(self, path):
+        from fs.errors import ResourceNotFound, ResourceInvalid
+
+        for p in (path, path + '.meta'):
+            try:
+                self.cache.remove(p)
+            except (ResourceNotFound, ResourceInvalid):
+                pass
+
+    def evict(self, max_bytes=None, max_entries=None, max_age=None, policy='lru', exclude=(), dry_run=False):
+        """Delete cache entries, and their metadata sidecars, until the cache is within the budgets.
+
+        :param max_bytes: Maximum total size of the entries
+        :param max_entries: Maximum number of entries
+        :param max_age: Entries not used in this many seconds are deleted
+        :param policy: 'lru' deletes the least recently used entries first, 'lfu' the least frequently used
+        :param exclude: Paths that must not be deleted
+        :param dry_run: If True, don't delete anything
+        :return: A list of the (path, size) of the deleted entries
+        """
+        import time
+        from rowgenerators.exceptions import RowGeneratorError
+
+        try:
+            order = policies[policy]
+        except KeyError:
+            raise RowGeneratorError("Unknown eviction policy '{}'; must be one of: {}"
+                                    .format(policy, ', '.join(policies)))
+
+        stats = self.stats()
+        n, size = stats['entries'], stats['bytes']
+
+        cutoff = time.time() - max_age if max_age is not None else None
+
+        evicted = []
+
+        with self._connect() as conn:
+            for path, entry_size, accessed in conn.execute(
+                    'SELECT path, size, accessed FROM entries ORDER BY {}'.format(order)).fetchall():
+
+                expired = cutoff is not None and accessed < cutoff
+                over = (max_bytes is not None and size > max_bytes) or (max_entries is not None and n > max_entries)
+
+                if not (expired or over):
+                    if cutoff is None:
+                        break  # Within the budgets, and nothing else is expired
+                    continue
+
+                if path in exclude:
+                    continue
+
+                evicted.append((path, entry_size))
+                n -= 1
+                size -= entry_size
+
+            if not dry_run:
+                for path, _ in evicted:
+                    self._remove_files(path)
+
+                conn.executemany('DELETE FROM entries WHERE path = ?', [(p,) for p, _ in evicted])
+
+        for path, entry_size in evicted:
+            logger.debug("Evicted {} ({} bytes)".format(path, entry_size))
+
+        return evicted
@@ -10,7 +10,7 @@ CLI program for managing Metatab files
 
 def appurl():
     import sys
-    from pkg_resources import iter_entry_points
+    from rowgenerators.appurl.util import iter_entry_points
     from tabulate import tabulate
     from rowgenerators.appurl import parse_app_url
 
@@ -32,7 +32,7 @@ def appurl():
     entries = []
     for ep in iter_entry_points('appurl.urls'):
         c = ep.load()
-        entries.append([c.match_priority, ep.name, ep.module_name,  c.__name__, ])
+        entries.append([c.match_priority, ep.name, ep.module,  c.__name__, ])
 
 
     if args.list:
@@ -54,6 +54,88 @@ def appurl():
 
         print(tabulate(t))
 
+
+def parse_size(v):
+    """Parse a number with an optional K, M, G or T suffix, for sizes, or s, m, h or d, for ages in seconds"""
+
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4,
+             's': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+    v = v.strip()
+
+    if v and v[-1] in units:
+        return int(float(v[:-1]) * units[v[-1]])
+
+    return int(v)
+
+
+def rowgen_cache():
+    import sys
+    import datetime
+    from tabulate import tabulate
+    from rowgenerators.appurl.util import get_cache
+    from rowgenerators.appurl.cache_index import CacheIndex, policies
+
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='rowgen-cache',
+        description='Report on, and evict files from, the download cache',
+       )
+
+    parser.add_argument('-c', '--cache-name', help="Name of the cache. Uses the default cache if not set")
+
+    cmds = parser.add_subparsers(dest='command', required=True)
+
+    cmds.add_parser('stats', help="Print the number and total size of the cached files")
+
+    evict = cmds.add_parser('evict', help="Delete cached files to get the cache within budgets")
+
+    evict.add_argument('-b', '--max-bytes', type=parse_size, help="Maximum size of the cache, like 500M or 20G")
+    evict.add_argument('-e', '--max-entries', type=int, help="Maximum number of files in the cache")
+    evict.add_argument('-a', '--max-age', type=parse_size,
+                       help="Delete files not used in this time, like 3600, 12h or 7d")
+    evict.add_argument('-p', '--policy', choices=list(policies), default='lru',
+                       help="Delete the least recently used, or least frequently used, files first")
+    evict.add_argument('-n', '--dry-run', action='store_true', help="List the files, but don't delete them")
+
+    cmds.add_parser('rebuild', help="Rebuild the index by walking the cache")
+
+    args = parser.parse_args(sys.argv[1:])
+
+    cache = get_cache(args.cache_name)
+    index = CacheIndex(cache)
+
+    if args.command == 'rebuild' or index.created:
+        n = index.rebuild()
+        print("Indexed {} files".format(n))
+    elif args.command == 'evict':
+        index.add_unindexed()
+
+    def ts(v):
+        return datetime.datetime.fromtimestamp(v).isoformat(timespec='seconds') if v else ''
+
+    if args.command == 'stats':
+        stats = index.stats()
+
+        print(tabulate([
+            ('Cache', cache.getsyspath('/')),
+            ('Entries', stats['entries']),
+            ('Bytes', stats['bytes']),
+            ('Oldest access', ts(stats['oldest_access'])),
+            ('Newest access', ts(stats['newest_access']))
+        ]))
+
+    elif args.command == 'evict':
+        evicted = index.evict(max_bytes=args.max_bytes, max_entries=args.max_entries, max_age=args.max_age,
+                              policy=args.policy, dry_run=args.dry_run)
+
+        for path, size in evicted:
+            print(size, path)
+
+        print("{} {} files, {} bytes".format('Would evict' if args.dry_run else 'Evicted',
+                                             len(evicted), sum(size for _, size in evicted)))
+
+
 if __name__ == "__main__":
     # execute only if run as a script
     appurl()
\ No newline at end of file
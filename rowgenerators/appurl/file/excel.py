@@ -49,14 +49,12 @@ class ExcelFileUrl(FileUrl):
 
     def list(self, list_self=False):
 
-        from xlrd import open_workbook
+        from rowgenerators.generator.excel import workbook_cache
 
-        wb = open_workbook(filename=str(self.fspath))
+        with workbook_cache.open(self.fspath) as wb:
+            sheet_names = wb.sheet_names
 
-        def _l():
-            return list(self.set_target_segment(sheet) for sheet in wb.sheet_names())
-
-        return ( [self] if list_self else [] ) + _l()
+        return ( [self] if list_self else [] ) + [self.set_target_segment(sheet) for sheet in sheet_names]
 
 
 
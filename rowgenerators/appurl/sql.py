@@ -13,13 +13,23 @@ class Sql(Url):
     match_priority = Url.match_priority - 1
 
     def __init__(self, url=None, downloader=None, **kwargs):
-        # Save for auth_url()
+        from urllib.parse import unquote
 
-        self.username
+        # Save for auth_url()
 
         self._orig_url = url
         self._orig_kwargs = dict(kwargs.items())
 
+        # The query is split off before parsing, because the fragment parser would break it up
+        # on characters that are common in SQL, like '=' and ';'. The connection string is kept as it is written,
+        # because some, like 'sqlite:////path', don't survive being parsed and re-assembled.
+        if url and '#' in str(url):
+            url, sql = str(url).split('#', 1)
+            kwargs.setdefault('sql', unquote(sql))
+
+        if url:
+            kwargs.setdefault('dsn_url', str(url))
+
         super().__init__(url, downloader=downloader, **kwargs)
 
     def get_resource(self):
@@ -35,25 +45,52 @@ class Sql(Url):
         from rowgenerators.exceptions import RowGeneratorError
         import os
 
-        u = self.clone()
-        u.fragment = []
-        try:
-            u.password = u.password.format(**os.environ)
-        except KeyError as e:
-            raise RowGeneratorError(("Failed to set password from environment variable in connection string '{}'. "
-                                     " exception = {}").format(str(u), str(e)))
+        dsn = self._parts.get('dsn_url') or str(self.clone(sql=None))
 
-        return str(u)
+        if self.password:
+            try:
+                password = self.password.format(**os.environ)
+            except KeyError as e:
+                raise RowGeneratorError(("Failed to set password from environment variable in connection string "
+                                         "'{}'. exception = {}").format(dsn, str(e)))
+
+            dsn = dsn.replace(':{}@'.format(self.password), ':{}@'.format(password), 1)
+
+        return dsn
+
+    @property
+    def dict(self):
+        """Like Url.dict, but with the query as the fragment"""
+
+        d = super().dict
+
+        if self.sql:
+            d['fragment'] = self.sql
+            d['fragment_query'] = {}
+
+        return d
+
+    def __str__(self):
+        from urllib.parse import quote
+        from rowgenerators.appurl.util import unparse_url_dict
+
+        s = self._parts.get('dsn_url') or unparse_url_dict(self.dict, fragment=None, fragment_query=None)
+
+        if self.sql:
+            # Quoted so the query comes back out of the fragment unchanged, with unquote() in __init__
+            s += '#' + quote(self.sql, safe=" *=<>!,;:()'")
+
+        return s
 
     @property
     def sql(self):
         """Return the query, which is embedded in the fragment"""
-        return self._fragment[0]
+        return self._parts.get('sql')
 
     @sql.setter
     def sql(self, value):
         """Return the query, which is embedded in the fragment"""
-        self._fragment[0] = value
+        self._parts['sql'] = value
 
 class SqlFile(Sql):
     """
@@ -89,7 +126,7 @@ class InlineSqlUrl(Sql):
 
         u = parse_app_url(self.dsns[self.dsn_name])
 
-        u._fragment[0] = self.sql
+        u.sql = self.sql
 
         return u
 
@@ -110,3 +147,19 @@ class OracleSql(Sql):
     @classmethod
     def _match(cls, url, **kwargs):
         return url.proto == 'oracle'
+
+
+class SqliteSql(Sql):
+    generator_class = Sql
+
+    @classmethod
+    def _match(cls, url, **kwargs):
+        return url.proto == 'sqlite'
+
+
+class PostgresSql(Sql):
+    generator_class = Sql
+
+    @classmethod
+    def _match(cls, url, **kwargs):
+        return url.proto == 'postgresql'
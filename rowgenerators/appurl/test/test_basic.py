@@ -6,6 +6,7 @@ import os
 from os.path import exists, dirname
 
 from rowgenerators.appurl.archive.zip import ZipUrl
+from rowgenerators.appurl.file.excel import ExcelFileUrl
 from rowgenerators.appurl.url import Url, parse_app_url
 from rowgenerators.appurl.web.download import Downloader
 from rowgenerators.appurl.web.s3 import S3Url
@@ -67,8 +68,32 @@ class BasicTests(unittest.TestCase):
         self.assertIsInstance(parse_app_url('http://bucket.com/foo/bar/baz.zip'), WebUrl)
         self.assertIsInstance(parse_app_url('file://bucket.com/foo/bar/baz.zip'), ZipUrl)
 
+    def test_url_registry(self):
+        from rowgenerators.appurl.util import iter_entry_points
+        from rowgenerators.appurl.url import url_registry, refresh_registry
+
+        urls = ['http://example.com/foo.csv', 's3://bucket.com/foo/bar/baz.zip', 'file:foo/bar.xlsx#sheet1',
+                'gs:1qjjtkMqpxtkDp3qZlkF7P8Tm8VtfIwiWW-OqJ2J91yE#2038675149',
+                'https://docs.google.com/spreadsheets/d/foo/pubhtml', 'program+file:foo.py',
+                'shape+http://example.com/a.zip', '/tmp/foo.h5', 'foo.dta', 'python:foo#bar',
+                'ftp://example.com/a.csv', 'http://example.com/a.zip#b.xls;1']
+
+        # The registry must produce the same classes, in the same order, as testing every entry point
+        for u_s in urls:
+            u = Url(u_s)
+            classes = sorted([ep.load() for ep in iter_entry_points(group='appurl.urls')
+                              if u._match_entry_point(ep.name)],
+                             key=lambda cls: cls.match_priority)
+
+            self.assertEqual(classes, url_registry().match(u), u_s)
+
+        r = url_registry()
+        self.assertIs(r, url_registry())
+        self.assertIsNot(r, refresh_registry())
+        self.assertIsInstance(parse_app_url('file:foo/bar.xlsx#sheet1'), ExcelFileUrl)
+
     def test_entry_point_priorities(self):
-        from pkg_resources import iter_entry_points
+        from rowgenerators.appurl.util import iter_entry_points
 
         eps = []
 
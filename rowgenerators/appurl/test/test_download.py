@@ -0,0 +1,555 @@
+import unittest
+
+
+class _Server(object):
+    """A local HTTP server for the files in a directory, which counts the requests for each path"""
+
+    def __init__(self, directory):
+        from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+        from threading import Thread
+        from collections import Counter
+
+        self.requests = Counter()
+        self.connections = set()
+        self.failures = Counter()  # Number of 503 responses to return for a path
+        self.delays = {}  # Seconds to wait before responding for a path
+        self.responses = {}  # Status codes of the responses for each path
+        self.headers = {}  # Headers of the last request for each path
+        self.etags = False  # Send ETags, and check If-None-Match
+        self.drops = Counter()  # Number of responses for a path to cut off half way through the body
+        self.shorts = Counter()  # Number of range responses for a path with only half of the range
+
+        server = self
+
+        class Handler(SimpleHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=directory, **kwargs)
+
+            def do_GET(self):
+                import time
+
+                server.requests[self.path] += 1
+                server.connections.add(self.client_address)
+                server.headers[self.path] = dict(self.headers)
+
+                time.sleep(server.delays.get(self.path, 0))
+
+                if server.failures[self.path] > 0:
+                    server.failures[self.path] -= 1
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                f = self.send_head()
+
+                if f:
+                    try:
+                        if server.drops[self.path] > 0:
+                            server.drops[self.path] -= 1
+                            data = f.read()
+                            self.wfile.write(data[:len(data) // 2])
+                            self.close_connection = True
+                        else:
+                            self.copyfile(f, self.wfile)
+                    finally:
+                        f.close()
+
+            def send_response(self, code, message=None):
+                server.responses.setdefault(self.path, []).append(code)
+                super().send_response(code, message)
+
+            def send_head(self):
+                import hashlib
+                import os
+
+                path = self.translate_path(self.path)
+                self.etag = None
+
+                if server.etags and os.path.isfile(path):
+                    with open(path, 'rb') as f:
+                        self.etag = '"{}"'.format(hashlib.md5(f.read()).hexdigest())
+
+                    if self.headers.get('If-None-Match') == self.etag:
+                        self.send_response(304)
+                        self.end_headers()
+                        return None
+
+                if self.headers.get('Range') and os.path.isfile(path):
+                    return self.send_range(path)
+
+                return super().send_head()
+
+            def send_range(self, path):
+                import io
+                import os
+
+                st = os.stat(path)
+                last_modified = self.date_time_string(st.st_mtime)
+
+                if self.headers.get('If-Range') not in (None, self.etag, last_modified):
+                    return super().send_head()
+
+                start, end = self.headers['Range'].split('=')[1].split('-')
+                start, end = int(start), int(end) if end else st.st_size - 1
+
+                if start >= st.st_size:
+                    self.send_response(416)
+                    self.send_header('Content-Range', 'bytes */{}'.format(st.st_size))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return None
+
+                with open(path, 'rb') as f:
+                    f.seek(start)
+                    data = f.read(end - start + 1)
+
+                if server.shorts[self.path] > 0:
+                    server.shorts[self.path] -= 1
+                    data = data[:len(data) // 2]
+
+                self.send_response(206)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, st.st_size))
+                self.send_header('Content-Length', str(len(data)))
+                self.send_header('Last-Modified', last_modified)
+                self.end_headers()
+
+                return io.BytesIO(data)
+
+            def end_headers(self):
+                if getattr(self, 'etag', None):
+                    self.send_header('ETag', self.etag)
+                self.send_header('Accept-Ranges', 'bytes')
+                super().end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.handle_error = lambda request, client_address: None  # Clients may close connections early
+        self.thread = Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path):
+        return 'http://127.0.0.1:{}/{}'.format(self.httpd.server_address[1], path)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def d_url(url, downloader):
+    from rowgenerators.appurl.url import parse_app_url
+
+    return parse_app_url(url, downloader=downloader)
+
+
+class TestDownload(unittest.TestCase):
+
+    def setUp(self):
+        from tempfile import TemporaryDirectory
+        from fs.osfs import OSFS
+
+        self.tmp = TemporaryDirectory()
+        self.src_dir = self.tmp.name + '/src'
+        self.cache_dir = self.tmp.name + '/cache'
+
+        import os
+        os.makedirs(self.src_dir)
+        os.makedirs(self.cache_dir)
+
+        self.cache = OSFS(self.cache_dir)
+        self.server = _Server(self.src_dir)
+
+    def tearDown(self):
+        self.server.close()
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def write(self, name, size):
+        from os.path import join
+
+        data = bytes(i % 251 for i in range(size))
+
+        with open(join(self.src_dir, name), 'wb') as f:
+            f.write(data)
+
+        return data
+
+    def test_prefetch(self):
+        from rowgenerators.appurl.url import parse_app_url
+        from rowgenerators.appurl.web.download import Downloader
+        from rowgenerators.exceptions import DownloadError
+
+        files = {'file-{}.csv'.format(i): self.write('file-{}.csv'.format(i), 10000 + i * 1000) for i in range(20)}
+
+        messages = []
+
+        d = Downloader(cache=self.cache, callback=lambda *args: messages.append(args))
+
+        urls = [self.server.url(n) for n in files]
+
+        # Duplicates, as strings and as Url objects, are only downloaded once
+        results = d.prefetch(urls + urls[:5] + [parse_app_url(u) for u in urls[5:10]], max_workers=4)
+
+        self.assertEqual(set(urls), set(results))
+
+        for name, data in files.items():
+            r = results[self.server.url(name)]
+            with open(r.sys_path, 'rb') as f:
+                self.assertEqual(data, f.read())
+            self.assertEqual(1, self.server.requests['/' + name])
+
+        prefetch = [m for m in messages if m[0] == 'prefetch']
+        self.assertEqual(list(range(1, 21)), [m[2] for m in prefetch])
+        self.assertTrue(all(m[3] == 20 for m in prefetch))
+
+        reads = [m[2] for m in messages if m[0] == 'prefetch read']
+        self.assertEqual(sum(len(d) for d in files.values()), reads[-1])
+        self.assertEqual(sorted(reads), reads)
+
+        # Cached files are not downloaded again
+        d.prefetch(urls)
+        self.assertEqual(1, max(self.server.requests.values()))
+
+        with self.assertRaises(DownloadError):
+            d.prefetch([self.server.url('missing.csv'), self.server.url('file-0.csv')])
+
+    def test_session(self):
+        from rowgenerators.appurl.web.download import Downloader
+        from rowgenerators.exceptions import DownloadError
+
+        names = ['file-{}.csv'.format(i) for i in range(10)]
+        files = {n: self.write(n, 100000) for n in names}
+
+        d = Downloader(cache=self.cache, backoff_factor=0.01)
+
+        # Sequential downloads from one host reuse one connection
+        for n in names:
+            with open(d.download(d_url(self.server.url(n), d)).sys_path, 'rb') as f:
+                self.assertEqual(files[n], f.read())
+
+        self.assertEqual(1, len(self.server.connections))
+
+        # Transient errors are retried
+        self.write('flaky.csv', 100)
+        self.server.failures['/flaky.csv'] = 2
+        d.download(d_url(self.server.url('flaky.csv'), d))
+        self.assertEqual(3, self.server.requests['/flaky.csv'])
+
+        self.write('broken.csv', 100)
+        self.server.failures['/broken.csv'] = 10
+
+        with self.assertRaises(DownloadError):
+            Downloader(cache=self.cache, retries=2, backoff_factor=0.01).download(
+                d_url(self.server.url('broken.csv'), d))
+
+        self.assertEqual(3, self.server.requests['/broken.csv'])
+
+        # Timeouts
+        self.write('slow.csv', 100)
+        self.server.delays['/slow.csv'] = 1
+
+        with self.assertRaises(DownloadError):
+            Downloader(cache=self.cache, retries=0, timeout=0.2).download(d_url(self.server.url('slow.csv'), d))
+
+        d.close()
+
+    def test_revalidate(self):
+        import hashlib
+        import os
+        import time
+        from rowgenerators.appurl.web.download import Downloader
+
+        data = self.write('data.csv', 1000)
+        url = self.server.url('data.csv')
+
+        # The default is to never revalidate
+        d = Downloader(cache=self.cache)
+        r = d.download(d_url(url, d))
+        d.download(d_url(url, d))
+        self.assertEqual([200], self.server.responses['/data.csv'])
+
+        meta = d.read_meta(r.cache_path)
+        self.assertEqual(url, meta['url'])
+        self.assertEqual(1000, meta['length'])
+        self.assertIsNotNone(meta['last_modified'])
+        self.assertEqual(hashlib.sha256(data).hexdigest(), meta['sha256'])
+
+        # With a TTL of 0, every use revalidates with If-Modified-Since
+        d = Downloader(cache=self.cache, ttl=0)
+        r = d.download(d_url(url, d))
+        self.assertIsNone(r.download_time)
+        self.assertEqual([200, 304], self.server.responses['/data.csv'])
+        self.assertEqual(meta['last_modified'], self.server.headers['/data.csv']['If-Modified-Since'])
+        self.assertLess(meta['validated'], d.read_meta(r.cache_path)['validated'])
+
+        # A changed file is downloaded again
+        data = self.write('data.csv', 2000)
+        t = time.time() + 10
+        os.utime(os.path.join(self.src_dir, 'data.csv'), (t, t))
+
+        r = d.download(d_url(url, d))
+        self.assertIsNotNone(r.download_time)
+        self.assertEqual([200, 304, 200], self.server.responses['/data.csv'])
+        with open(r.sys_path, 'rb') as f:
+            self.assertEqual(data, f.read())
+        self.assertEqual(2000, d.read_meta(r.cache_path)['length'])
+
+        # ETags, and use_cache=False, which also revalidates
+        self.server.etags = True
+        self.write('tagged.csv', 100)
+        url = self.server.url('tagged.csv')
+
+        d = Downloader(cache=self.cache, use_cache=False)
+        r = d.download(d_url(url, d))
+        d.download(d_url(url, d))
+        self.assertEqual([200, 304], self.server.responses['/tagged.csv'])
+        self.assertEqual(d.read_meta(r.cache_path)['etag'], self.server.headers['/tagged.csv']['If-None-Match'])
+
+        # Per host TTLs
+        d = Downloader(cache=self.cache, ttl={'127.0.0.1': 3600, '*': 0})
+        d.download(d_url(url, d))
+        self.assertEqual(2, self.server.requests['/tagged.csv'])
+
+        d = Downloader(cache=self.cache, ttl={'example.com': 3600, '*': 0})
+        d.download(d_url(url, d))
+        self.assertEqual(3, self.server.requests['/tagged.csv'])
+
+    def test_resume(self):
+        import os
+        import time
+        from rowgenerators.appurl.web.download import Downloader
+        from rowgenerators.exceptions import DownloadError
+
+        data = self.write('big.csv', 1000000)
+        url = self.server.url('big.csv')
+
+        def check(r):
+            with open(r.sys_path, 'rb') as f:
+                self.assertEqual(data, f.read())
+            self.assertFalse(os.path.exists(r.sys_path + '.part'))
+            self.assertEqual(len(data), d.read_meta(r.cache_path)['length'])
+
+        # A dropped connection is resumed with a range request
+        self.server.drops['/big.csv'] = 1
+        d = Downloader(cache=self.cache, backoff_factor=0.01)
+        check(d.download(d_url(url, d)))
+        self.assertEqual([200, 206], self.server.responses['/big.csv'])
+        self.assertEqual('bytes=500000-', self.server.headers['/big.csv']['Range'])
+
+        # A failed download leaves a .part file, which the next download resumes
+        self.server.responses.clear()
+        self.cache.remove(d.cache_path(url))
+        self.server.drops['/big.csv'] = 1
+
+        with self.assertRaises(DownloadError):
+            Downloader(cache=self.cache, retries=0).download(d_url(url, d))
+
+        part = os.path.join(self.cache_dir, d.cache_path(url)) + '.part'
+        self.assertEqual(500000, os.path.getsize(part))
+
+        check(d.download(d_url(url, d)))
+        self.assertEqual([200, 206], self.server.responses['/big.csv'])
+
+        # A .part file that is already complete gets a 416, so it is deleted, and the download starts again
+        self.server.responses.clear()
+        self.cache.remove(d.cache_path(url))
+        self.server.drops['/big.csv'] = 1
+
+        with self.assertRaises(DownloadError):
+            Downloader(cache=self.cache, retries=0).download(d_url(url, d))
+
+        with open(part, 'ab') as f:
+            f.write(data[500000:])
+
+        check(d.download(d_url(url, d)))
+        self.assertEqual([200, 416, 200], self.server.responses['/big.csv'])
+        self.assertFalse(self.cache.exists(d.cache_path(url) + '.part.meta'))
+
+        # If the resource changed, If-Range gets the whole file
+        self.server.responses.clear()
+        self.cache.remove(d.cache_path(url))
+        self.server.drops['/big.csv'] = 1
+
+        with self.assertRaises(DownloadError):
+            Downloader(cache=self.cache, retries=0).download(d_url(url, d))
+
+        data = self.write('big.csv', 900000)[::-1]
+        with open(os.path.join(self.src_dir, 'big.csv'), 'wb') as f:
+            f.write(data)
+        t = time.time() + 10
+        os.utime(os.path.join(self.src_dir, 'big.csv'), (t, t))
+
+        check(d.download(d_url(url, d)))
+        self.assertEqual([200, 200], self.server.responses['/big.csv'])
+
+        # Concurrent segments, with a dropped connection. The first drop is the initial request, which is closed
+        # after the headers anyway
+        self.server.responses.clear()
+        self.cache.remove(d.cache_path(url))
+        self.server.drops['/big.csv'] = 2
+
+        d = Downloader(cache=self.cache, backoff_factor=0.01, segments=4, min_segment_size=200000)
+        check(d.download(d_url(url, d)))
+        self.assertEqual(200, self.server.responses['/big.csv'][0])
+        self.assertEqual([206] * 5, self.server.responses['/big.csv'][1:])
+
+        # A segment response that ends early, without an error, is retried, and fails when the retries run out
+        self.server.responses.clear()
+        self.cache.remove(d.cache_path(url))
+        self.server.shorts['/big.csv'] = 1
+
+        check(d.download(d_url(url, d)))
+        self.assertEqual([206] * 5, self.server.responses['/big.csv'][1:])
+
+        self.cache.remove(d.cache_path(url))
+        self.server.shorts['/big.csv'] = 10
+
+        with self.assertRaises(DownloadError):
+            Downloader(cache=self.cache, retries=1, backoff_factor=0.01, segments=4,
+                       min_segment_size=200000).download(d_url(url, d))
+
+        self.server.shorts.clear()
+
+    def test_publish(self):
+        import os
+        from fs.memoryfs import MemoryFS
+        from rowgenerators.appurl.util import publish_file, publish_cache_file
+
+        path = os.path.join(self.tmp.name, 'published.txt')
+
+        with publish_file(path) as f:
+            f.write(b'first')
+
+        # A failed write doesn't change the file, and doesn't leave a temporary file
+        with self.assertRaises(ZeroDivisionError):
+            with publish_file(path) as f:
+                f.write(b'second')
+                1 / 0
+
+        with open(path, 'rb') as f:
+            self.assertEqual(b'first', f.read())
+
+        self.assertEqual(['cache', 'published.txt', 'src'], sorted(os.listdir(self.tmp.name)))
+
+        for cache in (self.cache, MemoryFS()):
+            with publish_cache_file(cache, 'a.txt', 'w') as f:
+                f.write('first')
+
+            with self.assertRaises(ZeroDivisionError):
+                with publish_cache_file(cache, 'a.txt', 'w') as f:
+                    f.write('second')
+                    1 / 0
+
+            self.assertEqual('first', cache.readtext('a.txt'))
+            self.assertEqual(['a.txt'], [e for e in cache.listdir('/') if e.startswith('a.txt')])
+
+    def test_verify(self):
+        import os
+        from rowgenerators.appurl.web.download import Downloader
+        from rowgenerators.exceptions import DownloadError
+
+        data = self.write('data.csv', 1000)
+        url = self.server.url('data.csv')
+
+        d = Downloader(cache=self.cache)
+        r = d.download(d_url(url, d))
+
+        # A truncated file, like one left by an older version that crashed, is downloaded again
+        with open(r.sys_path, 'wb') as f:
+            f.write(data[:500])
+
+        r = d.download(d_url(url, d))
+        self.assertEqual(2, self.server.requests['/data.csv'])
+        with open(r.sys_path, 'rb') as f:
+            self.assertEqual(data, f.read())
+
+        # Changes that keep the size are only found by checking the hash
+        with open(r.sys_path, 'r+b') as f:
+            f.write(b'XXXX')
+
+        d.download(d_url(url, d))
+        self.assertEqual(2, self.server.requests['/data.csv'])
+
+        d = Downloader(cache=self.cache, verify_hash=True)
+        r = d.download(d_url(url, d))
+        self.assertEqual(3, self.server.requests['/data.csv'])
+        with open(r.sys_path, 'rb') as f:
+            self.assertEqual(data, f.read())
+
+        # A failed download leaves the old file in place
+        self.server.failures['/data.csv'] = 10
+
+        with self.assertRaises(DownloadError):
+            Downloader(cache=self.cache, use_cache=False, retries=0).download(d_url(url, d))
+
+        with open(r.sys_path, 'rb') as f:
+            self.assertEqual(data, f.read())
+
+        self.assertEqual([], [e for e in os.listdir(os.path.dirname(r.sys_path)) if e.endswith('.tmp')])
+
+    def test_cache_index(self):
+        import os
+        from rowgenerators.appurl.cache_index import CacheIndex, INDEX_NAME
+        from rowgenerators.appurl.util import clean_cache
+        from rowgenerators.appurl.web.download import Downloader
+
+        names = ['file-{}.csv'.format(i) for i in range(6)]
+
+        for n in names:
+            self.write(n, 1000)
+
+        d = Downloader(cache=self.cache)
+
+        paths = [d.download(d_url(self.server.url(n), d)).cache_path for n in names[:5]]
+
+        self.assertEqual({'entries': 5, 'bytes': 5000}, {k: v for k, v in d.index.stats().items()
+                                                         if k in ('entries', 'bytes')})
+        self.assertEqual(self.server.url('file-0.csv'), d.index.get(paths[0])['url'])
+
+        d.download(d_url(self.server.url('file-0.csv'), d))
+        self.assertEqual(1, d.index.get(paths[0])['hits'])
+
+        # Downloading past the budget evicts the least recently used files
+        d = Downloader(cache=self.cache, max_cache_bytes=3500)
+        paths.append(d.download(d_url(self.server.url('file-5.csv'), d)).cache_path)
+
+        self.assertEqual(3000, d.index.stats()['bytes'])
+
+        for p in paths[1:4]:
+            self.assertFalse(self.cache.exists(p))
+            self.assertFalse(self.cache.exists(p + '.meta'))
+            self.assertIsNone(d.index.get(p))
+
+        for p in (paths[0], paths[4], paths[5]):
+            self.assertTrue(self.cache.exists(p))
+
+        # LFU keeps the file that was used the most
+        evicted = d.index.evict(max_entries=1, policy='lfu')
+        self.assertEqual({paths[4], paths[5]}, {p for p, _ in evicted})
+        self.assertTrue(self.cache.exists(paths[0]))
+
+        # A cache without an index is indexed by walking it, the first time it is cleaned
+        for e in os.listdir(self.cache_dir):
+            if e.startswith(INDEX_NAME):
+                os.remove(os.path.join(self.cache_dir, e))
+
+        self.assertEqual([], clean_cache(self.cache))
+        self.assertEqual(1, CacheIndex(self.cache).stats()['entries'])
+
+        self.assertEqual([paths[0]], [p for p, _ in clean_cache(self.cache, max_age=0)])
+        self.assertFalse(self.cache.exists(paths[0]))
+
+        # Files written to the cache without a Downloader are cleaned by their modification times
+        self.cache.makedirs('other', recreate=True)
+        self.cache.writebytes('other/new.csv', b'x' * 100)
+        self.cache.writebytes('other/old.csv', b'x' * 100)
+        t = os.path.getmtime(self.cache.getsyspath('other/old.csv')) - 2 * 60 * 60 * 24
+        os.utime(self.cache.getsyspath('other/old.csv'), (t, t))
+
+        self.assertEqual(['other/old.csv'], [p for p, _ in clean_cache(self.cache)])
+        self.assertEqual(['other/new.csv'], [p for p, _ in clean_cache(self.cache, max_entries=0)])
@@ -6,35 +6,140 @@
 from os.path import basename, join
 from urllib.parse import unquote
 
-from .util import file_ext, parse_url_to_dict, unparse_url_dict
+from .util import file_ext, parse_url_to_dict, unparse_url_dict, iter_entry_points, refresh_entry_points
 
-def match_url_classes(u_str, **kwargs):
-    """
-    Return the classes for which the url matches an entry_point specification, sorted by priority
+class UrlClassRegistry(object):
+    """Compiled index of the 'appurl.urls' entry points.
 
-    :param u_str: Url string
-    :param kwargs: arguments passed to Url constructor
-    :return:
+    The entry points are scanned once and grouped by the part of the Url their name matches on, so
+    matching a Url is a few dict lookups rather than a test of every entry point. The classes are only
+    loaded when a Url first matches them.
     """
 
-    from pkg_resources import iter_entry_points
+    def __init__(self, entry_points):
+
+        self._always = []  # '*'
+        self._schemes = {}  # 'scheme:'
+        self._protos = {}  # 'proto+'
+        self._resource_formats = {}  # '.ext'
+        self._target_formats = {}  # '#.ext'
+        self._other = []  # '/regex/' and compound 'a&b' names, tested with Url._match_entry_point
+
+        self._classes = {}  # Loaded classes, by entry point position
+        self._matches = {}  # Sorted classes, by match key
+
+        self.entry_points = list(entry_points)
+
+        for i, ep in enumerate(self.entry_points):
+            name = ep.name
+
+            if '&' in name or (name.startswith("/") and name.endswith("/")):
+                self._other.append((i, ep))
+            elif name == '*':
+                self._always.append((i, ep))
+            elif name.endswith(":"):
+                self._schemes.setdefault(name[:-1], []).append((i, ep))
+            elif name.endswith('+'):
+                self._protos.setdefault(name[:-1], []).append((i, ep))
+            elif name.startswith('.'):
+                self._resource_formats.setdefault(name[1:], []).append((i, ep))
+            elif name.startswith('#.'):
+                self._target_formats.setdefault(name[2:], []).append((i, ep))
+
+    def _load(self, i, ep, u):
+
+        try:
+            return self._classes[i]
+        except KeyError:
+            pass
+
+        try:
+            cls = self._classes[i] = ep.load()
+        except ModuleNotFoundError as e:
+            raise ModuleNotFoundError("Failed to find module for url string '{}', entrypoint: {}"
+                                      .format(u, e))
+
+        return cls
+
+    def match(self, u):
+        """Return the classes for which the Url ``u`` matches an entry point specification,
+        sorted by priority"""
+
+        other = tuple(i for i, ep in self._other if u._match_entry_point(ep.name))
+
+        key = (u.scheme, u.proto, u.resource_format, u.target_format, other)
+
+        try:
+            return self._matches[key]
+        except KeyError:
+            pass
+
+        candidates = (self._always +
+                      self._schemes.get(u.scheme, []) +
+                      self._protos.get(u.proto, []) +
+                      self._resource_formats.get(u.resource_format, []) +
+                      self._target_formats.get(u.target_format, []) +
+                      [(i, ep) for i, ep in self._other if i in other])
+
+        # Sorting on the entry point position first keeps the order of classes with equal
+        # priorities the same as a plain scan of the entry points.
+        classes = [self._load(i, ep, u) for i, ep in sorted(candidates, key=lambda e: e[0])]
 
-    u = Url(str(u_str), downloader=None, **kwargs)
+        classes = self._matches[key] = sorted(classes, key=lambda cls: cls.match_priority)
+
+        return classes
+
+
+_url_registry = None
+
+
+def url_registry():
+    """Return the process-wide registry of Url classes, scanning the entry points on first use"""
+
+    global _url_registry
+
+    if _url_registry is None:
+        _url_registry = UrlClassRegistry(iter_entry_points(group='appurl.urls'))
+
+    return _url_registry
+
+
+def refresh_registry():
+    """Rescan the entry points and rebuild the Url class registry. Call this after installing
+    a package that registers new Url classes in a running process. """
+
+    global _url_registry
+
+    refresh_entry_points()
+
+    _url_registry = UrlClassRegistry(iter_entry_points(group='appurl.urls'))
+
+    return _url_registry
+
+
+def _matching_url(u_str, **kwargs):
+    """Return a generic Url for matching a url string against the registered classes"""
 
     try:
-        classes = []
+        return Url(str(u_str), downloader=None, **kwargs)
+    except ValueError:
+        # The fragment isn't a segment and query, as in SQL urls, which have a query in the
+        # fragment. Those classes match on the rest of the URL and parse the fragment themselves
+        return Url(str(u_str).split('#', 1)[0], downloader=None, **kwargs)
 
-        for ep in iter_entry_points(group='appurl.urls'):
-            if u._match_entry_point(ep.name):
-                classes.append(ep.load())
 
-        classes = sorted(classes, key=lambda cls: cls.match_priority)
+def match_url_classes(u_str, **kwargs):
+    """
+    Return the classes for which the url matches an entry_point specification, sorted by priority
+
+    :param u_str: Url string
+    :param kwargs: arguments passed to Url constructor
+    :return:
+    """
 
-    except ModuleNotFoundError as e:
-        raise ModuleNotFoundError("Failed to find module for url string '{}', entrypoint: "
-                                  .format(u_str, e))
+    u = _matching_url(u_str, **kwargs)
 
-    return classes
+    return url_registry().match(u)
 
 default_downloader = None
 
@@ -67,11 +172,9 @@ def parse_app_url(u_str, downloader='default', **kwargs):
 
         downloader = default_downloader
 
-    classes = match_url_classes(u_str, **kwargs)
-
-    u = Url(str(u_str), downloader=None, **kwargs)
+    u = _matching_url(u_str, **kwargs)
 
-    for cls in classes:
+    for cls in url_registry().match(u):
         if cls._match(u):
             return cls(str(u_str) if u_str else None, downloader=downloader, **kwargs)
 
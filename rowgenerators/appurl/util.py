@@ -4,8 +4,41 @@
 
 """ """
 
+from contextlib import contextmanager
+from functools import lru_cache
 
 
+@lru_cache()
+def _entry_point_index():
+    """Read the entry points of all installed distributions, once, into a dict of tuples, by group"""
+    import sys
+
+    if sys.version_info >= (3, 10):
+        from importlib.metadata import entry_points
+    else:
+        from importlib_metadata import entry_points
+
+    eps = entry_points()
+
+    return {group: tuple(eps.select(group=group)) for group in eps.groups}
+
+
+def iter_entry_points(group):
+    """Iterate over the entry points registered for a group. Uses importlib.metadata rather than
+    pkg_resources, which is very slow to import, and caches the entry points of all distributions
+    on first use. """
+
+    return iter(_entry_point_index().get(group, ()))
+
+
+def refresh_entry_points():
+    """Clear the cached entry points, so the next call to iter_entry_points() will see
+    distributions installed since the last scan. """
+    import importlib
+
+    importlib.invalidate_caches()
+    _entry_point_index.cache_clear()
+
 
 def path2url(path):
     "Convert a pathname to a file URL"
@@ -333,6 +366,88 @@ def copy_file_or_flo(input_, output, buffer_size=64 * 1024, cb=None):
 
 DEFAULT_CACHE_NAME = 'rowgen-cache'
 
+def _fsync_path(path):
+    """Flush a file, or a directory entry, to disk"""
+    import os
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # Windows can't open directories
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def publish_path(cache, tmp_path, path):
+    """Move a completed temporary file into place in a cache. For caches on disk, the file is synced to
+    disk, then renamed over the destination, which is atomic, so readers see either the old file or the whole new
+    one, even if the process crashes. """
+    import os
+    from fs.errors import NoSysPath
+
+    try:
+        tmp_sys_path = cache.getsyspath(tmp_path)
+        sys_path = cache.getsyspath(path)
+    except NoSysPath:
+        cache.move(tmp_path, path, overwrite=True)
+        return
+
+    _fsync_path(tmp_sys_path)
+    os.replace(tmp_sys_path, sys_path)
+    _fsync_path(os.path.dirname(sys_path))
+
+
+def _tmp_name(path):
+    import os
+    import uuid
+
+    return '{}.{}.{}.tmp'.format(path, os.getpid(), uuid.uuid4().hex[:8])
+
+
+@contextmanager
+def publish_cache_file(cache, path, mode='wb'):
+    """Open a temporary file for writing a file in a pyfilesystem cache, and publish it to ``path`` with
+    publish_path() when the block exits. If the block raises, the temporary file is removed, and ``path`` is not
+    changed. """
+
+    tmp_path = _tmp_name(path)
+
+    try:
+        with cache.open(tmp_path, mode) as f:
+            yield f
+
+        publish_path(cache, tmp_path, path)
+    finally:
+        if cache.exists(tmp_path):
+            cache.remove(tmp_path)
+
+
+@contextmanager
+def publish_file(path, mode='wb'):
+    """Like publish_cache_file(), for a file system path"""
+    import os
+
+    path = str(path)
+    tmp_path = _tmp_name(path)
+
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, path)
+        _fsync_path(os.path.dirname(os.path.abspath(path)))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
 def get_cache_name(cache_name=None):
     cn = cache_name or DEFAULT_CACHE_NAME
 
@@ -382,25 +497,27 @@ def get_cache(cache_name=None, clean=False):
     return r
 
 
-def clean_cache(cache = None, cache_name=None):
-    """Delete items in the cache older than 24 hours"""
-    import datetime
+def clean_cache(cache=None, cache_name=None, max_age=60 * 60 * 24, max_bytes=None, max_entries=None, policy='lru'):
+    """Delete files in the cache that have not been used in max_age seconds, 24 hours by default, then the least
+    recently used, or, with policy='lfu', least frequently used, files until the cache is within max_bytes and
+    max_entries. This works from the cache index, but first walks the cache to add files that aren't in the index,
+    by their modification times, so files written without going through a Downloader are cleaned too.
+    Returns a list of the (path, size) of the deleted files. """
+    from rowgenerators.appurl.cache_index import CacheIndex
 
     cache = cache if cache else get_cache( get_cache_name(cache_name))
 
-    ignores = ['index.json', 'index.json.bak']
+    index = CacheIndex(cache)
 
-    for step in cache.walk.info():
-        details = cache.getdetails(step[0])
-        mod = details.modified
-        now = datetime.datetime.now(tz=mod.tzinfo)
-        age = (now - mod).total_seconds()
-        if age > (60 * 60 * 24) and details.is_file:
-            if step[0] not in ignores:
-                cache.remove(step[0])
+    if index.created:
+        index.rebuild()
+    else:
+        index.add_unindexed()
+
+    return index.evict(max_bytes=max_bytes, max_entries=max_entries, max_age=max_age, policy=policy)
 
 def nuke_cache(cache = None, cache_name=None):
-    """Delete Everythong in the cache"""
+    """Delete Everythong in the cache, including the cache index"""
 
     cache = cache if cache else get_cache(get_cache_name(cache_name))
 
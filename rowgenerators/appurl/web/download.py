@@ -44,6 +44,25 @@ def default_downloader_callback(msg_type, message, read_len, total_len):
     pass
 
 
+class _HashingWriter(object):
+    """Wrap a file to count and hash the bytes written to it"""
+
+    def __init__(self, f=None):
+        import hashlib
+
+        self.f = f
+        self.hash = hashlib.sha256()
+        self.length = 0
+
+    def update(self, b):
+        self.hash.update(b)
+        self.length += len(b)
+
+    def write(self, b):
+        self.update(b)
+        return self.f.write(b)
+
+
 class Downloader(object):
     """Downloader objects handle downloading resrouces from the web, including authorization,
     and storing the downloaded object in a cache. Since they are the primary interface to the file cache,
@@ -54,19 +73,38 @@ class Downloader(object):
     singleton = None
 
     def __init__(self, cache=None, account_accessor=None, logger=None,
-                 working_dir='', callback=None, use_cache=True):
+                 working_dir='', callback=None, use_cache=True, timeout=(10, 60), retries=3, backoff_factor=0.5,
+                 pool_maxsize=16, ttl=None, segments=1, min_segment_size=64 * 1024 * 1024, verify_hash=False,
+                 max_cache_bytes=None, max_cache_entries=None, eviction_policy='lru'):
         """
         Download and cache files, via HTTP and FTP, with retry and decompression.
 
+        HTTP requests go through a pooled session, so connections to a host are kept alive and reused, and
+        transient failures, connection errors and 429 and 5xx responses, are retried with exponential backoff.
+
         :param self:
         :param cache: A PyFs filesystem object for caching files
         :param account_accessor: An objevct for acessing account credentials. Not currently used.
         :param logger: Logging object to write debug logs to
         :param working_dir:
         :param callback: Call back to call with progress reports during downloads.
+        :param timeout: HTTP timeout in seconds, or a (connect, read) tuple
+        :param retries: Number of times to retry a failed HTTP request
+        :param backoff_factor: Retries wait backoff_factor * 2 ** (retry number - 1) seconds
+        :param pool_maxsize: Maximum number of connections to keep for each host
+        :param ttl: How long, in seconds, a cached file is used before it is revalidated with the server. None,
+            the default, never revalidates. May be a dict of host names to TTLs, with a '*' key for other hosts.
+        :param segments: If more than 1, large HTTP files are fetched in up to this many concurrent ranges
+        :param min_segment_size: Minimum size of a range, so files smaller than twice this are not split.
+        :param verify_hash: If True, check the sha256 of cached files, as well as the size, before using them.
+        :param max_cache_bytes: If set, after each download, evict files from the cache to keep it under this size
+        :param max_cache_entries: If set, evict files to keep the cache under this number of files
+        :param eviction_policy: 'lru' or 'lfu'. See CacheIndex.evict()
         :return:
         """
 
+        from threading import Lock
+
         self._cache = cache
         self.account_acessor = account_accessor
         self.logger = logger
@@ -75,6 +113,23 @@ class Downloader(object):
 
         self.use_cache = use_cache # Set to false to ignore cache
 
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_maxsize = pool_maxsize
+        self.ttl = ttl
+        self.segments = segments
+        self.min_segment_size = min_segment_size
+        self.verify_hash = verify_hash
+        self.max_cache_bytes = max_cache_bytes
+        self.max_cache_entries = max_cache_entries
+        self.eviction_policy = eviction_policy
+
+        self._index = None
+
+        self._session = None
+        self._session_lock = Lock()
+
         # For debugging singletonness
         #from metapack.util import dump_stack
         #print('======')
@@ -115,6 +170,39 @@ class Downloader(object):
 
 
 
+    @property
+    def session(self):
+        """A requests Session, created on first use, with a connection pool and retries"""
+
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                retry = Retry(total=self.retries, backoff_factor=self.backoff_factor,
+                              status_forcelist=(429, 500, 502, 503, 504), allowed_methods=('GET', 'HEAD'),
+                              raise_on_status=False)
+
+                adapter = HTTPAdapter(pool_connections=self.pool_maxsize, pool_maxsize=self.pool_maxsize,
+                                      max_retries=retry)
+
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+
+                self._session = session
+
+            return self._session
+
+    def close(self):
+        """Close the pooled HTTP connections"""
+
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
     @property
     def cache(self):
         if not self._cache:
@@ -124,10 +212,31 @@ class Downloader(object):
 
         return self._cache
 
+    @property
+    def index(self):
+        """The CacheIndex for the cache"""
+        from rowgenerators.appurl.cache_index import CacheIndex
+
+        with self._session_lock:
+            if self._index is None or self._index.cache is not self.cache:
+                self._index = CacheIndex(self.cache)
+
+            return self._index
+
+    def _update_index(self, method, *args, **kwargs):
+        """Call a CacheIndex method. The index is only for eviction, so downloads don't fail if it can't be
+        updated"""
+        import sqlite3
+
+        try:
+            return getattr(self.index, method)(*args, **kwargs)
+        except sqlite3.Error as e:
+            logger.warning("Failed to update cache index: {}".format(e))
+
     def get_resource(url):
         pass
 
-    def download(self, url):
+    def download(self, url, callback=None):
         from os.path import abspath, join
         from genericpath import exists
 
@@ -166,12 +275,12 @@ class Downloader(object):
         else:
             # Not a local file, so actually need to download it.
             try:
-                r.cache_path, r.download_time = self._download_with_lock(url.resource_url)
+                r.cache_path, r.download_time = self._download_with_lock(url.resource_url, callback)
             except AccessError as e:
                 # Try again, using a URL that we may have configured an account for. This is
                 # primarily S3 urls, with Boto or AWS credential
                 try:
-                    r.cache_path, r.download_time = self._download_with_lock(url.auth_resource_url)
+                    r.cache_path, r.download_time = self._download_with_lock(url.auth_resource_url, callback)
                 except AttributeError as e:
                     raise e
                 except DownloadError as e:
@@ -183,6 +292,76 @@ class Downloader(object):
 
         return r
 
+    def prefetch(self, urls, max_workers=8):
+        """Download many URLs concurrently into the cache, in a thread pool.
+
+        URLs may be Url objects or strings. URLs that map to the same cache path are only downloaded once,
+        and each download holds the same per-file lock as download(), so concurrent processes don't download the
+        same file twice. Local files are not copied.
+
+        Progress is reported through the callback. Each download reports as it does in download(), and after
+        each URL completes, there is a 'prefetch' message, with the number of URLs completed and the total.
+        'prefetch read' messages report the total bytes read by all of the downloads. Calls to the callback are
+        serialized.
+
+        :param urls: An iterable of Url objects or URL strings
+        :param max_workers: Number of concurrent downloads.
+        :return: A dict of the URL strings to Resource objects
+        :raises DownloadError: If any of the downloads fail, after all of the others complete.
+        """
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        from threading import Lock
+
+        from rowgenerators.appurl.url import parse_app_url
+        from rowgenerators.exceptions import DownloadError
+
+        urls = [u if not isinstance(u, str) else parse_app_url(u, downloader=self) for u in urls]
+
+        # Dedupe on the cache path. Local files don't have one, so they dedupe on their path
+        by_key = {}
+
+        for u in urls:
+            key = self.cache_path(u.resource_url) if u.scheme != 'file' else ('file', str(u.path))
+            by_key.setdefault(key, []).append(u)
+
+        cb_lock = Lock()
+        bytes_read = [0]
+
+        def callback(msg_type, message, read_len=-1, total_len=-1):
+            with cb_lock:
+                self.callback(msg_type, message, read_len, total_len)
+
+                if msg_type in ('copy', 'ftp read') and read_len > 0:
+                    bytes_read[0] += read_len
+                    self.callback('prefetch read', message, bytes_read[0], -1)
+
+        results = {}
+        errors = {}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.download, group[0], callback=callback): group
+                       for group in by_key.values()}
+
+            for i, f in enumerate(as_completed(futures), 1):
+                group = futures[f]
+
+                try:
+                    r = f.result()
+                    for u in group:
+                        results[str(u)] = r
+                except Exception as e:
+                    for u in group:
+                        errors[str(u)] = e
+
+                callback('prefetch', str(group[0]), i, len(futures))
+
+        if errors:
+            raise DownloadError("Failed to prefetch {} of {} urls: \n{}"
+                                .format(len(errors), len(urls),
+                                        '\n'.join('{}: {}'.format(k, v) for k, v in errors.items())))
+
+        return results
+
     def cache_path(self, url):
         import hashlib
         from urllib.parse import urlparse
@@ -214,11 +393,78 @@ class Downloader(object):
 
         return cache_path
 
-    def _download_with_lock(self, url):
+    @staticmethod
+    def meta_path(cache_path):
+        """Path of the metadata sidecar for a cached file"""
+        return cache_path + '.meta'
+
+    def read_meta(self, cache_path):
+        """Return the metadata for a cached file, or an empty dict if there is none. The metadata records the
+        url, the etag, last_modified and length from the response, the sha256 of the file, and the times the
+        file was fetched and last validated with the server. """
+        import json
+
+        try:
+            with self.cache.open(self.meta_path(cache_path), 'r') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def write_meta(self, cache_path, meta):
+        import json
+        from rowgenerators.appurl.util import publish_cache_file
+
+        with publish_cache_file(self.cache, self.meta_path(cache_path), 'w') as f:
+            json.dump(meta, f)
+
+    def verify(self, cache_path, meta):
+        """Return True if a cached file matches the length, and, if verify_hash is set, the sha256 in its
+        metadata. Files without metadata can't be checked, so they are assumed to be good. """
+        import hashlib
+        import functools
+
+        if 'length' in meta and self.cache.getsize(cache_path) != meta['length']:
+            return False
+
+        if self.verify_hash and 'sha256' in meta:
+            h = hashlib.sha256()
+
+            with self.cache.open(cache_path, 'rb') as f:
+                for b in iter(functools.partial(f.read, 1024 * 1024), b''):
+                    h.update(b)
+
+            return h.hexdigest() == meta['sha256']
+
+        return True
+
+    def host_ttl(self, url):
+        """Return the TTL for the host of a URL"""
+        from urllib.parse import urlparse
+
+        if not isinstance(self.ttl, dict):
+            return self.ttl
+
+        host = urlparse(url).hostname
+
+        return self.ttl.get(host, self.ttl.get('*'))
+
+    def is_fresh(self, url, meta):
+        """Return True if a cached file can be used without revalidating it"""
+        import time
+
+        ttl = self.host_ttl(url)
+
+        if ttl is None:
+            return True
+
+        return time.time() - meta.get('validated', 0) < ttl
+
+    def _download_with_lock(self, url, callback=None):
         """
         Download a URL and store it in the cache.
 
         :param url:
+        :param callback: A progress callback to use instead of the downloader's
         :param cache_fs:
         :param account_accessor: callable of one argument (url) returning dict with credentials.
         :param clean: Remove files from cache and re-download
@@ -231,7 +477,7 @@ class Downloader(object):
         from os.path import join
         import time
 
-        from fs.errors import DirectoryExpected, NoSysPath, ResourceInvalid, DirectoryExists
+        from fs.errors import DirectoryExpected, NoSysPath, ResourceInvalid, DirectoryExists, ResourceNotFound
         from requests import HTTPError
         from rowgenerators.exceptions import AccessError, DownloadError
 
@@ -272,60 +518,81 @@ class Downloader(object):
             # mem: caches, and others, don't have sys paths.
             # FIXME should check for MP operation and raise if there would be
             # contention. Mem  caches are only for testing with single processes
-            lock = _NoOpFileLock()
+            lock = _NoOpFileLock(cache_path)
 
         with lock:
+            meta = {}
+
             if self.cache.exists(cache_path):
-                # Rather than ignoring the cache when use_cache is False, we
-                # delete the file and re-download it, because if you ignore the cached file,
-                # you still have to download the resource to a file somewhere.
-                if self.use_cache:
+                meta = self.read_meta(cache_path)
+
+                if not self.verify(cache_path, meta):
+                    logger.warning(f"Cached file {cache_path} doesn't match its metadata; deleting")
+                    meta = {}
+
+                    for p in (cache_path, self.meta_path(cache_path)):
+                        try:
+                            self.cache.remove(p)
+                        except (ResourceInvalid, ResourceNotFound):
+                            pass  # Well, we tried.
+
+                    self._update_index('remove', cache_path)
+
+                elif self.use_cache and self.is_fresh(url, meta):
                     logger.debug(f"Found {cache_path} in cache, and cache is active")
+                    self._update_index('touch', cache_path)
                     return cache_path, None
-                else:
-                    logger.debug(f"File {cache_path} is not in cache")
-                    try:
-                        logger.debug(f"Found {cache_path} in cache, but cache not active; deleting")
-                        self.cache.remove(cache_path)
-                    except ResourceInvalid:
-                        pass  # Well, we tried.
+
+                # When the cache is not active, or the file is stale, HTTP files with validators are revalidated
+                # with a conditional GET. Other files are downloaded again. The new file replaces the old one
+                # when it is complete, so if the download fails, the old one is still there.
+                elif not (url.startswith('http') and (meta.get('etag') or meta.get('last_modified'))):
+                    logger.debug(f"Found {cache_path} in cache, but cache not active or stale; downloading again")
+                    meta = {}
 
             try:
-                self._download(url, cache_path)
+                new_meta = self._download(url, cache_path, callback, meta)
+
+                now = time.time()
+
+                if new_meta is None:  # Not modified, so the cached file is current
+                    meta['validated'] = now
+                    self.write_meta(cache_path, meta)
+                    self._update_index('touch', cache_path)
+                    return cache_path, None
+
+                new_meta.update({'url': url, 'fetched': now, 'validated': now})
+                self.write_meta(cache_path, new_meta)
 
-                return cache_path, time.time()
+                self._update_index('record', cache_path, url, new_meta['length'])
 
+                if self.max_cache_bytes is not None or self.max_cache_entries is not None:
+                    self._update_index('evict', max_bytes=self.max_cache_bytes, max_entries=self.max_cache_entries,
+                                       policy=self.eviction_policy, exclude=(cache_path,))
+
+                return cache_path, now
+
+            # Files are written to temporary names and renamed into place when they are complete, so a failed
+            # download, even one killed by a signal, never leaves a partial file at the cache path.
             except HTTPError as e:
                 if e.response.status_code == 403:
                     raise AccessError("Access error on download: {}".format(e))
                 else:
                     raise DownloadError("Failed to download: {}".format(e))
 
-            except (KeyboardInterrupt, Exception):
-                # This is really important -- its really bad to have partly downloaded
-                # files being confused with fully downloaded ones.
-                # FIXME. Should also handle signals. deleting partly downloaded files is important.
-                # Maybe should have a sentinel file, or download to another name and move the
-                # file after done.
-                if self.cache.exists(cache_path):
-                    self.cache.remove(cache_path)
-
-                raise
-
         assert False, 'Should never get here'
 
-    def _download(self, url, cache_path):
-        import requests
-        import functools
-        from urllib.request import urlopen
-
-        from requests.exceptions import SSLError
-
-        from rowgenerators.appurl.util import parse_url_to_dict, copy_file_or_flo
+    def _download(self, url, cache_path, callback=None, meta=None):
+        """Download a URL to a cache path. If ``meta`` has the etag or last_modified of the cached file, HTTP
+        requests are conditional, and if the server returns 304, the file is not changed and None is returned.
+        Otherwise, return the metadata for the new file """
+        from rowgenerators.appurl.util import parse_url_to_dict, publish_cache_file
         from rowgenerators.exceptions import DownloadError
         from ftplib import FTP
 
-        self.callback('download', url)
+        callback = callback or self.callback
+
+        callback('download', url)
 
         if url.startswith('s3:'):
 
@@ -334,8 +601,9 @@ class Downloader(object):
             s3url = parse_app_url(url)
 
             try:
-                with self.cache.open(cache_path, 'wb') as f:
-                    s3url.object.download_fileobj(f)
+                with publish_cache_file(self.cache, cache_path) as f:
+                    hw = _HashingWriter(f)
+                    s3url.object.download_fileobj(hw)
             except Exception as e:
                 raise DownloadError("Failed to fetch S3 url '{}': {}".format(url, e))
 
@@ -346,16 +614,18 @@ class Downloader(object):
             u = parse_url_to_dict(url)
 
             try:
-                with FTP(u['netloc']) as ftp, self.cache.open(cache_path, 'wb') as fout:
+                with FTP(u['netloc']) as ftp, publish_cache_file(self.cache, cache_path) as f:
+
+                    hw = _HashingWriter(f)
 
                     total_len = [0]
 
                     def _read(d):
-                        fout.write(d)
+                        hw.write(d)
 
                         total_len[0] = total_len[0] + len(d)
 
-                        self.callback('ftp read', url, len(d), total_len[0])
+                        callback('ftp read', url, len(d), total_len[0])
 
                     ftp.login()
                     ftp.retrbinary('RETR ' + u['path'], _read)
@@ -364,20 +634,134 @@ class Downloader(object):
                 raise DownloadError("Failed to get FTP url '{}': {} ".format(url, e))
 
         else:
+            return self._download_http(url, cache_path, callback, meta or {})
 
-            logger.debug("Request " + str(url))
+        return {'length': hw.length, 'sha256': hw.hash.hexdigest()}
+
+    @staticmethod
+    def _resource_length(r):
+        """Return the length of the whole resource from a 200 or 206 response, or None if it isn't known"""
+
+        if r.status_code == 206:
+            total = r.headers.get('Content-Range', '').rpartition('/')[2]
+        else:
+            total = r.headers.get('Content-Length')
+
+        try:
+            return int(total)
+        except (TypeError, ValueError):
+            return None
+
+    def _remove_part(self, part_path):
+        """Delete a .part file and its metadata"""
+
+        for p in (part_path, self.meta_path(part_path)):
+            if self.cache.exists(p):
+                self.cache.remove(p)
+
+    def _download_http(self, url, cache_path, callback, meta):
+        """Download an HTTP URL to a .part file beside the cache path, then move it into place.
+
+        If the connection drops part way, the download is resumed with a Range request, and an If-Range header,
+        so the server sends the whole file again if it has changed. A .part file left by an earlier failed
+        download is resumed the same way. If ``segments`` is more than 1, large files are fetched in
+        concurrent ranges.
+
+        Returns None if the server returned 304 for a conditional request, or the metadata for the new file.
+        """
+        import functools
+        import time
+        import requests
+        from requests.exceptions import SSLError
+        from urllib3.exceptions import HTTPError as Urllib3HTTPError
+
+        from rowgenerators.appurl.util import copy_file_or_flo, publish_path
+        from rowgenerators.exceptions import DownloadError
+
+        part_path = cache_path + '.part'
+
+        # We can only resume a .part file if we know which version of the resource it holds
+        part_meta = self.read_meta(part_path) if self.cache.exists(part_path) else {}
+        validator = part_meta.get('etag') or part_meta.get('last_modified')
+        offset = self.cache.getsize(part_path) if validator else 0
+
+        resumed = bool(offset)  # Continuing a .part file from an earlier download
+
+        hw = None
+        segmented = False
+        failures = 0
+
+        while True:
+            headers = {}
+
+            if offset:
+                headers['Range'] = 'bytes={}-'.format(offset)
+                headers['If-Range'] = validator
+            else:
+                if meta.get('etag'):
+                    headers['If-None-Match'] = meta['etag']
+
+                if meta.get('last_modified'):
+                    headers['If-Modified-Since'] = meta['last_modified']
+
+            logger.debug("Request {} {}".format(url, headers))
 
             try:
-                r = requests.get(url, stream=True)
+                r = self.session.get(url, stream=True, timeout=self.timeout, headers=headers)
+
+                if r.status_code == 416 and offset and not hw:
+                    # The .part file from an earlier download is already complete, or longer than the resource.
+                    # It can't be trusted, so start again
+                    r.close()
+                    self._remove_part(part_path)
+                    return self._download_http(url, cache_path, callback, meta)
+
                 r.raise_for_status()
-            except SSLError as e:
+            except (SSLError, requests.ConnectionError, requests.Timeout) as e:
                 raise DownloadError("Failed to GET {}: {} ".format(url, e))
 
-            if r.status_code>=300:
-                if r.status_code>=304:
-                    raise DownloadError("Server Returned 304: Not Modified");
-                else:
-                    raise DownloadError("Can't handle server response, {r.status_code}");
+            if r.status_code == 304:
+                r.close()
+                callback('not modified', url)
+                return None
+
+            if r.status_code not in (200, 206):
+                r.close()
+                raise DownloadError(f"Can't handle server response, {r.status_code}")
+
+            logger.debug(f"Response code={r.status_code} {r.headers}")
+
+            length = self._resource_length(r)
+
+            # Ranges are offsets into the encoded content, so decoded responses can't be resumed
+            encoded = r.headers.get('content-encoding', 'identity') != 'identity'
+
+            if r.status_code == 200:
+                # A new download, or the resource changed since the .part file was written
+                offset = 0
+                hw = None
+                part_meta = {'url': url, 'etag': r.headers.get('ETag'),
+                             'last_modified': r.headers.get('Last-Modified')}
+
+                validator = None if encoded else (part_meta['etag'] or part_meta['last_modified'])
+
+                if validator:
+                    self.write_meta(part_path, part_meta)
+
+                if (validator and self.segments > 1 and length and length >= 2 * self.min_segment_size
+                        and r.headers.get('Accept-Ranges') == 'bytes'):
+                    r.close()
+                    self._download_segments(url, part_path, length, validator, callback)
+                    segmented = True
+                    break
+
+            if hw is None:
+                hw = _HashingWriter()
+
+                if offset:  # Resuming a .part file from an earlier download
+                    with self.cache.open(part_path, 'rb') as f:
+                        for b in iter(functools.partial(f.read, 1024 * 1024), b''):
+                            hw.update(b)
 
             # Requests will auto decode gzip responses, but not when streaming. This following
             # monkey patch is recommended by a core developer at
@@ -386,13 +770,136 @@ class Downloader(object):
                 r.raw.read = functools.partial(r.raw.read, decode_content=True)
 
             def copy_cb(message, read_len, total_len):
-                # Message is just the read len
-                self.callback('copy', url, read_len, total_len)
+                callback('copy', url, read_len, hw.length)
+
+            try:
+                with self.cache.open(part_path, 'ab' if offset else 'wb') as f:
+                    hw.f = f
+                    copy_file_or_flo(r.raw, hw, cb=copy_cb)
+                break
+            except (Urllib3HTTPError, requests.RequestException, OSError) as e:
+                failures += 1
+                offset = hw.length
 
-            logger.debug(f"Response code={r.status_code} {r.headers}" )
+                if not validator or failures > self.retries:
+                    raise DownloadError("Failed to download {}, after {} bytes: {}".format(url, offset, e))
 
-            with self.cache.open(cache_path, 'wb') as f:
-                copy_file_or_flo(r.raw, f, cb=copy_cb)
+                logger.debug("Download of {} failed after {} bytes; resuming: {}".format(url, offset, e))
+                callback('resume', url, offset, length or -1)
 
-            assert self.cache.exists(cache_path)
+                time.sleep(self.backoff_factor * 2 ** (failures - 1))
+            finally:
+                # Once the body is read, the connection is back in the pool, so this only closes it if the
+                # copy failed part way.
+                r.close()
 
+        size = self.cache.getsize(part_path)
+
+        if length is not None and not encoded and size != length:
+            self._remove_part(part_path)
+
+            if resumed:  # The earlier .part file was bad, so try once more, from the start
+                return self._download_http(url, cache_path, callback, meta)
+
+            raise DownloadError("Downloaded {} bytes of {} for {}".format(size, length, url))
+
+        if segmented:
+            hw = _HashingWriter()
+            with self.cache.open(part_path, 'rb') as f:
+                for b in iter(functools.partial(f.read, 1024 * 1024), b''):
+                    hw.update(b)
+
+        publish_path(self.cache, part_path, cache_path)
+
+        if self.cache.exists(self.meta_path(part_path)):
+            self.cache.remove(self.meta_path(part_path))
+
+        return {
+            'etag': part_meta.get('etag'),
+            'last_modified': part_meta.get('last_modified'),
+            'length': size,
+            'sha256': hw.hash.hexdigest()
+        }
+
+    def _download_segments(self, url, part_path, length, validator, callback):
+        """Fetch a resource into a .part file in concurrent ranges, each resumed if its connection drops"""
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from threading import Event, Lock
+
+        import requests
+        from urllib3.exceptions import HTTPError as Urllib3HTTPError
+
+        from rowgenerators.exceptions import DownloadError
+
+        n = min(self.segments, length // self.min_segment_size)
+        size = -(-length // n)
+
+        with self.cache.open(part_path, 'wb') as f:
+            f.truncate(length)
+
+        cb_lock = Lock()
+        read = [0]
+        stop = Event()
+
+        def fetch(start, end):
+            pos = start
+            failures = 0
+
+            while pos < end and not stop.is_set():
+                r = None
+                try:
+                    r = self.session.get(url, stream=True, timeout=self.timeout,
+                                         headers={'Range': 'bytes={}-{}'.format(pos, end - 1), 'If-Range': validator})
+                    r.raise_for_status()
+
+                    if r.status_code != 206:
+                        raise DownloadError("Resource changed while downloading segments of {}".format(url))
+
+                    with self.cache.open(part_path, 'r+b') as f:
+                        f.seek(pos)
+
+                        while pos < end and not stop.is_set():
+                            b = r.raw.read(min(64 * 1024, end - pos))
+                            if not b:
+                                # A short body, which is retried like a dropped connection
+                                raise IOError("Response ended before the end of the segment")
+
+                            f.write(b)
+                            pos += len(b)
+
+                            with cb_lock:
+                                read[0] += len(b)
+                                callback('copy', url, len(b), read[0])
+
+                except (Urllib3HTTPError, requests.ConnectionError, requests.Timeout,
+                        requests.exceptions.ChunkedEncodingError, OSError) as e:
+                    failures += 1
+
+                    if failures > self.retries:
+                        raise DownloadError("Failed to download {}, bytes {}-{}: {}".format(url, pos, end - 1, e))
+
+                    with cb_lock:
+                        callback('resume', url, pos, length)
+
+                    time.sleep(self.backoff_factor * 2 ** (failures - 1))
+                finally:
+                    if r is not None:
+                        r.close()
+
+        try:
+            with ThreadPoolExecutor(max_workers=n) as executor:
+                futures = [executor.submit(fetch, start, min(start + size, length))
+                           for start in range(0, length, size)]
+
+                for f in futures:
+                    try:
+                        f.result()
+                    except Exception:
+                        stop.set()
+                        raise
+        except Exception:
+            # The file has holes, so it can't be resumed from its size
+            if self.cache.exists(self.meta_path(part_path)):
+                self.cache.remove(self.meta_path(part_path))
+            raise
@@ -6,15 +6,15 @@ from __future__ import print_function
 import sys
 from itertools import islice
 
-from pkg_resources import iter_entry_points
 from rowgenerators.appurl.enumerate import enumerate_contents
 from rowgenerators.appurl.url import Url
 from rowgenerators.exceptions import SourceError, TextEncodingError
 from rowgenerators.source import Source
 # Change the row cache name
 from rowgenerators.util import get_cache
-from tableintuit import RowIntuiter
-from tabulate import tabulate
+
+# tableintuit, tabulate and the entry points are imported where they are used, because
+# they are slow to import and most runs of the program don't need them.
 
 
 def prt(*args):
@@ -32,6 +32,8 @@ def err(*args):
 
 
 def run_row_intuit(path, cache):
+    from tableintuit import RowIntuiter
+
     for encoding in ('ascii', 'utf8', 'latin1'):
         try:
             rows = list(islice(Source(url=path, encoding=encoding, cache=cache), 5000))
@@ -44,6 +46,7 @@ def run_row_intuit(path, cache):
 
 def rowgen():
     import argparse
+    from tabulate import tabulate
 
     parser = argparse.ArgumentParser(
         prog='rowgen',
@@ -153,6 +156,8 @@ def rowgen():
 
 def listrowgen():
     import argparse
+    from tabulate import tabulate
+    from rowgenerators.appurl.util import iter_entry_points
 
     parser = argparse.ArgumentParser(
         prog='rowgen-generators',
@@ -166,7 +171,7 @@ def listrowgen():
             c = ep.load()
         except Exception as e:
             warn('Error:', ep.name, e)
-        entries.append([ep.name, ep.module_name, c.__name__, ])
+        entries.append([ep.name, ep.module, c.__name__, ])
 
 
     print(tabulate(sorted(entries), ['EP Name', 'Module', 'Class']))
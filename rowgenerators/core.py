@@ -1,4 +1,6 @@
 
+from collections import namedtuple
+
 from . import DEFAULT_EPSG
 
 def geoframe(url):
@@ -8,27 +10,41 @@ def geoframe(url):
 
 
 def dataframe(url,  downloader='default', *args, **kwargs):
-    """Parse an App url and return a Pandas dataframe"""
+    """Parse an App url and return a Pandas dataframe. The ``dtype`` and ``batch_size`` arguments control how
+    the frame is built from the rows; other arguments are passed on to the DataFrame"""
     from . import parse_app_url
-    import pandas as pd
-    from itertools import islice
+    from .source import Source, iter_row_batches
+    from .generator.frame import frame_from_batches
+
+    # These are for building the frame, not for the URL
+    frame_kwargs = {k: kwargs.pop(k) for k in ('dtype', 'batch_size') if kwargs.get(k) is not None}
 
     u = parse_app_url(url, downloader=downloader, **kwargs)
     r = u.get_resource()
     t = r.get_target()
     g = t.generator
 
-    # Try the generator's dataframe method, if it has one
+    # Try the generator's dataframe method, if it has one. Many of them pass their arguments on to a pandas
+    # reader, so batch_size only goes to the ones that take it.
     try:
-        return g.dataframe( *args, **kwargs)
+        f = g.dataframe
     except AttributeError:
         pass
+    else:
+        import inspect
+
+        if 'batch_size' not in inspect.signature(f).parameters:
+            frame_kwargs.pop('batch_size', None)
 
-    # Just normal data, so use the iterator in this object.
-    headers = next(islice(g, 0, 1))
-    data = islice(g, 1, None)
+        return f(*args, **kwargs, **frame_kwargs)
 
-    df = pd.DataFrame(list(data), columns=headers,  *args, **kwargs)
+    # Just normal data, so build the frame from batches of rows from the iterator in this object.
+    df = frame_from_batches(iter_row_batches(g, frame_kwargs.get('batch_size') or Source.default_batch_size),
+                            dtype=frame_kwargs.get('dtype'))
+
+    if args or kwargs:
+        import pandas as pd
+        df = pd.DataFrame(df, *args, **kwargs)
 
     df.metatab_errors = g.errors if hasattr(g, 'errors') and g.errors else {}
 
@@ -135,22 +151,88 @@ def iterator(url, downloader='default', *args, **kwargs):
 
 
 
-def get_generator(source,  **kwargs):
-    """ Locate a generator from the entrypoints.
+class GeneratorRegistry(object):
+    """Index of the 'rowgenerators' entry points, by the name the entry point matches, such as
+    '.csv', 'program+' or '<PythonUrl>'. The classes for a name are loaded and sorted by priority
+    the first time the name is resolved. """
 
-    """
+    def __init__(self, entry_points):
+
+        self._entry_points = {}  # Unloaded entry points, by name
+        self._classes = {}  # Sorted (priority, position, class) entries, by name
+
+        for i, ep in enumerate(entry_points):
+            self._entry_points.setdefault(ep.name, []).append((i, ep))
+
+    def classes(self, name):
+        """Return the (priority, position, class) entries for the generators registered with a name,
+        sorted by priority. The position of the entry point breaks ties, as in a scan of the entry points"""
+
+        try:
+            return self._classes[name]
+        except KeyError:
+            pass
+
+        entries = []
+
+        for i, ep in self._entry_points.get(name, []):
+            cls = ep.load()
+            entries.append((cls.priority, i, cls))
+
+        self._classes[name] = sorted(entries, key=lambda e: e[:2])
+
+        return self._classes[name]
+
+    def resolve(self, names):
+        """Return the (name, priority, class) entries for the generators that match any of the names,
+        best match first"""
+        from heapq import merge
+
+        entries = merge(*[[e + (name,) for e in self.classes(name)] for name in set(names)],
+                        key=lambda e: e[:2])
+
+        return [(name, priority, cls) for priority, i, cls, name in entries]
+
+
+GeneratorResolution = namedtuple('GeneratorResolution', 'ref names candidates')
+
+_generator_registry = None
+
+
+def generator_registry():
+    """Return the process-wide registry of generator classes, scanning the entry points on first use"""
+    from rowgenerators.appurl.util import iter_entry_points
+
+    global _generator_registry
+
+    if _generator_registry is None:
+        _generator_registry = GeneratorRegistry(iter_entry_points(group='rowgenerators'))
+
+    return _generator_registry
+
+
+def refresh_generator_registry():
+    """Rescan the entry points and rebuild the generator registry"""
+    from rowgenerators.appurl.util import iter_entry_points, refresh_entry_points
+
+    global _generator_registry
+
+    refresh_entry_points()
+
+    _generator_registry = GeneratorRegistry(iter_entry_points(group='rowgenerators'))
+
+    return _generator_registry
+
+
+def _generator_names(source):
+    """Return the reference for a source, and the entry point names that the source could match"""
     import inspect
     import collections
-    from pkg_resources import iter_entry_points
     from rowgenerators.exceptions import RowGeneratorError
     from rowgenerators.appurl import parse_app_url, Url
-    from rowgenerators.source import Source
 
     names = []
 
-    if isinstance(source, Source):
-        return source
-
     if isinstance(source, str):
 
         ref = parse_app_url(source).get_resource().get_target()
@@ -211,19 +293,44 @@ def get_generator(source,  **kwargs):
     else:
         raise RowGeneratorError("Unknown arg type for source {}, type='{}'".format(source, type(source)))
 
-    classes = sorted([ep.load() for ep in iter_entry_points(group='rowgenerators') if ep.name in names],
-                     key=lambda cls: cls.priority)
+    return ref, names
+
+
+def resolve_generator(source):
+    """Return a GeneratorResolution, a trace of how a generator is selected for a source: the
+    reference, the entry point names that were tried, and the (name, priority, class) entries
+    that matched, best match first. """
+
+    ref, names = _generator_names(source)
+
+    return GeneratorResolution(ref, names, generator_registry().resolve(names))
 
-    if not classes:
+
+def get_generator(source,  **kwargs):
+    """ Locate a generator from the entrypoints.
+
+    """
+    from rowgenerators.exceptions import RowGeneratorError
+    from rowgenerators.source import Source
+
+    if isinstance(source, Source):
+        return source
+
+    ref, names, candidates = resolve_generator(source)
+
+    if not candidates:
         raise RowGeneratorError(("Can't find generator for url '{}' \ntype={}, proto={}, "
                                   "resource_format={}, target_format={}, names={} ")
                                  .format( source, type(source), ref.proto, ref.resource_format, ref.target_format, names))
+
+    cls = candidates[0][2]
+
     try:
-        return classes[0](ref, **kwargs)
+        return cls(ref, **kwargs)
     except NotImplementedError:
         raise
     except Exception as e:
-        raise RowGeneratorError("Failed to instantiate generator for class '{}', ref '{}'".format(classes[0],
+        raise RowGeneratorError("Failed to instantiate generator for class '{}', ref '{}'".format(cls,
                                                                                                    ref)) from e
 
 class SelectiveRowGenerator(object):
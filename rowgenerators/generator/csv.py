@@ -5,19 +5,65 @@
 
 import sys
 import os
-from rowgenerators.source import Source
+from rowgenerators.source import Source, batch_to_rows
 import warnings
 
+def _set_field_size_limit():
+    import csv
+
+    try:
+        # For: _csv.Error: field larger than field limit (131072)
+        if os.name == 'nt':
+            # Using sys.maxsize throws an Overflow error on Windows 64-bit platforms since internal
+            # representation of 'int'/'long' on Win64 is only 32-bit wide. Ideally limit on Win64
+            # should not exceed ((2**31)-1) as long as internal representation uses 'int' and/or 'long'
+            csv.field_size_limit((2**31)-1)
+        else:
+            csv.field_size_limit(sys.maxsize)
+    except OverflowError as e:
+        # skip setting the limit for now
+        pass
+
+
+def _parse_csv_range(path, start, end, delimiter, encoding, n_cols=None):
+    """Parse the rows in a byte range of a CSV file, returning a list of rows, or, if n_cols is set,
+    a batch with that many columns. Runs in a worker process for CsvSource.iter_parallel()"""
+    import csv
+    import io
+    from rowgenerators.source import rows_to_batch
+
+    _set_field_size_limit()
+
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    rows = list(csv.reader(io.TextIOWrapper(io.BytesIO(data), encoding=encoding), delimiter=delimiter))
+
+    return rows_to_batch(rows, n_cols) if n_cols is not None else rows
+
+
 class CsvSource(Source):
     """Generate rows from a CSV source"""
 
     delimiter = ','
 
-    def __init__(self, ref, cache=None, working_dir=None, env=None, **kwargs):
+    def __init__(self, ref, cache=None, working_dir=None, env=None, batch_size=None, max_workers=None, **kwargs):
+        """
+
+        :param batch_size: If set, iteration reads the file in batches of this many rows
+            with the pandas C parser, through iter_batches(), rather than with csv.reader
+        :param max_workers: If set, iteration and iter_batches() read the file in parallel, with
+            this many processes, through iter_parallel()
+        """
         super().__init__(ref, cache, working_dir, **kwargs)
 
         self.url = ref
 
+        self.batch_size = batch_size
+
+        self.max_workers = max_workers
+
         if not self.url.exists():
             raise FileNotFoundError(self.url)
 
@@ -31,19 +77,20 @@ class CsvSource(Source):
 
         import csv
 
-        try:
-            # For: _csv.Error: field larger than field limit (131072)
-            if os.name == 'nt':
-                # Using sys.maxsize throws an Overflow error on Windows 64-bit platforms since internal
-                # representation of 'int'/'long' on Win64 is only 32-bit wide. Ideally limit on Win64
-                # should not exceed ((2**31)-1) as long as internal representation uses 'int' and/or 'long'
-                csv.field_size_limit((2**31)-1)
-            else:
-                csv.field_size_limit(sys.maxsize) 
-        except OverflowError as e:
-            # skip setting the limit for now
-            pass
-        
+        if self.max_workers:
+            yield from self.iter_parallel(self.max_workers)
+            return
+
+        if self.batch_size:
+            for i, batch in enumerate(self.iter_batches(self.batch_size)):
+                if i == 0:
+                    yield batch  # The header
+                else:
+                    yield from batch_to_rows(batch)
+            return
+
+        _set_field_size_limit()
+
         self.start()
 
         try:
@@ -59,6 +106,119 @@ class CsvSource(Source):
 
         self.finish()
 
+    def iter_batches(self, batch_size=None):
+        """Iterate over the file in column-oriented batches, reading it with the chunked pandas C parser.
+
+        The first item is the header, the first row of the file. Each following item is a batch: a list of
+        NumPy object arrays, one per column, holding the string values of up to ``batch_size`` rows.
+
+        Unlike csv.reader, the C parser skips blank lines, pads short rows with empty strings, and
+        fails on rows that are longer than the first one.
+
+        :param batch_size: Number of rows in a batch.
+        """
+        import csv
+        import pandas as pd
+        from pandas.errors import ParserError, EmptyDataError
+        from rowgenerators.exceptions import RowGeneratorError
+
+        batch_size = int(batch_size or self.batch_size or self.default_batch_size)
+
+        if self.max_workers:
+            yield from self.iter_parallel(self.max_workers, batches=True, batch_size=batch_size)
+            return
+
+        encoding = self.url.encoding or 'utf8'
+
+        with open(self.url.fspath, encoding=encoding, newline='') as f:
+            # Read the header with csv.reader, through readline(), so the file is left at the start of the
+            # first data row, and every batch from the C parser has batch_size rows.
+            try:
+                header = next(csv.reader(iter(f.readline, ''), delimiter=self.delimiter))
+            except StopIteration:
+                return
+
+            self.start()
+
+            yield header
+
+            # The C parser infers the number of columns separately for each chunk, so it
+            # has to be set from the header.
+            try:
+                reader = pd.read_csv(f, sep=self.delimiter, header=None, names=range(len(header)),
+                                     dtype=object, na_filter=False, chunksize=batch_size, engine='c')
+            except EmptyDataError:
+                self.finish()
+                return
+
+            try:
+                with reader:
+                    for chunk in reader:
+                        columns = [chunk[c].to_numpy() for c in chunk.columns]
+
+                        if len(columns[0]):
+                            yield columns
+
+            except ParserError as e:
+                raise RowGeneratorError("Failed to read '{}' in batches; iterate it row by row instead: {}"
+                                        .format(self.url.fspath, e))
+
+        self.finish()
+
+    def iter_parallel(self, max_workers=None, ordered=True, batches=False, chunk_size=None, batch_size=None):
+        """Read the file in parallel, by splitting it into byte ranges that start on record boundaries,
+        outside of quoted fields, and parsing each range with csv.reader in a process pool.
+
+        Yields the header, then the rows, or batches of ``batch_size`` rows. Batches don't span ranges, so the last
+        batch from each range may be short. See rowgenerators.generator.parallel for the restrictions on the file.
+
+        :param max_workers: Number of worker processes. Defaults to the number of CPUs
+        :param ordered: If False, yield the rows of each range as soon as it is parsed, rather than in file order
+        :param batches: If True, yield batches, rather than rows
+        :param chunk_size: Approximate size, in bytes, of each range
+        :param batch_size: Number of rows in a batch
+        """
+        import csv
+        import mmap
+        from .parallel import record_ranges, map_parallel, _find_record_start
+
+        _set_field_size_limit()
+
+        path = str(self.url.fspath)
+        encoding = self.url.encoding or 'utf8'
+
+        with open(path, encoding=encoding) as f:
+            try:
+                header = next(csv.reader(f, delimiter=self.delimiter))
+            except StopIteration:
+                return
+
+        self.start()
+
+        yield header
+
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header_end = _find_record_start(mm, 0, quotechar=b'"')
+
+        ranges = record_ranges(path, header_end, chunk_size, quotechar=b'"', max_workers=max_workers)
+
+        n_cols = len(header) if batches else None
+
+        batch_size = int(batch_size or self.batch_size or self.default_batch_size)
+
+        for result in map_parallel(_parse_csv_range,
+                                   [(path, s, e, self.delimiter, encoding, n_cols) for s, e in ranges],
+                                   max_workers=max_workers, ordered=ordered):
+            if batches:
+                n_rows = len(result[0]) if result else 0
+
+                for i in range(0, n_rows, batch_size):
+                    yield [c[i:i + batch_size] for c in result]
+            else:
+                yield from result
+
+        self.finish()
+
     def finish(self):
         super().finish()
 
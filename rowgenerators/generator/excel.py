@@ -3,11 +3,296 @@
 
 """ """
 
+from contextlib import contextmanager
+
 from rowgenerators.exceptions import RowGeneratorError
 from rowgenerators.source import Source
-from xlrd import open_workbook, XLRDError
 from rowgenerators.util import md5_file
 
+
+class XlsWorkbook(object):
+    """An .xls workbook, opened with xlrd on demand, so sheets are only parsed when they are used"""
+
+    def __init__(self, path):
+        from xlrd import open_workbook, XLRDError
+
+        try:
+            self.wb = open_workbook(filename=str(path), on_demand=True)
+        except XLRDError as e:
+            raise RowGeneratorError("Failed to open Excel workbook: '{}' ".format(e))
+
+        self.closed = False
+
+    @property
+    def sheet_names(self):
+        return self.wb.sheet_names()
+
+    @property
+    def datemode(self):
+        return self.wb.datemode
+
+    def sheet(self, segment):
+        """Return the sheet for a target segment, which may be a sheet number or name"""
+        from xlrd import XLRDError
+
+        try:
+            try:
+                return self.wb.sheet_by_index(int(segment))
+            except (ValueError, IndexError):
+                # ValueError when Segment is the workbook name, not the number
+                # IndexError when the segment is a numeric name, such as a year,
+                # which converted with int(), but is larger than the # of sheets
+                return self.wb.sheet_by_name(segment)
+
+        except XLRDError as e:
+            raise RowGeneratorError("Failed to open Excel workbook: '{}' ".format(e))
+
+    def iter_rows(self, segment):
+        s = self.sheet(segment)
+
+        for i in range(s.nrows):
+            yield s.row_values(i)
+
+    def close(self):
+        self.wb.release_resources()
+        self.closed = True
+
+
+def _xlsx_value(v, epoch):
+    """Convert a cell value from openpyxl to the value xlrd would have returned"""
+    import datetime
+
+    if v is None:
+        return ''
+    elif isinstance(v, (str, float, bool)):
+        return v
+    elif isinstance(v, int):
+        return float(v)
+    elif isinstance(v, (datetime.datetime, datetime.date, datetime.time, datetime.timedelta)):
+        from openpyxl.utils.datetime import to_excel
+        return float(to_excel(v, epoch))
+    else:
+        return v
+
+
+class XlsxWorkbook(object):
+    """An .xlsx workbook, opened with openpyxl in read-only mode, so sheets are streamed, not loaded"""
+
+    def __init__(self, path):
+        from openpyxl import load_workbook
+
+        try:
+            self.wb = load_workbook(str(path), read_only=True, data_only=True)
+        except Exception as e:
+            raise RowGeneratorError("Failed to open Excel workbook: '{}' ".format(e))
+
+        self.closed = False
+
+    @property
+    def sheet_names(self):
+        return self.wb.sheetnames
+
+    @property
+    def datemode(self):
+        from openpyxl.utils.datetime import CALENDAR_MAC_1904
+
+        return 1 if self.wb.epoch == CALENDAR_MAC_1904 else 0
+
+    def sheet(self, segment):
+        """Return the sheet for a target segment, which may be a sheet number or name"""
+
+        try:
+            try:
+                return self.wb.worksheets[int(segment)]
+            except (ValueError, IndexError):
+                return self.wb[segment]
+        except KeyError as e:
+            raise RowGeneratorError("Failed to open Excel workbook: '{}' ".format(e))
+
+    def iter_rows(self, segment):
+        """Yield rows with the same values that xlrd returns: '' for empty cells, floats for numbers and dates.
+        Rows have the width in the sheet's declared dimension, which is read from the start of the sheet, so the
+        sheet is only parsed once. If there is no dimension, each row's trailing empty cells are trimmed as it
+        is read. Trailing empty rows, which are often just formatting, are dropped, as xlrd does. """
+
+        ws = self.sheet(segment)
+
+        width = ws.max_column  # None if the sheet doesn't declare its dimension
+
+        epoch = self.wb.epoch
+
+        empty = 0  # Number of empty rows that haven't been yielded yet
+
+        for row in ws.iter_rows(values_only=True):
+
+            if all(v is None for v in row):
+                empty += 1
+                continue
+
+            for _ in range(empty):
+                yield [''] * (width or 0)
+            empty = 0
+
+            if width is None:
+                end = len(row)
+                while row[end - 1] is None:
+                    end -= 1
+                row = row[:end]
+            else:
+                row = row[:width] + (None,) * (width - len(row))
+
+            yield [_xlsx_value(v, epoch) for v in row]
+
+    def close(self):
+        self.wb.close()
+        self.closed = True
+
+
+def open_workbook(path):
+    """Open an Excel workbook, returning an XlsxWorkbook for Office Open XML files, which are zip archives,
+    or an XlsWorkbook for everything else"""
+
+    with open(str(path), 'rb') as f:
+        magic = f.read(4)
+
+    if magic == b'PK\x03\x04':
+        return XlsxWorkbook(path)
+    else:
+        return XlsWorkbook(path)
+
+
+class _CacheEntry(object):
+    """A workbook in a WorkbookCache, and the number of open() calls that are using it"""
+
+    def __init__(self, wb, size):
+        self.wb = wb
+        self.size = size
+        self.refs = 0
+
+
+class WorkbookCache(object):
+    """A bounded LRU cache of open workbooks, keyed by path, modification time and size, so a workbook that
+    is listed and then read one sheet at a time is only opened once. Changing the file makes a new key.
+
+    The size of each file is used as an estimate of the memory its workbook uses, and the least recently used
+    workbooks are removed when there are more than ``max_workbooks`` of them, or their files total more than
+    ``max_bytes``. A file larger than ``max_bytes`` isn't cached.
+
+    Workbooks are used through open(), which holds a workbook until the with block exits, so a workbook that
+    is removed from the cache while a sheet is being read is only closed when the read finishes.
+    """
+
+    def __init__(self, max_workbooks=8, max_bytes=256 * 1024 * 1024):
+        from collections import OrderedDict
+        from threading import RLock
+
+        self.max_workbooks = max_workbooks
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()  # key -> _CacheEntry
+        self._lock = RLock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(path):
+        import os
+
+        path = os.path.realpath(str(path))
+        st = os.stat(path)
+
+        return path, st.st_mtime_ns, st.st_size
+
+    @contextmanager
+    def open(self, path):
+        """Context manager that yields the open workbook for a path, opening it if it isn't cached. Workbooks
+        that aren't cached, or that were removed from the cache while in use, are closed when the last
+        user exits"""
+
+        key = self._key(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                entry.refs += 1
+
+        if entry is None:
+            # Parse the workbook without the lock, so other threads can use the cache while it loads
+            wb = open_workbook(key[0])
+
+            with self._lock:
+                self.misses += 1
+
+                entry = self._entries.get(key)
+
+                if entry is not None:
+                    # Another thread opened it first, so use that one
+                    wb.close()
+                else:
+                    # Drop the workbooks for older versions of the file
+                    self.evict(key[0])
+
+                    entry = _CacheEntry(wb, key[2])
+
+                # Hold the entry before trimming, so trimming can't close it
+                entry.refs += 1
+
+                if key not in self._entries and entry.size <= self.max_bytes:
+                    self._entries[key] = entry
+                    self._trim()
+
+        try:
+            yield entry.wb
+        finally:
+            with self._lock:
+                entry.refs -= 1
+
+                if entry.refs == 0 and self._entries.get(key) is not entry:
+                    entry.wb.close()
+
+    @property
+    def total_bytes(self):
+        return sum(e.size for e in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _release(entry):
+        """Close a workbook that has been removed from the cache, unless it is in use"""
+        if entry.refs == 0:
+            entry.wb.close()
+
+    def _trim(self):
+        while self._entries and (len(self._entries) > self.max_workbooks or self.total_bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._release(entry)
+
+    def evict(self, path=None):
+        """Remove the cached workbooks for a path, or all workbooks if path is None, closing the ones that
+        are not in use"""
+        import os
+
+        with self._lock:
+            if path is not None:
+                path = os.path.realpath(str(path))
+
+            for key in list(self._entries):
+                if path is None or key[0] == path:
+                    self._release(self._entries.pop(key))
+
+    def clear(self):
+        """Remove all of the workbooks"""
+        self.evict()
+
+
+workbook_cache = WorkbookCache()
+
+
 class ExcelSource(Source):
     """Generate rows from an excel file"""
 
@@ -25,70 +310,67 @@ class ExcelSource(Source):
     def srow_to_list(row_num, s):
         """Convert a sheet row to a list"""
 
-        values = []
+        return s.row_values(row_num)
 
-        try:
-            for col in range(s.ncols):
-                values.append(s.cell(row_num, col).value)
-        except:
-            raise
+    @property
+    def _segment(self):
+        # Without this check, failure to provide a target_segment will cause the return
+        # of the first worksheet.
+
+        # if not ts:
+        #    raise RowGeneratorError("URL does not include target file in fragment: {}".format(self.url))
 
-        return values
+        return self.url.target_segment or 0
 
     def __iter__(self):
         """Iterate over all of the lines in the file"""
 
         self.start()
 
-        wb = open_workbook(filename=str(self.url.fspath))
+        with workbook_cache.open(self.url.fspath) as wb:
+            yield from wb.iter_rows(self._segment)
 
-        ts = self.url.target_segment or  0
+        self.finish()
 
-        # Without this check, failure to provide a target_segment will cause the return
-        # of the first worksheet.
+    def iter_batches(self, batch_size=None):
+        """Iterate over the header, then batches of rows. For .xls files, each batch is read a column at a time"""
+        import numpy as np
+        from rowgenerators.source import iter_row_batches
 
-        # if not ts:
-        #    raise RowGeneratorError("URL does not include target file in fragment: {}".format(self.url))
+        batch_size = int(batch_size or self.default_batch_size)
 
-        try:
-            try:
-                sheets = wb.sheets()
-                sheet_no = int(ts)
-                s = sheets[sheet_no]
-            except (ValueError, IndexError):
-                # ValueError when Segment is the workbook name, not the number
-                # IndexError when the segment is a numeric name, such as a year,
-                # which converted with int(), but is larger than the # of sheets
-                s = wb.sheet_by_name(ts)
+        with workbook_cache.open(self.url.fspath) as wb:
 
-        except XLRDError as e:
-            raise RowGeneratorError("Failed to open Excel workbook: '{}' ".format(e))
+            self.start()
+
+            if not isinstance(wb, XlsWorkbook):
+                yield from iter_row_batches(wb.iter_rows(self._segment), batch_size)
+            else:
+                s = wb.sheet(self._segment)
 
-        for i in range(0, s.nrows):
-            yield self.srow_to_list(i, s)
+                if s.nrows > 0:
+                    yield self.srow_to_list(0, s)
+
+                for start in range(1, s.nrows, batch_size):
+                    end = min(start + batch_size, s.nrows)
+                    yield [np.array(s.col_values(col, start, end), dtype=object) for col in range(s.ncols)]
 
         self.finish()
 
     @property
     def children(self):
         """Return the sheet names from the workbook """
-        from xlrd import open_workbook
-
-        wb = open_workbook(filename=str(self.url.fspath))
 
-        sheets = wb.sheet_names()
-
-        return sheets
+        with workbook_cache.open(self.url.fspath) as wb:
+            return wb.sheet_names
 
     @staticmethod
     def make_excel_date_caster(file_name):
         """Make a date caster function that can convert dates from a particular workbook. This is required
         because dates in Excel workbooks are stupid. """
 
-        from xlrd import open_workbook
-
-        wb = open_workbook(file_name)
-        datemode = wb.datemode
+        with workbook_cache.open(file_name) as wb:
+            datemode = wb.datemode
 
         def excel_date(v):
             from xlrd import xldate_as_tuple
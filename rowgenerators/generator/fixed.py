@@ -3,29 +3,291 @@
 
 """ """
 
-from rowgenerators.source import Source
+from rowgenerators.exceptions import RowGeneratorError, SchemaError
+from rowgenerators.source import Source, batch_to_rows
+
+
+def _column_kind(datatype):
+    """Return 'int', 'float' or 'str' for the datatype of a table column"""
+
+    name = getattr(datatype, '__name__', datatype)
+
+    if name in ('int', 'integer'):
+        return 'int'
+    elif name in ('float', 'number'):
+        return 'float'
+    else:
+        return 'str'
+
+
+def _slice_column(records, start, width):
+    """Return a column of byte strings from a 2D array of record bytes"""
+    import numpy as np
+
+    part = records[:, start:start + width]
+
+    if part.shape[1] == 0:  # The column is past the end of the records
+        return np.zeros(len(records), dtype='S1')
+
+    return part.copy().view('S{}'.format(part.shape[1])).ravel()
+
+
+def _convert_column(col, kind, encoding):
+    """Convert a column of fixed-width byte strings to a stripped array of the column's type"""
+    import numpy as np
+
+    col = np.char.strip(col)
+
+    if kind == 'int':
+        try:
+            return col.astype(np.int64)
+        except ValueError:
+            # Probably blank values, so fall through to floats, with blanks as NaN
+            kind = 'float'
+
+    if kind == 'float':
+        try:
+            return np.where(col == b'', b'nan', col).astype(np.float64)
+        except ValueError as e:
+            raise RowGeneratorError("Failed to convert fixed-width column: {}".format(e))
+
+    if (col.view(np.uint8) < 128).all():
+        # Plain ASCII, which numpy converts much faster than it decodes
+        return col.astype('U')
+
+    return np.char.decode(col, encoding)
+
+
+def _parse_records(block, record_len, terminator, specs, encoding, path):
+    """Parse a block of fixed length records into a batch"""
+    import numpy as np
+
+    if len(block) % record_len:
+        # The last record doesn't have a line ending
+        block += terminator
+
+    if len(block) % record_len:
+        raise RowGeneratorError("Records in '{}' are not all {} bytes long".format(path, record_len))
+
+    records = np.frombuffer(block, dtype=np.uint8).reshape(-1, record_len)
+
+    if not (records[:, -1] == ord('\n')).all():
+        raise RowGeneratorError("Records in '{}' are not all {} bytes long".format(path, record_len))
+
+    return [_convert_column(_slice_column(records, s, w), kind, encoding) for s, w, kind in specs]
+
+
+def _record_length(mm):
+    """Return the length of the first record in a memory-mapped file, including the line ending, and
+    the line ending"""
+
+    record_len = mm.find(b'\n') + 1
+
+    if record_len == 0:  # A single record, with no line ending
+        record_len = len(mm) + 1
+
+    terminator = b'\r\n' if mm[record_len - 2:record_len] == b'\r\n' else b'\n'
+
+    return record_len, terminator
+
+
+def _parse_fixed_range(path, start, end, table, encoding, record_len=None, terminator=None, specs=None):
+    """Parse the records in a byte range of a fixed-width file, returning a list of rows, or, if record_len is
+    set, a batch. Runs in a worker process for FixedSource.iter_parallel()"""
+
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    if record_len:
+        return _parse_records(data, record_len, terminator, specs, encoding, path)
+    else:
+        parse = table.make_fw_row_parser()
+        lines = data.split(b'\n')
+        if not lines[-1]:
+            lines.pop()
+        return [parse(line.decode(encoding)) for line in lines]
+
 
 class FixedSource(Source):
-    """Generate rows from a fixed-width source"""
+    """Generate rows from a fixed-width source.
+
+    The row iterator walks the memory-mapped file one record at a time, and yields the stripped string
+    values for each column, with no header row. iter_batches() parses blocks of records in bulk with NumPy.
+    It yields the table headers first, and converts columns with int or float datatypes.
+    """
+
+    def __init__(self, ref, table=None, cache=None, working_dir=None, env=None, vectorized=False,
+                 max_workers=None, **kwargs):
+        """
 
-    def __init__(self, ref, table=None, cache=None, working_dir=None, env=None, **kwargs):
+        :param table: A Table with the name, width and datatype of each column
+        :param vectorized: If True, the row iterator yields the rows of the batches from iter_batches(),
+            which requires that all records have the same length.
+        :param max_workers: If set, iteration and iter_batches() read the file in parallel, with
+            this many processes, through iter_parallel()
+        """
         super().__init__(ref, cache, working_dir, **kwargs)
 
         self.table = table
 
         assert self.table
 
+        self.vectorized = vectorized
+
+        self.max_workers = max_workers
+
+    @property
+    def encoding(self):
+        return self.ref.encoding or 'utf8'
+
+    def _iter_records(self):
+        """Iterate over the records of the memory-mapped file, as bytes"""
+        import mmap
+
+        with open(self.ref.fspath, 'rb') as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Can't map an empty file
+                return
+
+            with mm:
+                yield from iter(mm.readline, b'')
+
     def __iter__(self):
         """Iterate over all of the lines in the file"""
 
+        # iter_batches() and iter_parallel() call start() and finish() themselves
+
+        if self.vectorized:
+            itr = self.iter_batches()
+            next(itr, None)  # The table headers, which the row iterator doesn't yield
+
+            for batch in itr:
+                yield from batch_to_rows(batch)
+
+            return
+
+        if self.max_workers:
+            yield from self.iter_parallel(self.max_workers)
+            return
+
         self.start()
 
         parse = self.table.make_fw_row_parser()
 
+        encoding = self.encoding
 
-        with open(self.ref.fspath) as f:
-            for line in f.readlines():
-                yield parse(line)
+        for record in self._iter_records():
+            yield parse(record.decode(encoding))
 
         self.finish()
 
+    def _column_specs(self):
+        """Return (start, width, kind) for each column of the table"""
+
+        specs = []
+        start = 0
+
+        for c in self.table:
+            try:
+                w = int(c.width)
+            except TypeError:
+                raise SchemaError('Table must have width value for {} column '.format(c.name))
+
+            specs.append((start, w, _column_kind(c.datatype)))
+            start += w
+
+        return specs
+
+    def iter_batches(self, batch_size=None):
+        """Yield the table headers, then batches of ``batch_size`` records, parsed in bulk.
+
+        All records must have the same length, and column widths are counted in bytes, so this
+        mode is only suitable for files in single-byte encodings.
+        """
+        import mmap
+
+        batch_size = int(batch_size or self.default_batch_size)
+
+        if self.max_workers:
+            yield from self.iter_parallel(self.max_workers, batches=True, batch_size=batch_size)
+            return
+
+        specs = self._column_specs()
+
+        encoding = self.encoding
+
+        self.start()
+
+        yield self.table.headers
+
+        with open(self.ref.fspath, 'rb') as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Can't map an empty file
+                self.finish()
+                return
+
+            with mm:
+                size = len(mm)
+                record_len, terminator = _record_length(mm)
+
+                for start in range(0, size, batch_size * record_len):
+                    block = mm[start:start + batch_size * record_len]
+
+                    yield _parse_records(block, record_len, terminator, specs, encoding, self.ref.fspath)
+
+        self.finish()
+
+    def iter_parallel(self, max_workers=None, ordered=True, batches=False, chunk_size=None, batch_size=None):
+        """Read the file in parallel, by splitting it into byte ranges that start on record boundaries and
+        parsing each range in a process pool.
+
+        Yields the rows, or, if ``batches`` is True, the table headers and then batches of ``batch_size`` records.
+        Batches are parsed in bulk, as with iter_batches(), and don't span ranges, so the last batch from each range
+        may be short.
+
+        :param max_workers: Number of worker processes. Defaults to the number of CPUs
+        :param ordered: If False, yield the rows of each range as soon as it is parsed, rather than in file order
+        :param batches: If True, yield batches, rather than rows
+        :param chunk_size: Approximate size, in bytes, of each range
+        :param batch_size: Number of records in a batch
+        """
+        import mmap
+        from .parallel import record_ranges, map_parallel
+
+        path = str(self.ref.fspath)
+        encoding = self.encoding
+
+        batch_size = int(batch_size or self.default_batch_size)
+
+        self.start()
+
+        if batches:
+            yield self.table.headers
+
+        ranges = record_ranges(path, 0, chunk_size, max_workers=max_workers)
+
+        if not ranges:
+            self.finish()
+            return
+
+        if batches:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                record_len, terminator = _record_length(mm)
+
+            args = [(path, s, e, None, encoding, record_len, terminator, self._column_specs()) for s, e in ranges]
+        else:
+            args = [(path, s, e, self.table, encoding) for s, e in ranges]
+
+        for result in map_parallel(_parse_fixed_range, args, max_workers=max_workers, ordered=ordered):
+            if batches:
+                n_rows = len(result[0]) if result else 0
+
+                for i in range(0, n_rows, batch_size):
+                    yield [c[i:i + batch_size] for c in result]
+            else:
+                yield from result
+
+        self.finish()
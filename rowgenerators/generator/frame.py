@@ -0,0 +1,137 @@
+# Copyright (c) 2017 Civic Knowledge. This file is licensed under the terms of the
+# MIT License, included in this distribution as LICENSE.txt
+
+"""Functions for generating rows and batches from pandas dataframes, and building dataframes from batches"""
+
+
+def _has_row_number_index(df):
+    """Return True if the index is unnamed and not an object or string, in which case
+    it is assumed to be just a row number and isn't included in the output"""
+    from pandas.api.types import is_object_dtype, is_string_dtype
+
+    return (len(df.index.names) == 1 and df.index.names[0] is None and
+            not (is_object_dtype(df.index.dtype) or is_string_dtype(df.index.dtype)))
+
+
+def frame_header(df):
+    """Return the header for a dataframe, with the names of the index levels first, unless the index
+    is just a row number """
+
+    if _has_row_number_index(df):
+        return list(df.columns)
+    else:
+        index_names = [n if n else "index{}".format(i) for i, n in enumerate(df.index.names)]
+        return index_names + list(df.columns)
+
+
+def _iter_chunk_columns(df, chunk_size):
+    """Yield blocks of rows of a dataframe, as lists of the index level and column Series or Indexes """
+
+    with_index = not _has_row_number_index(df)
+
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+
+        columns = []
+
+        if with_index:
+            columns += [chunk.index.get_level_values(i) for i in range(chunk.index.nlevels)]
+
+        columns += [chunk.iloc[:, i] for i in range(len(chunk.columns))]
+
+        yield columns
+
+
+def iter_frame_rows(df, chunk_size=10000):
+    """Yield the header of a dataframe, then its rows, as lists. The index levels are the first values of
+    each row, unless the index is just a row number.
+
+    The frame is converted a block of rows at a time, one column at a time, which is much faster than
+    iterrows(). Values are Python scalars, or pandas Timestamps and Timedeltas, as iterrows() returns. """
+
+    yield frame_header(df)
+
+    for columns in _iter_chunk_columns(df, chunk_size):
+        yield from map(list, zip(*[c.tolist() for c in columns]))
+
+
+def iter_frame_batches(df, batch_size):
+    """Yield the header of a dataframe, then batches of its rows, as lists of column arrays """
+
+    yield frame_header(df)
+
+    for columns in _iter_chunk_columns(df, batch_size):
+        yield [c.to_numpy() for c in columns]
+
+
+# Pandas types for the Python types that can appear as the datatype of a table column. The
+# integer and boolean types are nullable, so they can hold missing values
+_python_dtypes = {
+    int: 'Int64',
+    float: 'float64',
+    bool: 'boolean',
+    str: 'object'
+}
+
+
+def _column_dtypes(headers, dtype):
+    """Return a list of the dtype for each column, or None for columns that should be inferred. The dtype may
+    be a dict of column names to dtypes, a Table with column datatypes, or a single dtype for all columns """
+    from rowgenerators.table import Table
+
+    if dtype is None:
+        return [None] * len(headers)
+
+    if isinstance(dtype, Table):
+        dtype = {c.name: c.datatype for c in dtype if c.datatype}
+
+    if isinstance(dtype, dict):
+        dtypes = [dtype.get(h) for h in headers]
+    else:
+        dtypes = [dtype] * len(headers)
+
+    return [_python_dtypes.get(dt, dt) for dt in dtypes]
+
+
+def frame_from_batches(batches, dtype=None):
+    """Build a dataframe from an iterator in the batch protocol, the header followed by batches of column arrays.
+
+    Each batch is converted to typed columns as it arrives, so only one batch is held as Python objects, and the
+    columns are concatenated once, at the end.
+
+    :param batches: An iterator that yields the header, then batches
+    :param dtype: A dict of column names to dtypes, a Table with column datatypes, or a single dtype. Columns
+        without a dtype have their type inferred, as the DataFrame constructor does for a list of rows.
+    :return: a DataFrame
+    """
+    import pandas as pd
+
+    itr = iter(batches)
+
+    try:
+        headers = list(next(itr))
+    except StopIteration:
+        return pd.DataFrame()
+
+    dtypes = _column_dtypes(headers, dtype)
+
+    parts = [[] for _ in headers]
+
+    for batch in itr:
+        for i, (col, dt) in enumerate(zip(batch, dtypes)):
+            s = pd.Series(col, copy=False)
+            parts[i].append(s.astype(dt) if dt is not None else s.infer_objects())
+
+    columns = {}
+    for i, dt in enumerate(dtypes):
+        if parts[i]:
+            columns[i] = pd.concat(parts[i], ignore_index=True) if len(parts[i]) > 1 else parts[i][0]
+        else:
+            columns[i] = pd.Series([], dtype=dt or object)
+
+        parts[i] = None  # Release the batch columns as each one is concatenated
+
+    df = pd.DataFrame(columns, copy=False)
+    df.columns = headers
+
+    return df
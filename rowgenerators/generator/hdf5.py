@@ -1,117 +1,216 @@
 # Copyright (c) 2017 Civic Knowledge. This file is licensed under the terms of the
 # MIT License, included in this distribution as LICENSE.txt
 
-""" """
+"""Row generator for 2D HDF5 datasets.
 
-from rowgenerators.source import Source
+The URL fragment names the dataset and, optionally, the columns to read: ``file.h5#dataset;columns``. Columns
+may be a slice of column numbers, ``10:20``, a list of column numbers, ``1,5,7``, or a slice or list of
+variable names, which are looked up in the ``<dataset>_variable_labels`` table. The ``start_row`` and
+``end_row`` fragment query values select a range of rows, with ``end_row`` being the last row read.
+
+If there is a ``<dataset>_headers`` dataset, it has the names of the columns.
+"""
+
+from rowgenerators.source import Source, batch_to_rows
 from rowgenerators.exceptions import RowGeneratorError
-import pandas as pd
-from functools import lru_cache
 
-def bisect_df(df, v, col='variable_name_nd'):
-    """Perform a binary search on a dataframe"""
-    from math import log
+from collections import OrderedDict
 
-    max_n = (log(len(df)) / log(2)) + 2
+# Variable indexes, by file version and dataset, with the least recently used ones dropped
+_variable_indexes = OrderedDict()
+max_variable_indexes = 16
 
-    low = 0
-    high = len(df)
-    mid = int((low + high) / 2)
-    n = 0
-    while True:
 
-        e = df.iloc[mid]
+def _decode(v):
+    return v.decode('utf8') if isinstance(v, bytes) else str(v)
 
-        if v == e[col]:
-            return e
-        if v > e[col]:
-            low = mid
-        else:
-            high = mid
 
-        mid = int((low + high) / 2)
+def variable_index(f, ds_name):
+    """Return a pair of arrays, the sorted variable names from the variable labels table for a dataset, and their
+    column numbers. The index is built once for each version of the file. """
+    import os
+    import numpy as np
+
+    st = os.stat(f.filename)
+    key = (os.path.realpath(f.filename), st.st_mtime_ns, st.st_size, ds_name)
+
+    if key in _variable_indexes:
+        _variable_indexes.move_to_end(key)
+        return _variable_indexes[key]
+
+    try:
+        labels = f[ds_name + '_variable_labels']
+        label_headers = [_decode(e) for e in f[ds_name + '_variable_labels_headers'][:]]
+    except KeyError:
+        raise RowGeneratorError("Dataset '{}' has no variable labels, so columns can't be selected by name"
+                                .format(ds_name))
+
+    table = labels[:]
+    names = np.array([_decode(e) for e in table[:, label_headers.index('variable_name_nd')]])
+    col_nos = table[:, label_headers.index('col_no')].astype(np.int64)
+
+    order = np.argsort(names)
+
+    _variable_indexes[key] = index = (names[order], col_nos[order])
+
+    while len(_variable_indexes) > max_variable_indexes:
+        _variable_indexes.popitem(last=False)
+
+    return index
 
-        if n > max_n:
-            return None
 
-        n += 1
+def names_to_columns(f, ds_name, names):
+    """Convert a list of variable names to column numbers"""
+    import numpy as np
 
-        #print(n, max_n, v, low, mid, high)
+    sorted_names, col_nos = variable_index(f, ds_name)
 
-    return None
+    names = np.array(names)
 
-@lru_cache()
-def get_var_labels(ds_name, f):
-    ds = f[ds_name+'_variable_labels']
-    dhs = f[ds_name + '_variable_labels_headers']
+    pos = np.searchsorted(sorted_names, names)
+    pos[pos >= len(sorted_names)] = 0
+
+    missing = names[sorted_names[pos] != names]
+
+    if len(missing):
+        raise RowGeneratorError("Unknown variable names for dataset '{}': {}".format(ds_name, ', '.join(missing)))
+
+    return col_nos[pos]
 
-    cols = dhs[:]
-    return pd.DataFrame(ds[:], columns=cols)
 
 class Hdf5Source(Source):
-    """Generate rows from an excel file"""
+    """Generate rows from a 2D HDF5 dataset"""
 
     def __init__(self, ref, cache=None, working_dir=None, env=None, **kwargs):
         super().__init__(ref, cache, working_dir, **kwargs)
 
         self.url = ref
 
-    def dataframe(self, limit=None, *args, **kwargs):
-        import h5py
-        import sys
+    def _selection(self, f):
+        """Return the dataset, the column selection, a slice or an array of column numbers, and the
+        headers for the selected columns"""
+        import numpy as np
 
-        ds_name = self.ref.fragment[0]
+        ds_name = self.ref.target_file
 
-        slice_frag = self.ref.fragment[1]
+        try:
+            ds = f[ds_name]
+        except KeyError:
+            raise RowGeneratorError("No dataset '{}' in '{}'".format(ds_name, self.ref.fspath))
 
-        with h5py.File(str(self.ref.fspath)) as f:
+        slice_frag = self.ref.target_segment
 
-            ds = f[ds_name]
+        names = None
 
+        if not slice_frag:
+            slc = slice(0, ds.shape[1])
+        elif ':' in slice_frag:
+            parts = slice_frag.split(':')
+            try:
+                slc = slice(int(parts[0]), int(parts[1]))
+            except ValueError:  # The slice is names, not numbers
+                slc = slice(*names_to_columns(f, ds_name, parts))
+        else:
+            parts = slice_frag.split(',')
             try:
-                if ':' in slice_frag:
-                    parts = slice_frag.split(':')
-                    slc = slice(int(parts[0]), int(parts[1]))
-                else:
-                    slc = [int(e) for e in slice_frag.split(',')]
+                slc = np.array([int(e) for e in parts])
+            except ValueError:
+                slc = names_to_columns(f, ds_name, parts)
+                names = parts
 
-                try:
-                    headers_ds = f[ds_name + '_headers']
-                    headers = list(headers_ds[slc])
+        col_nos = np.arange(ds.shape[1])[slc]
 
-                except KeyError:
-                    headers = []
+        try:
+            headers_ds = f[ds_name + '_headers']
+            headers = [_decode(e) for e in headers_ds[:]]
+            headers = [headers[i] for i in col_nos]
+        except KeyError:
+            headers = names or ['col{}'.format(i) for i in col_nos]
 
-            except ValueError: # Hopefully b/c the slice is actually strings, not integers
+        return ds, slc, headers
 
-                df = get_var_labels(ds_name, f)
+    def _row_range(self, ds, limit=None):
+        """Return the first row and the row after the last one to read"""
 
-                def name_to_num(v):
-                    e = bisect_df(df,  v)
-                    return int(e.col_no)
+        query = self.ref.fragment_query or {}
 
-                if ':' in slice_frag:
-                    slice_frag = slice_frag.split(':')
-                    slc = slice(name_to_num(slice_frag[0]),name_to_num(slice_frag[1]))
-                    headers = headers[slc]
-                else:
-                    slice_frag = slice_frag.split(',')
-                    slc = [name_to_num(e) for e in slice_frag]
-                    headers = slice_frag
+        start = int(query.get('start_row') or 0)
+        end = int(query['end_row']) + 1 if query.get('end_row') not in (None, '') else ds.shape[0]
 
+        if limit is not None:
+            end = min(end, start + int(limit))
 
+        return start, min(end, ds.shape[0])
 
-            try:
-                vars_ds = f[ds_name + '_variable_labels']
-            except KeyError:
-                headers = []
+    @staticmethod
+    def _read_block(ds, start, end, slc):
+        """Read a block of rows of the selected columns"""
+        import numpy as np
+
+        if isinstance(slc, slice):
+            return ds[start:end, slc]
 
-            headers_map = {i:e for i,e in enumerate(headers)}
+        # h5py requires that point selections are increasing, and unique
+        cols, inverse = np.unique(slc, return_inverse=True)
 
-            df = pd.DataFrame(ds[0:10,slc], columns=headers if headers else None)
+        return ds[start:end, cols][:, inverse]
 
-        return df
+    def iter_batches(self, batch_size=None, limit=None):
+        """Iterate over the header, then batches of rows of the selected columns. The rows are read in blocks that
+        are aligned to the dataset's HDF5 chunks, so each chunk is only read and decompressed once, and the blocks
+        are re-split so every batch but the last has batch_size rows. """
+        import h5py
+        import numpy as np
+
+        batch_size = int(batch_size or self.default_batch_size)
+
+        self.start()
+
+        with h5py.File(str(self.ref.fspath), 'r') as f:
+
+            ds, slc, headers = self._selection(f)
+
+            yield headers
+
+            start, end = self._row_range(ds, limit)
+
+            chunk_rows = ds.chunks[0] if ds.chunks else 1
+
+            # Read blocks of whole chunks, starting on chunk boundaries
+            block_size = -(-batch_size // chunk_rows) * chunk_rows
+
+            pending = None  # Rows read, but not yet yielded
+
+            block_start = start
+
+            while block_start < end:
+                block_end = min((block_start // block_size + 1) * block_size, end)
+
+                block = self._read_block(ds, block_start, block_end, slc)
+
+                pending = block if pending is None else np.concatenate([pending, block])
+
+                while len(pending) >= batch_size:
+                    batch, pending = pending[:batch_size], pending[batch_size:]
+                    yield [batch[:, j] for j in range(batch.shape[1])]
+
+                block_start = block_end
+
+            if pending is not None and len(pending):
+                yield [pending[:, j] for j in range(pending.shape[1])]
+
+        self.finish()
+
+    def dataframe(self, limit=None, *args, **kwargs):
+        from .frame import frame_from_batches
+
+        return frame_from_batches(self.iter_batches(limit=limit), dtype=kwargs.get('dtype'))
 
     def __iter__(self):
         """Iterate over all of the lines in the file"""
-        raise NotImplementedError()
\ No newline at end of file
+
+        for i, batch in enumerate(self.iter_batches()):
+            if i == 0:
+                yield batch
+            else:
+                yield from batch_to_rows(batch)
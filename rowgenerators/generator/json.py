@@ -5,11 +5,154 @@
 
 import sys
 import os
+import re
 from rowgenerators.source import Source
+from rowgenerators.exceptions import RowGeneratorError
 import json
 
+
+_literals = ('true', 'false', 'null', 'NaN', 'Infinity', '-Infinity')
+
+
+def _incomplete(e, buf):
+    """Return True if a decode error could be because the buffer ends part way through a value, rather
+    than because the JSON is malformed"""
+
+    rest = buf[e.pos:]
+
+    return (e.pos >= len(buf)
+            or e.msg.startswith('Unterminated string')
+            or (e.msg.startswith('Invalid \\uXXXX escape') and e.pos + 12 > len(buf))  # May be a surrogate pair
+            or re.fullmatch(r'[-+.eE0-9]+', rest) is not None  # A number, cut off after a '.', 'e' or sign
+            or any(l.startswith(rest) for l in _literals))
+
+
+def iter_json_array(f, buffer_size=1024 * 1024):
+    """Incrementally parse a JSON array from a text file, yielding each element as soon as it is complete, so
+    only one element, and one buffer of text, is in memory at a time.
+    """
+
+    decoder = json.JSONDecoder()
+
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill(pos):
+        """Drop the parsed part of the buffer and read more. """
+        nonlocal buf, eof, read_size
+
+        chunk = f.read(read_size)
+
+        if not chunk:
+            eof = True
+
+        buf = buf[pos:] + chunk
+
+        return 0
+
+    def skip_space(pos):
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\n\r':
+                pos += 1
+
+            if pos < len(buf) or eof:
+                return pos
+
+            pos = fill(pos)
+
+    def next_char(pos):
+        """Skip whitespace, and return the position of the next character, which must exist"""
+        pos = skip_space(pos)
+
+        if pos >= len(buf):
+            raise RowGeneratorError("Unexpected end of JSON array")
+
+        return pos
+
+    read_size = buffer_size
+
+    pos = skip_space(fill(0))
+
+    if pos >= len(buf):
+        return  # Empty file
+
+    if buf[pos] != '[':
+        raise RowGeneratorError("Expected a JSON array, got '{}'".format(buf[pos:pos + 20]))
+
+    pos = next_char(pos + 1)
+
+    if buf[pos] == ']':
+        return  # Empty array
+
+    while True:
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+
+            # A number at the end of the buffer may continue in the next read
+            if end == len(buf) and not eof:
+                raise ValueError
+
+        except ValueError as e:
+            # Malformed JSON fails right away, rather than after reading the rest of the file
+            if eof or (isinstance(e, json.JSONDecodeError) and not _incomplete(e, buf)):
+                raise RowGeneratorError("Failed to parse JSON: {}".format(e))
+
+            # The element is incomplete, so read more. Increase the read size, so very large
+            # elements don't get re-parsed many times
+            pos = fill(pos)
+            read_size *= 2
+            continue
+
+        read_size = buffer_size
+
+        yield value
+
+        # Elements are separated by exactly one comma, with none after the last one
+        pos = next_char(end)
+
+        if buf[pos] == ']':
+            return
+        elif buf[pos] != ',':
+            raise RowGeneratorError("Expected ',' or ']' in JSON array, got '{}'".format(buf[pos:pos + 20]))
+
+        pos = next_char(pos + 1)
+
+        if buf[pos] in ',]':
+            raise RowGeneratorError("Expected a value in JSON array, got '{}'".format(buf[pos:pos + 20]))
+
+
+def iter_json_items(path, encoding='utf8'):
+    """Iterate over the elements of the JSON array in a file, with ijson if it has a C backend, or
+    otherwise with iter_json_array() """
+
+    try:
+        import ijson
+
+        if not ijson.backend.endswith('_c'):
+            raise ImportError("ijson only has a Python backend")
+
+    except ImportError:
+        with open(path, encoding=encoding) as f:
+            yield from iter_json_array(f)
+
+    else:
+        # ijson reads bytes, so it only handles UTF-8 directly.
+        if encoding.lower().replace('-', '') not in ('utf8', 'ascii'):
+            with open(path, encoding=encoding) as f:
+                yield from iter_json_array(f)
+            return
+
+        with open(path, 'rb') as f:
+            try:
+                yield from ijson.items(f, 'item', use_float=True)
+            except ijson.JSONError as e:
+                raise RowGeneratorError("Failed to parse JSON: {}".format(e))
+
+
 class JsonRowSource(Source):
-    """Generate rows from a JSON file with an array of rows. """
+    """Generate rows from a JSON file with an array of rows. The array is parsed incrementally, so
+    rows are yielded as they are parsed. """
 
     delimiter = ','
 
@@ -37,8 +180,7 @@ class JsonRowSource(Source):
             # Python 3.6 considers None to mean 'utf8', but Python 3.5 considers it to be 'ascii'
             encoding = self.url.encoding or 'utf8'
 
-            with open(self.url.fspath, encoding=encoding) as f:
-                yield from json.load(f)
+            yield from iter_json_items(self.url.fspath, encoding)
 
         except UnicodeError as e:
             raise
@@ -56,13 +198,38 @@ class JsonRowSource(Source):
         return next(iter(self))
 
 
-    def dataframe(self, limit=None, *args, **kwargs):
-        import pandas
+class JsonLinesSource(JsonRowSource):
+    """Generate rows from a JSON Lines file, with one JSON value per line. If the values are arrays, the first one
+    is the header. If they are objects, the keys of the first object are the header, and later objects
+    are converted to rows of their values for those keys. """
 
-        i = iter(self)
+    def __iter__(self):
+
+        self.start()
 
-        columns =  next(i)
+        encoding = self.url.encoding or 'utf8'
 
-        rows = list(i)
+        header = None
 
-        return pandas.DataFrame(rows, columns=columns)
+        with open(self.url.fspath, encoding=encoding) as f:
+            for i, line in enumerate(f):
+
+                if not line.strip():
+                    continue
+
+                try:
+                    v = json.loads(line)
+                except ValueError as e:
+                    raise RowGeneratorError("Failed to parse JSON on line {} of '{}': {}"
+                                            .format(i + 1, self.url.fspath, e))
+
+                if isinstance(v, dict):
+                    if header is None:
+                        header = list(v.keys())
+                        yield header
+
+                    yield [v.get(k) for k in header]
+                else:
+                    yield v
+
+        self.finish()
@@ -0,0 +1,144 @@
+# Copyright (c) 2017 Civic Knowledge. This file is licensed under the terms of the
+# MIT License, included in this distribution as LICENSE.txt
+
+"""Parallel reading of large local files.
+
+A file is split into byte ranges that start on record boundaries, and each range is parsed
+in a separate process. Boundaries are found by moving an evenly spaced byte offset forward to the
+start of the next line. For CSV files the start of the line must also be outside of a quoted
+field, which is determined from the parity of the number of quote characters before it. The quotes are
+counted in parallel, so the file is only read sequentially by the workers.
+
+Ranges are split on newline bytes, so files must be in an ASCII compatible encoding, such as UTF-8
+or Latin-1, and for CSV, quote characters must only appear in quoted fields.
+"""
+
+import os
+
+default_chunk_size = 64 * 1024 * 1024
+
+
+def _count_quotes(path, start, end, quotechar):
+    """Count the quote characters in a byte range of a file"""
+
+    n = 0
+
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+
+        while remaining > 0:
+            b = f.read(min(remaining, 16 * 1024 * 1024))
+            if not b:
+                break
+            n += b.count(quotechar)
+            remaining -= len(b)
+
+    return n
+
+
+def _find_record_start(mm, pos, in_quotes=False, quotechar=None):
+    """Return the offset of the first record that starts after pos, given whether pos is inside a quoted
+    field. Returns the length of the file if there is no such record. """
+
+    while True:
+        nl = mm.find(b'\n', pos)
+
+        if nl == -1:
+            return len(mm)
+
+        if quotechar and mm[pos:nl].count(quotechar) % 2:
+            in_quotes = not in_quotes
+
+        if not in_quotes:
+            return nl + 1
+
+        pos = nl + 1
+
+
+def record_ranges(path, start=0, chunk_size=None, quotechar=None, max_workers=None):
+    """Split a file, from ``start`` to the end, into (start, end) byte ranges of about ``chunk_size`` bytes,
+    each beginning at the start of a record. ``start`` must be the start of a record. If ``quotechar`` is set,
+    newlines inside of quoted fields don't end records.
+    """
+    import mmap
+
+    chunk_size = int(chunk_size or default_chunk_size)
+
+    size = os.path.getsize(path)
+
+    if size <= start:
+        return []
+
+    offsets = list(range(start, size, chunk_size))
+
+    if quotechar:
+        # The parity of the number of quotes before each offset says whether it is inside a quoted field
+        counts = map_parallel(_count_quotes, [(path, s, min(s + chunk_size, size), quotechar) for s in offsets],
+                              max_workers=max_workers)
+        in_quotes = []
+        n = 0
+        for c in counts:
+            in_quotes.append(n % 2 == 1)
+            n += c
+    else:
+        in_quotes = [False] * len(offsets)
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        starts = [start] + [_find_record_start(mm, o, q, quotechar) for o, q in zip(offsets[1:], in_quotes[1:])]
+
+    starts = sorted(set(starts + [size]))
+
+    return list(zip(starts[:-1], starts[1:]))
+
+
+def map_parallel(f, args, max_workers=None, ordered=True):
+    """Call ``f(*a)`` for each ``a`` in ``args`` in a process pool, and yield the results, in the order of ``args``
+    or, if ``ordered`` is False, as they complete.
+
+    Only a few more calls than there are workers are submitted at a time, so results are not accumulated
+    faster than they are consumed. If there is only one worker, or one call, the calls are run in this process.
+    """
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+    args = list(args)
+
+    max_workers = int(max_workers or os.cpu_count() or 1)
+
+    if max_workers == 1 or len(args) <= 1:
+        for a in args:
+            yield f(*a)
+        return
+
+    args = iter(args)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+
+        def submit(n):
+            if n <= 0:
+                return
+            for a in args:
+                pending.append(executor.submit(f, *a))
+                n -= 1
+                if n == 0:
+                    break
+
+        submit(max_workers * 2)
+
+        try:
+            while pending:
+                if ordered:
+                    yield pending.popleft().result()
+                    submit(1)
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        pending.remove(fut)
+                        yield fut.result()
+                    submit(len(done))
+        finally:
+            # Don't run the rest of the calls if the consumer stops early, or a call fails
+            for fut in pending:
+                fut.cancel()
@@ -20,7 +20,7 @@ class PythonSource(Source):
 
         super().__init__(ref, cache, working_dir, **kwargs)
 
-        if not working_dir in sys.path:
+        if working_dir and not working_dir in sys.path:
             sys.path.append(working_dir)
 
         self.env = env or {}
@@ -61,18 +61,11 @@ class PythonSource(Source):
 
         o = self()
 
-        if isinstance(o, types.GeneratorType):
-
-            # Just normal data, so use the iterator in this object.
-            headers = next(islice(self, 0, 1))
-            data = islice(self, 1, None)
-
-            return DataFrame(list(data), columns=headers)
-
-        elif isinstance(o, DataFrame):
+        if isinstance(o, DataFrame):
             return o
 
         else:
+            # Normal data, so build the frame from batches of rows from the iterator in this object.
             return super().dataframe(*args, **kwargs)
 
     def __iter__(self):
@@ -105,37 +98,19 @@ class PandasDataframeSource(Source):
         self._df = df
 
     def __iter__(self):
-
-        import numpy as np
-        from itertools import islice
+        from .frame import iter_frame_rows
 
         self.start()
 
-        df = self._df
-
-        if len(df.index.names) == 1 and df.index.names[0] is None and df.index.dtype != np.dtype('O'):
-            # For an unnamed, single index, assume that it is just a row number
-            # and we don't really need it
-
-            yield list(df.columns)
+        yield from iter_frame_rows(self._df)
 
-            for index, row in df.iterrows():
-                yield list(row)
-
-        else:
-
-            # Otherwise, either there are more than
-
-            index_names = [n if n else "index{}".format(i) for i, n in enumerate(df.index.names)]
+        self.finish()
 
-            yield index_names + list(df.columns)
+    def iter_batches(self, batch_size=None):
+        from .frame import iter_frame_batches
 
-            if len(df.index.names) == 1:
-                idx_list = lambda x: [x]
-            else:
-                idx_list = lambda x: list(x)
+        self.start()
 
-            for index, row in df.iterrows():
-                yield idx_list(index) + list(row)
+        yield from iter_frame_batches(self._df, int(batch_size or self.default_batch_size))
 
         self.finish()
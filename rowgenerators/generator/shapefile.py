@@ -28,13 +28,50 @@ def _import_requirements():
     try:
         import fiona
         from fiona.crs import from_epsg
-        from shapely.geometry import asShape
-        from shapely.ops import transform
+        from shapely.geometry import shape
         import pyproj
     except (ModuleNotFoundError, ImportError) as e:
         raise ImportError("Using ShapefileSource requires installing fiona, shapely and pyproj ") from e
         pass  # HACK Because this file gets collected by the test collectors
 
+
+def crs_name(crs):
+    """Return an 'epsg:<code>' string for a Fiona CRS, or its WKT if it has no EPSG code. Older versions of Fiona
+    return a dict, with the EPSG string in the 'init' key. """
+
+    if not crs:
+        return None
+
+    init = crs.get('init')
+
+    if init:
+        return init.lower()
+
+    try:
+        epsg = crs.to_epsg()
+    except AttributeError:
+        return None
+
+    return 'epsg:{}'.format(epsg) if epsg else crs.to_wkt()
+
+
+def project_geometries(geometries, transformer):
+    """Reproject an array of Shapely geometries, some of which may be None, with a pyproj Transformer. All of the
+    coordinates are projected with one call to the transformer. Z coordinates are dropped. """
+    import numpy as np
+    import shapely
+
+    geometries = shapely.force_2d(np.asarray(geometries, dtype=object))
+
+    coords = shapely.get_coordinates(geometries)
+
+    if len(coords):
+        x, y = transformer.transform(coords[:, 0], coords[:, 1])
+        geometries = shapely.set_coordinates(geometries, np.column_stack([x, y]))
+
+    return geometries
+
+
 class GeoSourceBase(Source):
     """ Base class for all geo sources. """
     pass
@@ -47,23 +84,80 @@ class GeoSourceBase(Source):
         By default will try to re-project to epsg:4326 during iteration. This can be turned off by setting
         the 'projection' argument to '<source>'
 
+        The 'geometry_format' argument can be set to 'wkb' to return the geometry as WKB bytes, rather than
+        a Shapely object. Both can be set in the ``env`` or as keyword arguments.
+
         :param ref:
         :param cache:
         :param working_dir:
         :param env:
         :param projection: Either an EPSG string, defaults to 'epsg:4326', or '<source>' to not project
+        :param geometry_format: 'shapely', the default, or 'wkb'
+        :param batch_size: Number of features that are projected together.
         :param kwargs:
+
+        These options select features and columns, and are passed to Fiona, so the features that are not
+        selected are not decoded or projected. They can also be set in the URL fragment, as in
+        ``#&bbox=-117.3,32.5,-116.8,33.1&columns=NAME,SRA&start_feature=10&end_feature=19``:
+
+        :param bbox: A (minx, miny, maxx, maxy) tuple or comma separated string. Only features that
+            intersect the box are read. The box is in the target projection.
+        :param where: An OGR SQL WHERE clause, to select features by their attributes
+        :param columns: A list, or comma separated string, of the property columns to read
+        :param start_feature: Index of the first feature to read, after the bbox and where filters
+        :param end_feature: Index of the last feature to read
         """
 
         super().__init__(ref, cache, working_dir)
 
         _import_requirements()
 
+        self._kwargs = kwargs
+
+        env = env or {}
+
+        self._env = env
+
+        self.bbox = self._option('bbox')
+
+        if isinstance(self.bbox, str):
+            self.bbox = self.bbox.split(',')
+
+        if self.bbox is not None:
+            try:
+                self.bbox = tuple(float(e) for e in self.bbox)
+                assert len(self.bbox) == 4
+            except (ValueError, AssertionError):
+                raise RowGeneratorError("The bbox must have four numbers, minx, miny, maxx, maxy: '{}'"
+                                        .format(self.bbox))
+
+        self.where = self._option('where')
+
+        self.start_feature = self._option('start_feature')
+        self.end_feature = self._option('end_feature')
+
+        self.start_feature = int(self.start_feature) if self.start_feature not in (None, '') else None
+        self.end_feature = int(self.end_feature) if self.end_feature not in (None, '') else None
+
         self.property_schema = self._parameters
 
-        self._kwargs = kwargs
+        self.ignore_fields = []
 
-        target_projection = (env or {}).get('projection', default_crs['init']).lower()
+        property_columns = self._option('columns')
+
+        if property_columns:
+            if isinstance(property_columns, str):
+                property_columns = property_columns.split(',')
+
+            unknown = [c for c in property_columns if c not in self.property_schema]
+
+            if unknown:
+                raise RowGeneratorError("Unknown columns: {}".format(', '.join(unknown)))
+
+            self.ignore_fields = [c for c in self.property_schema if c not in property_columns]
+            self.property_schema = {k: v for k, v in self.property_schema.items() if k in property_columns}
+
+        target_projection = str(env.get('projection', kwargs.get('projection', default_crs['init']))).lower()
 
         try:
             int(target_projection)
@@ -75,10 +169,45 @@ class GeoSourceBase(Source):
         self.target_projection = target_projection
         self.source_projection = None
 
+        self.geometry_format = env.get('geometry_format', kwargs.get('geometry_format', 'shapely')).lower()
+
+        if self.geometry_format not in ('shapely', 'wkb'):
+            raise RowGeneratorError("Geometry format must be 'shapely' or 'wkb', not '{}'"
+                                    .format(self.geometry_format))
+
+        self.batch_size = int(kwargs.get('batch_size', 1000))
+
         # Holds metadata, such as EPSG, that is inferred during processing.
         self._meta = {}
 
 
+    def _option(self, name, default=None):
+        """Return an option from the keyword arguments, the env, or the URL fragment, in that order"""
+
+        for d in (self._kwargs, self._env, getattr(self.ref, 'fragment_query', None) or {}):
+            if d.get(name) is not None:
+                return d[name]
+
+        return default
+
+    def _iter_features(self, source, transformer):
+        """Iterate over the selected features of an open collection"""
+
+        bbox = self.bbox
+
+        if bbox and transformer:
+            bbox = transformer.transform_bounds(*bbox, direction='INVERSE')
+
+        if self.start_feature is None and self.end_feature is None:
+            slc = ()
+        else:
+            slc = (self.start_feature or 0, self.end_feature + 1 if self.end_feature is not None else None)
+
+        if slc or bbox or self.where:
+            return source.filter(*slc, bbox=bbox, where=self.where)
+        else:
+            return iter(source)
+
     @property
     def meta(self):
         '''Used as post-iterator metadata in Metapack, copied into a resource term after build'''
@@ -121,7 +250,10 @@ class GeoSourceBase(Source):
         Note:
             The first column is an id field, taken from the id value of each shape
             The middle values are taken from the property_schema
-            The last column is a string named geometry, which has the wkt value, the type is geometry_type.
+            The last column is the geometry, a Shapely object or WKB bytes, with the type geometry_type.
+
+        Only the features and columns selected by the bbox, where, start, end and columns options are read.
+        Features are read in batches, and the geometries of each batch are projected together.
 
         """
 
@@ -129,21 +261,34 @@ class GeoSourceBase(Source):
         # support can be an extra
 
         import fiona
-        from fiona.crs import from_epsg
+        import fiona.errors
+        import shapely
         from shapely.geometry import shape
-        from shapely.ops import transform
         import pyproj
 
         self.start()
 
         args, kwargs = self._fiona_open_params()
 
-        with fiona.open(*args, **kwargs ) as source:
+        if self.ignore_fields:
+            kwargs['ignore_fields'] = self.ignore_fields
 
-            if self.target_projection == '<source>':
-                self.target_projection = source.crs.get('init')
+        try:
+            source = fiona.open(*args, **kwargs)
+        except fiona.errors.DriverError:
+            # Some drivers, such as GeoJSON, can't skip fields, so they are dropped after they are read.
+            if not kwargs.pop('ignore_fields', None):
+                raise
+            source = fiona.open(*args, **kwargs)
 
-            self.source_projection = source.crs.get('init')
+        property_names = list(self.property_schema)
+
+        with source:
+
+            self.source_projection = crs_name(source.crs)
+
+            if self.target_projection == '<source>':
+                self.target_projection = self.source_projection
 
             if self.source_projection != self.target_projection:
 
@@ -154,14 +299,12 @@ class GeoSourceBase(Source):
                 int(self.epsg_propjection_code)
 
                 transformer = pyproj.Transformer.from_crs(self.source_projection,
-                                                          f'epsg:{self.epsg_propjection_code}')
-
-                def project(x,y,z=None):
-                    return transformer.transform(x,y)
+                                                          f'epsg:{self.epsg_propjection_code}',
+                                                          always_xy=True)
 
                 self.projection = self.target_projection
             else:
-                project = None
+                transformer = None
                 self.projection = self.source_projection
 
             self._meta['source_projection'] = self.source_projection
@@ -170,27 +313,31 @@ class GeoSourceBase(Source):
 
             yield self.headers
 
-            for i,s in enumerate(source):
+            features = self._iter_features(source, transformer)
 
-                row_data = s['properties']
+            while True:
+                batch = list(islice(features, self.batch_size))
 
-                try:
-                    shp = shape(s['geometry'])
-                except AttributeError as e:
-                    shp = None
+                if not batch:
+                    break
 
-                row = [int(s['id'])]
-                for col_name, elem in row_data.items():
-                    row.append(elem)
+                rows = []
+                geometries = []
 
+                for s in batch:
+                    properties = s['properties']
+                    rows.append([int(s['id'])] + [properties[c] for c in property_names])
+                    geometries.append(shape(s['geometry']) if s['geometry'] else None)
 
-                if project and shp:
-                    row.append(transform(project, shp))
+                if transformer:
+                    geometries = project_geometries(geometries, transformer)
 
-                else:
-                    row.append(shp)
+                if self.geometry_format == 'wkb':
+                    geometries = shapely.to_wkb(geometries)
 
-                yield row
+                for row, geometry in zip(rows, geometries):
+                    row.append(geometry)
+                    yield row
 
         self.finish()
 
@@ -214,13 +361,14 @@ class ShapefileSource(GeoSourceBase):
             # Find the SHP file. I thought Fiona used to do this itself ...
             assert self.ref.target_file
 
-            vfs = 'zip://{}'.format(self.ref.fspath)
-
             if self.ref.target_file:
                 shp_file = '/' + self.ref.target_file.strip('/')
             else:
                 shp_file = '/' + next(
                     n for n in ZipFile(self.ref.fspath).namelist() if (n.endswith('.shp') or n.endswith('geojson')))
+
+            # Recent versions of Fiona can't open a layer by index from the archive alone
+            vfs = 'zip://{}!{}'.format(self.ref.fspath, shp_file.strip('/'))
         else:
             shp_file = self.ref.fspath
             vfs = None
@@ -233,14 +381,14 @@ class ShapefileSource(GeoSourceBase):
 
         vfs, shp_file, layer_index = self._open_file_params()
 
-        with fiona.open(vfs, layer=layer_index) as source:
+        with fiona.open(vfs or shp_file, layer=layer_index) as source:
 
             return source.schema['properties']
 
     def _fiona_open_params(self):
         vfs, shp_file, layer_index = self._open_file_params()
 
-        return (vfs, ), dict( layer=layer_index)
+        return (vfs or shp_file, ), dict(layer=layer_index)
 
 
     def dataframe(self, limit=None, *args, **kwargs):
@@ -4,17 +4,108 @@
 """ """
 
 import sys
+from threading import Lock
 from rowgenerators.exceptions import SourceError, RowGeneratorError
 from rowgenerators.source import Source
 
+_engines = {}
+_engines_lock = Lock()
+
+
+def get_engine(dsn):
+    """Return a SQLAlchemy engine for a DSN. Engines, and their connection pools, are created once
+    per DSN and shared"""
+    from sqlalchemy import create_engine
+
+    with _engines_lock:
+        try:
+            return _engines[dsn]
+        except KeyError:
+            _engines[dsn] = engine = create_engine(dsn, pool_pre_ping=True)
+            return engine
+
+
+def dispose_engines():
+    """Close the pooled connections of all of the cached engines, and remove them"""
+
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+
+        _engines.clear()
+
+
+def partition_predicates(connection, sql, column, partitions, method='range'):
+    """Return a list of (where clause, parameters) pairs that split the result of a query into
+    partitions on a column. With the 'range' method, the range from the minimum to maximum value is split into
+    equal parts, which is fast but only works for numeric columns. With the 'ntile' method, the values are split
+    into groups of equal size, with the NTILE window function, and works for any column that can be sorted.
+    There is a final partition for NULL values. """
+    from numbers import Number
+    from sqlalchemy import text
+
+    predicates = []
+
+    if method == 'ntile':
+        q = text(('select max({c}) from (select {c}, ntile(:n) over (order by {c}) as tile from ({sql}) q '
+                  'where {c} is not null) t group by tile order by tile').format(c=column, sql=sql))
+
+        bounds = [r[0] for r in connection.execute(q, {'n': partitions})]
+
+        for i, b in enumerate(bounds):
+            if i == 0:
+                predicates.append(('{} <= :hi'.format(column), {'hi': b}))
+            else:
+                predicates.append(('{c} > :lo and {c} <= :hi'.format(c=column), {'lo': bounds[i - 1], 'hi': b}))
+
+    elif method == 'range':
+        lo, hi = connection.execute(text('select min({c}), max({c}) from ({sql}) q'.format(c=column, sql=sql))).one()
+
+        if lo is not None:
+            if not all(isinstance(v, Number) and not isinstance(v, bool) for v in (lo, hi)):
+                raise RowGeneratorError(("Can't partition on column '{}' with the 'range' method, because it "
+                                         "isn't numeric; use method='ntile' instead").format(column))
+
+            if isinstance(lo, int) and isinstance(hi, int):
+                step = -(-(hi - lo + 1) // partitions)
+                edges = list(range(lo, hi + 1, step))
+            else:
+                edges = [lo + (hi - lo) * i / partitions for i in range(partitions)]
+
+            for i, e in enumerate(edges):
+                if i < len(edges) - 1:
+                    predicates.append(('{c} >= :lo and {c} < :hi'.format(c=column), {'lo': e, 'hi': edges[i + 1]}))
+                else:
+                    predicates.append(('{c} >= :lo and {c} <= :hi'.format(c=column), {'lo': e, 'hi': hi}))
+    else:
+        raise RowGeneratorError("Unknown partition method '{}'; must be 'range' or 'ntile'".format(method))
+
+    predicates.append(('{} is null'.format(column), {}))
+
+    return predicates
+
+
 class SqlSource(Source):
-    """Generate rows from a callable object. Takes kwargs from the spec to pass into the program. """
+    """Generate rows from a SQL query.
+
+    The query is run with a server-side cursor, for drivers that support one, and rows are fetched
+    ``batch_size`` at a time, so the whole result is never held in memory. The connection is returned
+    to the engine's pool when the iteration ends, even if it ends early.
 
-    def __init__(self, ref, cache=None, working_dir=None, env=None, **kwargs):
+    If ``partition_column`` is set, the result is split into ``partitions`` parts on that column, and the parts
+    are read concurrently, each on its own connection, by ``max_workers`` threads. See partition_predicates()
+    for the partition methods. The rows are in partition order if ``ordered`` is True, or in the order they
+    are fetched otherwise. Each partition only buffers a few batches ahead of the consumer.
+    """
+
+    default_fetch_size = 10000
+
+    def __init__(self, ref, cache=None, working_dir=None, env=None, batch_size=None, partition_column=None,
+                 partitions=None, partition_method='range', ordered=True, max_workers=None, **kwargs):
 
         super().__init__(ref, cache, working_dir, **kwargs)
 
-        if not working_dir in sys.path:
+        if working_dir and not working_dir in sys.path:
 
             sys.path.append(working_dir)
 
@@ -22,23 +113,180 @@ class SqlSource(Source):
 
         self.kwargs = kwargs
 
-    def __iter__(self):
+        self.batch_size = int(batch_size or self.default_fetch_size)
+
+        self.partition_column = partition_column
+        self.partitions = int(partitions or 4)
+        self.partition_method = partition_method
+        self.ordered = ordered
+        self.max_workers = int(max_workers or self.partitions)
 
-        from sqlalchemy import create_engine
-        from sqlalchemy.exc import  DatabaseError
+    def _connect(self):
+        from sqlalchemy.exc import DatabaseError, OperationalError
 
         try:
-            engine = create_engine(self.ref.dsn)
-            connection = engine.connect()
-        except DatabaseError as e:
-            raise RowGeneratorError("Database connection failed for dsn '{}' : {} ".format(self.ref.dsn,str(e)))
+            return get_engine(self.ref.dsn).connect()
+        except (DatabaseError, OperationalError) as e:
+            raise RowGeneratorError("Database connection failed for dsn '{}' : {} ".format(self.ref.dsn, str(e)))
+
+    def _execute(self, connection, sql, params=None, batch_size=None):
+        from sqlalchemy import text
+        from sqlalchemy.exc import DatabaseError
+
+        options = {'stream_results': True}
+
+        if batch_size is not None:
+            options['max_row_buffer'] = batch_size
 
         try:
-            r = connection.execute(self.ref.sql)
+            return connection.execution_options(**options).execute(text(sql), params or {})
         except DatabaseError as e:
-            raise RowGeneratorError("Database query failed for dsn '{}' : {} ".format(self.ref.dsn,str(e) ))
+            raise RowGeneratorError("Database query failed for dsn '{}' : {} ".format(self.ref.dsn, str(e)))
+
+    def _iter_fetch(self, batch_size):
+        """Run the query, then yield the column names, then lists of fetched rows"""
+
+        with self._connect() as connection:
+            r = self._execute(connection, self.ref.sql, batch_size=batch_size)
+
+            try:
+                yield list(r.keys())
+
+                while True:
+                    rows = r.fetchmany(batch_size)
+
+                    if not rows:
+                        break
+
+                    yield rows
+            finally:
+                r.close()
+
+    def _iter_partitioned_fetch(self, batch_size):
+        """Run the query in partitions, in a thread pool, then yield the column names, then lists of fetched
+        rows from all of the partitions"""
+        from concurrent.futures import ThreadPoolExecutor
+        from queue import Queue, Full
+        from threading import Event
+        from sqlalchemy.exc import DatabaseError
+
+        sql = self.ref.sql
+
+        with self._connect() as connection:
+            try:
+                predicates = partition_predicates(connection, sql, self.partition_column, self.partitions,
+                                                  self.partition_method)
+            except DatabaseError as e:
+                raise RowGeneratorError("Failed to partition query for dsn '{}' : {} ".format(self.ref.dsn, str(e)))
+
+            r = self._execute(connection, 'select * from ({}) q where 1 = 0'.format(sql))
+            headers = list(r.keys())
+            r.close()
+
+        yield headers
+
+        done = object()  # Marks the end of a partition
+        stop = Event()
+
+        # In order, each partition has its own queue, and the consumer reads them in turn. The partitions are
+        # run in order, so the one being read is always running or finished. Otherwise, they share a queue.
+        n_queues = len(predicates) if self.ordered else 1
+        queues = [Queue(maxsize=4) for _ in range(n_queues)]
+
+        def put(q, item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def run(i, where, params):
+            q = queues[i] if self.ordered else queues[0]
+
+            try:
+                with self._connect() as connection:
+                    r = self._execute(connection, 'select * from ({}) q where {}'.format(sql, where), params,
+                                      batch_size)
+                    try:
+                        while not stop.is_set():
+                            rows = r.fetchmany(batch_size)
+
+                            if not rows or not put(q, rows):
+                                break
+                    finally:
+                        r.close()
+            except Exception as e:
+                put(q, e)
+
+            put(q, done)
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+        futures = []
+
+        try:
+            futures = [executor.submit(run, i, where, params) for i, (where, params) in enumerate(predicates)]
+
+            remaining = len(predicates)
+
+            for q in queues:
+                while remaining:
+                    item = q.get()
+
+                    if item is done:
+                        remaining -= 1
+                        if self.ordered:
+                            break
+                    elif isinstance(item, RowGeneratorError):
+                        raise item
+                    elif isinstance(item, Exception):
+                        raise RowGeneratorError("Partitioned query failed for dsn '{}' : {} "
+                                                .format(self.ref.dsn, str(item))) from item
+                    else:
+                        yield item
+        finally:
+            stop.set()
+
+            # Partitions that haven't started don't need to run. shutdown(cancel_futures=True) needs Python 3.9
+            for f in futures:
+                f.cancel()
+
+            executor.shutdown(wait=True)
+
+    def _fetch(self, batch_size):
+        if self.partition_column:
+            return self._iter_partitioned_fetch(batch_size)
+        else:
+            return self._iter_fetch(batch_size)
+
+    def __iter__(self):
+
+        self.start()
+
+        itr = self._fetch(self.batch_size)
+
+        yield next(itr)
+
+        for rows in itr:
+            yield from map(list, rows)
+
+        self.finish()
+
+    def iter_batches(self, batch_size=None):
+        """Yield the column names, then batches of rows. Each batch is one fetchmany() call"""
+        from rowgenerators.source import rows_to_batch
+
+        self.start()
+
+        itr = self._fetch(int(batch_size or self.batch_size))
+
+        headers = next(itr)
 
-        yield r.keys()
+        yield headers
 
-        yield from r
+        for rows in itr:
+            yield rows_to_batch(rows, len(headers))
 
+        self.finish()
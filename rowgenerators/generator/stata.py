@@ -7,51 +7,107 @@ import sys
 from rowgenerators.exceptions import SourceError, RowGeneratorError
 from rowgenerators.source import Source
 from rowgenerators.appurl import parse_app_url
-import pandas as pd
-import numpy as np
 
+# pandas and numpy are imported in the functions that use them, so that
+# loading the generator entry points doesn't import them.
 
-def iterate_pandas(df):
+default_chunksize = 50000
 
+_metadata = {}
 
-    if len(df.index.names) == 1 and df.index.names[0] is None and df.index.dtype != np.dtype('O'):
-        # For an unnamed, single index, assume that it is just a row number
-        # and we don't really need it
 
-        yield list(df.columns)
+def _metadata_key(fspath):
+    import os
 
-        for index, row in df.iterrows():
-            yield list(row)
+    st = os.stat(fspath)
+    return os.path.realpath(fspath), st.st_mtime_ns, st.st_size
 
-    else:
 
-        # Otherwise, either there are more than
+def stata_metadata(fspath, scan=False, chunksize=None):
+    """Return the metadata for a Stata file, read once from the file header and cached for each version of
+    the file. The metadata is a dict with:
 
-        index_names = [n if n else "index{}".format(i) for i, n in enumerate(df.index.names)]
+    - columns: The names of the variables
+    - variable_labels: A dict of variable names to descriptions
+    - value_labels: A dict of the names of labeled variables to dicts of Stata values to labels
 
-        yield index_names + list(df.columns)
+    If ``scan`` is True, the file is also read once, a chunk at a time, to find the values of the labeled
+    variables, and the metadata has:
 
-        if len(df.index.names) == 1:
-            idx_list = lambda x: [x]
-        else:
-            idx_list = lambda x: list(x)
+    - categories: A dict of labeled variable names to sorted arrays of the values in the file. These are the
+      categories pandas would make when reading the whole file, so a position in one is a category code.
+    - missing: The set of labeled variables that have missing values
+    """
+    import numpy as np
+    import pandas as pd
 
-        for index, row in df.iterrows():
-            yield idx_list(index) + list(row)
+    key = _metadata_key(fspath)
 
-def to_codes(df):
-    """Return a dataframe with all of the categoricals represented as codes"""
-    df = df.copy()
-    cat_cols = df.select_dtypes(['category']).columns
-    df[cat_cols] = df[cat_cols].apply(lambda x: x.cat.codes)
-    return df
+    meta = _metadata.get(key)
+
+    if meta is None:
+        with pd.read_stata(fspath, iterator=True) as itr:
+            variable_labels = itr.variable_labels()
+            label_sets = itr.value_labels()
+            # The value label set name for each variable. Sets are often shared, or named differently from
+            # their variables, and there is no public interface for this mapping
+            label_names = itr._lbllist
+
+        columns = list(variable_labels.keys())
+
+        meta = {
+            'columns': columns,
+            'variable_labels': variable_labels,
+            'value_labels': {c: label_sets[ln] for c, ln in zip(columns, label_names) if ln in label_sets}
+        }
+
+        # Drop the metadata for older versions of the file
+        for k in [k for k in _metadata if k[0] == key[0]]:
+            del _metadata[k]
+
+        _metadata[key] = meta
+
+    if scan and 'categories' not in meta:
+        labeled = list(meta['value_labels'])
+        values = {c: set() for c in labeled}
+        missing = set()
 
-def make_cat_map(df, column):
-    """Extract the mapping between category names and codes from the dataset. There should be an interface
-    on the categorical index type for this map, but I could not find it. """
+        if labeled:
+            with pd.read_stata(fspath, columns=labeled, convert_categoricals=False, convert_dates=False,
+                               chunksize=chunksize or default_chunksize, iterator=True) as itr:
+                for chunk in itr:
+                    for c in labeled:
+                        col = chunk[c]
+                        if col.isna().any():
+                            missing.add(c)
+                        values[c].update(col.dropna().unique().tolist())
+
+        meta['categories'] = {c: np.array(sorted(v)) for c, v in values.items()}
+        meta['missing'] = missing
+
+    return meta
+
+
+def convert_labels(df, meta, codes=False):
+    """Convert the Stata values of the labeled columns of a chunk, read without converting categoricals, to
+    their labels, or if ``codes`` is True, to the category codes pandas would use for the whole file.
+    Values without labels are not changed. The metadata must be from stata_metadata(), scanned if codes is True.
+    """
+    import pandas as pd
+
+    for c, labels in meta['value_labels'].items():
+        if c not in df.columns:
+            continue
+
+        col = df[c]
+
+        if codes:
+            df[c] = pd.Categorical(col, categories=meta['categories'][c]).codes
+        else:
+            df[c] = col.map(labels).where(col.isin(list(labels)), col).astype(object)
+
+    return df
 
-    t = pd.DataFrame( {'codes': df[column].cat.codes, 'values': df[column]} ).drop_duplicates().sort_values('codes')
-    return { e.codes:e.values for e in list(t.itertuples())}
 
 def extract_categories(fspath):
     """
@@ -61,36 +117,28 @@ def extract_categories(fspath):
     :return:
     """
 
-    dfs = pd.read_stata(fspath)
-    itr = pd.read_stata(fspath, iterator=True)
-
-    var_d = itr.variable_labels()
-
-    # We ought to be able to just use the value_labels() method to get value labels, but
-    # there are a lot of variables it doesn't return values for. For those, we'll use
-    # make_cat_map, which analyzes the categorical values directly.
+    meta = stata_metadata(fspath, scan=True)
 
     columns = []
-    for col_name in dfs.columns:
+    for col_name in meta['columns']:
 
         col = {
-            'name' : col_name,
-            'description':var_d[col_name],
+            'name': col_name,
+            'description': meta['variable_labels'][col_name],
             'ordered': False,
             'values': {}
         }
 
-        try:
-            col['values'] = make_cat_map(dfs, col_name)
-        except AttributeError as e:
-            # Probably, column is not a category
-            pass
+        if col_name in meta['value_labels']:
+            # The codes are the positions of the file's values in the categories, and -1 for missing values,
+            # as pandas would make them if it read the whole file
+            labels = meta['value_labels'][col_name]
 
-        try:
-            if dfs[col_name].cat.ordered:
-                col['ordered'] = True
-        except AttributeError as e:
-            pass
+            if col_name in meta['missing']:
+                col['values'][-1] = float('nan')
+
+            for i, v in enumerate(meta['categories'][col_name].tolist()):
+                col['values'][i] = labels.get(v, v)
 
         columns.append(col)
 
@@ -114,7 +162,7 @@ class StataSource(Source):
 
         super().__init__(ref, cache, working_dir, **kwargs)
 
-        if not working_dir in sys.path:
+        if working_dir and not working_dir in sys.path:
             sys.path.append(working_dir)
 
         self.env = env or {}
@@ -144,16 +192,55 @@ class StataSource(Source):
 
     @property
     def columns(self):
+        return extract_categories(self.ref.fspath)
+
+    def _iter_frames(self, chunksize=None):
+        """Read the file a chunk at a time, with the labeled columns converted to labels or codes"""
         import pandas as pd
 
-        return extract_categories(self.ref.fspath)
+        codes = self.value_type == 'codes'
+
+        meta = stata_metadata(self.ref.fspath, scan=codes)
+
+        with pd.read_stata(self.ref.fspath, convert_categoricals=False,
+                           chunksize=int(chunksize or default_chunksize), iterator=True) as itr:
+            for chunk in itr:
+                yield convert_labels(chunk, meta, codes)
+
+    def _iter_chunks(self, f, chunksize=None):
+        """Yield the header, then the rows or batches that ``f`` generates from each chunk"""
 
+        header = None
+
+        for df in self._iter_frames(chunksize):
+            itr = f(df)
+            h = next(itr)
+
+            if header is None:
+                header = h
+                yield header
+
+            yield from itr
+
+        if header is None:
+            yield stata_metadata(self.ref.fspath)['columns']
 
     def __iter__(self):
+        from .frame import iter_frame_rows
+
+        self.start()
+
+        yield from self._iter_chunks(iter_frame_rows)
+
+        self.finish()
+
+    def iter_batches(self, batch_size=None):
+        from .frame import iter_frame_batches
+
+        batch_size = int(batch_size or self.default_batch_size)
 
-        df = self.dataframe()
+        self.start()
 
-        if self.value_type == 'codes':
-            df = to_codes(df)
+        yield from self._iter_chunks(lambda df: iter_frame_batches(df, batch_size), batch_size)
 
-        yield from iterate_pandas(df)
+        self.finish()
@@ -10,6 +10,51 @@ from rowgenerators.util import md5_file
 from .appurl.web.download import Downloader
 
 
+def rows_to_batch(rows, n_cols):
+    """Convert a list of rows to a batch, a list of ``n_cols`` NumPy object arrays, one per column.
+    Short rows are padded with None"""
+    import numpy as np
+    from itertools import zip_longest
+    from .exceptions import RowGeneratorError
+
+    columns = list(zip_longest(*rows)) if rows else [()] * n_cols
+
+    if len(columns) > n_cols:
+        raise RowGeneratorError("Row has {} values, but the header has only {} columns"
+                                .format(len(columns), n_cols))
+
+    columns += [(None,) * len(rows)] * (n_cols - len(columns))
+
+    return [np.fromiter(c, dtype=object, count=len(rows)) for c in columns]
+
+
+def iter_row_batches(rows, batch_size):
+    """Convert an iterator in the row protocol, the header followed by the data rows, to the batch protocol,
+    the header followed by batches of at most ``batch_size`` rows"""
+
+    itr = iter(rows)
+
+    try:
+        headers = next(itr)
+    except StopIteration:
+        return
+
+    yield headers
+
+    while True:
+        rows = list(islice(itr, batch_size))
+
+        if not rows:
+            break
+
+        yield rows_to_batch(rows, len(headers))
+
+
+def batch_to_rows(batch):
+    """Iterate over the rows of a batch, as lists"""
+    return map(list, zip(*[c.tolist() for c in batch]))
+
+
 class RowGenerator(object):
     """Main class for accessing row generators"""
 
@@ -23,12 +68,12 @@ class RowGenerator(object):
 
     def registered_urls(self):
         """Return an array of registered Urls. The first row is the header"""
-        from pkg_resources import iter_entry_points
+        from .appurl.util import iter_entry_points
 
         entries = ['Priority', 'EP Name', 'Module', 'Class']
         for ep in iter_entry_points('appurl.urls'):
             c = ep.load()
-            entries.append([c.match_priority, ep.name, ep.module_name, c.__name__, ])
+            entries.append([c.match_priority, ep.name, ep.module, c.__name__, ])
 
         return entries
 
@@ -41,6 +86,10 @@ class RowGenerator(object):
         """Iterate over dicts"""
         yield from self.url.generator.iter_dict
 
+    def iter_batches(self, batch_size=None):
+        """Yields first the header, then batches of data rows, as lists of column arrays"""
+        yield from self.url.generator.iter_batches(batch_size)
+
     @property
     def iter_row(self):
         """Iterate, yielding row proxy objects. DOes not first yield a header"""
@@ -113,6 +162,8 @@ class Source(object):
 
     priority = 100
 
+    default_batch_size = 50000
+
     def __init__(self, ref, cache=None, working_dir=None, env=None, **kwargs):
         self.ref = ref
 
@@ -183,16 +234,27 @@ class Source(object):
         for row in itr:
             yield dict(zip(headers, row))
 
-    def dataframe(self, *args, **kwargs):
-        """Return a pandas dataframe from the resource"""
+    def iter_batches(self, batch_size=None):
+        """Iterate over column-oriented batches of rows. The first item is the header. Each following item is
+        a batch of up to ``batch_size`` rows, as a list of NumPy arrays, one per column of the header.
+
+        This implementation collects the rows from the row iterator; sources that can read columns in
+        bulk override it.
+        """
+        yield from iter_row_batches(self, int(batch_size or self.default_batch_size))
+
+    def dataframe(self, *args, dtype=None, batch_size=None, **kwargs):
+        """Return a pandas dataframe from the resource, built from batches of rows so the whole
+        dataset is never held as a list of rows.
 
-        from pandas import DataFrame
+        :param dtype: A dict of column names to dtypes, or a Table with column datatypes, to convert
+            columns to, rather than inferring the types.
+        :param batch_size: Number of rows to convert at a time.
+        """
 
-        # Just normal data, so use the iterator in this object.
-        headers = next(islice(self, 0, 1))
-        data = islice(self, 1, None)
+        from .generator.frame import frame_from_batches
 
-        return DataFrame(list(data), columns=headers)
+        return frame_from_batches(self.iter_batches(batch_size), dtype=dtype)
 
     def start(self):
         pass
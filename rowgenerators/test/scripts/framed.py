@@ -0,0 +1,29 @@
+#! /usr/bin/env python
+
+# Write rows in the protocol that ProgramSource asks for, then exit with the status in the EXIT_STATUS env var
+
+import csv
+import json
+import sys
+from os import environ
+
+from rowgenerators.generator.program import write_frames
+
+if __name__ == "__main__":
+
+    properties = json.loads(environ.get('PROPERTIES'))
+
+    n = int(properties.get('n', 10))
+
+    rows = [['i', 'name', 'x']] + [[i, 'name-{}'.format(i), i / 2] for i in range(n)]
+
+    try:
+        if environ['ROWGEN_PROTOCOL'] == 'csv':
+            csv.writer(sys.stdout).writerows(rows)
+            sys.stdout.flush()
+        else:
+            write_frames(rows, environ['ROWGEN_PROTOCOL'], batch_size=1000)
+    except BrokenPipeError:
+        pass
+
+    sys.exit(int(environ.get('EXIT_STATUS', 0)))
@@ -24,6 +24,477 @@ class BasicTests(RowGeneratorTest):
 
         self.assertEqual(53, len(list(CsvSource(get_file(us)))))
 
+    def test_csv_batches(self):
+        import csv
+        from tempfile import TemporaryDirectory
+        from os.path import join
+
+        rows = [['id', 'name', 'note']] + [[str(i), 'name-{}'.format(i), 'a, "b"\nc' if i % 7 else ''] for i in range(1000)]
+
+        with TemporaryDirectory() as d:
+            fn = join(d, 'batches.csv')
+
+            with open(fn, 'w', newline='') as f:
+                csv.writer(f).writerows(rows)
+
+            u = parse_app_url(fn).get_resource().get_target()
+
+            self.assertEqual(rows, list(CsvSource(u)))
+            self.assertEqual(rows, list(CsvSource(u, batch_size=64)))
+
+            batches = list(CsvSource(u).iter_batches(300))
+
+            self.assertEqual(rows[0], batches[0])
+            self.assertEqual([300, 300, 300, 100], [len(b[0]) for b in batches[1:]])
+            self.assertEqual([r[2] for r in rows[1:]], [v for b in batches[1:] for v in b[2]])
+
+    def test_excel(self):
+        import xlrd
+        from rowgenerators.generator.excel import ExcelSource, XlsWorkbook, XlsxWorkbook, open_workbook
+
+        for fn, wb_class in (('sources/renter_cost_excel97.xls', XlsWorkbook),
+                             ('sources/renter_cost_excel07.xlsx', XlsxWorkbook),
+                             ('complex_headers/Public Reports 2014Q3.xlsx', XlsxWorkbook)):
+
+            path = data_path('public.source.civicknowledge.com/example.com/' + fn)
+
+            owb = open_workbook(path)
+            self.assertIsInstance(owb, wb_class)
+            owb.close()
+
+            # Compare to loading the whole workbook with xlrd
+            wb = xlrd.open_workbook(path)
+
+            self.assertEqual(wb.sheet_names(), [u.target_segment for u in parse_app_url(path).list()])
+
+            for i, s in enumerate(wb.sheets()[:4]):
+                g = ExcelSource(parse_app_url(path + '#' + str(i)).get_resource().get_target())
+
+                self.assertEqual(wb.sheet_names(), g.children)
+
+                # .xlsx rows have the sheet's declared width, which can include empty, formatted columns
+                rows = list(g)
+                self.assertEqual([s.row_values(r) for r in range(s.nrows)], [r[:s.ncols] for r in rows])
+                self.assertEqual({''}, {v for r in rows for v in r[s.ncols:]} | {''})
+
+        path = data_path('public.source.civicknowledge.com/example.com/complex_headers/Public Reports 2014Q3.xlsx')
+
+        rows = list(ExcelSource(parse_app_url(path + '#Measure Characteristics').get_resource().get_target()))
+        caster = ExcelSource.make_excel_date_caster(path)
+        self.assertEqual('2012-10-01', str(caster(rows[3][3])))
+
+        # An empty sheet finishes, like the other sources
+        from types import SimpleNamespace
+        from unittest.mock import patch
+
+        class Counting(ExcelSource):
+            finished = 0
+
+            def finish(self):
+                self.finished += 1
+
+        path = data_path('public.source.civicknowledge.com/example.com/sources/renter_cost_excel97.xls')
+
+        with patch.object(XlsWorkbook, 'sheet', lambda self, segment: SimpleNamespace(nrows=0, ncols=0)):
+            g = Counting(parse_app_url(path + '#0').get_resource().get_target())
+            self.assertEqual([], list(g.iter_batches()))
+            self.assertEqual(1, g.finished)
+
+        # Without a declared dimension, each row's trailing empty cells are trimmed
+        import re
+        import zipfile
+        from tempfile import TemporaryDirectory
+        from os.path import join
+        from openpyxl import Workbook
+
+        with TemporaryDirectory() as d:
+            wb = Workbook()
+            for row in (['a', 'b', None], [1, None, None], [None, 2, 3]):
+                wb.active.append(row)
+            wb.save(join(d, 'dim.xlsx'))
+
+            with zipfile.ZipFile(join(d, 'dim.xlsx')) as zin, zipfile.ZipFile(join(d, 'nodim.xlsx'), 'w') as zout:
+                for item in zin.infolist():
+                    data = zin.read(item.filename)
+                    if item.filename.startswith('xl/worksheets/'):
+                        data = re.sub(rb'<dimension[^>]*/>', b'', data)
+                    zout.writestr(item, data)
+
+            wb = open_workbook(join(d, 'nodim.xlsx'))
+            self.assertEqual([['a', 'b'], [1.0], ['', 2.0, 3.0]], list(wb.iter_rows(0)))
+            wb.close()
+
+    def test_json(self):
+        import io
+        import json
+        import tracemalloc
+        from tempfile import TemporaryDirectory
+        from os.path import join
+        from rowgenerators.generator.json import JsonRowSource, JsonLinesSource, iter_json_array
+        from rowgenerators.exceptions import RowGeneratorError
+
+        rows = [['id', 'name', 'value']] + [[i, 'name "{}"\n'.format(i), i * 0.25 if i % 3 else None]
+                                            for i in range(50000)]
+
+        # Elements and numbers that cross buffer boundaries
+        for buffer_size in (3, 64, 1024 * 1024):
+            self.assertEqual(rows[:1000], list(iter_json_array(io.StringIO(json.dumps(rows[:1000])), buffer_size)))
+
+        self.assertEqual([], list(iter_json_array(io.StringIO(' [ ] '))))
+
+        with self.assertRaises(RowGeneratorError):
+            list(iter_json_array(io.StringIO('[[1, 2], [3')))
+
+        # Malformed elements fail without reading the rest of the file, but truncated ones are read again
+        class Reader(io.StringIO):
+            chars = 0
+
+            def read(self, n=-1):
+                r = super().read(n)
+                self.chars += len(r)
+                return r
+
+        f = Reader('[[1], {"a" 1}, ' + '[2], ' * 100000 + '[3]]')
+        with self.assertRaises(RowGeneratorError):
+            list(iter_json_array(f, 64))
+        self.assertLess(f.chars, 1000)
+
+        doc = json.dumps([["a\u00e9\"b", [1.5e-3, -12, True, False, None, "x\ny\u00e9\U0001F600"]], -0.5E+10])
+        for buffer_size in (1, 2, 5):
+            self.assertEqual(json.loads(doc), list(iter_json_array(io.StringIO(doc), buffer_size)))
+
+        # Commas separate elements, as with json.loads
+        for bad in ('[1 2]', '[,1]', '[1,,2]', '[1,]', '[,]'):
+            with self.assertRaises(RowGeneratorError):
+                list(iter_json_array(io.StringIO(bad), 3))
+
+        self.assertEqual([1, 2], list(iter_json_array(io.StringIO(' [ 1 ,\n 2 ] '), 3)))
+
+        with TemporaryDirectory() as d:
+            fn = join(d, 'rows.json')
+
+            with open(fn, 'w') as f:
+                json.dump(rows, f)
+
+            g = JsonRowSource(parse_app_url(fn))
+            self.assertEqual(rows, list(g))
+
+            # Rows are parsed incrementally, so iterating doesn't hold the whole document
+            tracemalloc.start()
+            try:
+                for _ in g:
+                    pass
+                stream_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.reset_peak()
+                with open(fn) as f:
+                    json.load(f)
+                load_peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+            self.assertLess(stream_peak, load_peak / 4)
+
+            fn = join(d, 'rows.jsonl')
+
+            with open(fn, 'w') as f:
+                for i in range(100):
+                    f.write(json.dumps({'id': i, 'name': 'name-{}'.format(i)}) + '\n')
+                f.write('\n')
+                f.write(json.dumps({'name': 'last', 'extra': True}) + '\n')
+
+            g = get_file(fn).generator
+            self.assertIsInstance(g, JsonLinesSource)
+
+            jl_rows = list(g)
+            self.assertEqual(['id', 'name'], jl_rows[0])
+            self.assertEqual([5, 'name-5'], jl_rows[6])
+            self.assertEqual([None, 'last'], jl_rows[-1])
+            self.assertEqual(102, len(jl_rows))
+
+            fn = join(d, 'rows.ndjson')
+
+            with open(fn, 'w') as f:
+                f.writelines(json.dumps(r) + '\n' for r in rows[:100])
+
+            self.assertEqual(rows[:100], list(get_file(fn).generator))
+
+    def test_workbook_cache(self):
+        import os
+        import shutil
+        from tempfile import TemporaryDirectory
+        from os.path import join
+        from rowgenerators.generator.excel import ExcelSource, WorkbookCache, workbook_cache
+
+        src = data_path('public.source.civicknowledge.com/example.com/sources/multisheet.xls')
+
+        with TemporaryDirectory() as d:
+            path = join(d, 'multisheet.xls')
+            shutil.copy(src, path)
+
+            workbook_cache.clear()
+            misses = workbook_cache.misses
+
+            # Listing the sheets, then reading each one, opens the workbook once
+            for u in parse_app_url(path).list():
+                g = ExcelSource(u.get_resource().get_target())
+                self.assertTrue(len(list(g)) > 0)
+                self.assertEqual(3, len(g.children))
+                ExcelSource.make_excel_date_caster(path)
+
+            self.assertEqual(misses + 1, workbook_cache.misses)
+            self.assertEqual(1, len(workbook_cache))
+
+            # Changing the file replaces the cached workbook
+            st = os.stat(path)
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+            list(ExcelSource(parse_app_url(path + '#1').get_resource().get_target()))
+            self.assertEqual(misses + 2, workbook_cache.misses)
+            self.assertEqual(1, len(workbook_cache))
+
+            workbook_cache.evict(path)
+            self.assertEqual(0, len(workbook_cache))
+
+            # Limits on the number of workbooks, and on the total size of their files
+            path2 = join(d, 'renter_cost.xlsx')
+            shutil.copy(data_path('public.source.civicknowledge.com/example.com/sources/renter_cost_excel07.xlsx'),
+                        path2)
+
+            c = WorkbookCache(max_workbooks=1)
+            with c.open(path) as wb1:
+                pass
+            with c.open(path2) as wb2:
+                pass
+            self.assertEqual(1, len(c))
+            self.assertTrue(wb1.closed)
+            with c.open(path2) as wb:
+                self.assertIs(wb2, wb)
+
+            c = WorkbookCache(max_bytes=os.path.getsize(path) + os.path.getsize(path2) - 1)
+            with c.open(path), c.open(path2):
+                pass
+            self.assertEqual(1, len(c))
+
+            # Workbooks that are too big to cache are closed after use
+            c = WorkbookCache(max_bytes=10)
+            with c.open(path) as wb:
+                self.assertFalse(wb.closed)
+            self.assertEqual(0, len(c))
+            self.assertTrue(wb.closed)
+
+            # A workbook that is pushed out of the cache while it is being read stays open until the read ends
+            c = WorkbookCache(max_workbooks=1)
+            with c.open(path) as wb1:
+                with c.open(path2):
+                    pass
+                self.assertEqual(1, len(c))
+                self.assertFalse(wb1.closed)
+            self.assertTrue(wb1.closed)
+
+            # A slow workbook parse doesn't block cache hits in other threads, and when two threads open the
+            # same workbook, the first one into the cache is used
+            from threading import Thread, Event
+            from unittest.mock import patch
+            from rowgenerators.generator import excel
+
+            c = WorkbookCache()
+            with c.open(path) as wb1:
+                pass
+
+            parsing, release = Event(), Event()
+            opened, released = [], []
+
+            def slow_open(p):
+                parsing.set()
+                released.append(release.wait(5))
+                return open_workbook(p)
+
+            def read_path2():
+                with c.open(path2) as wb:
+                    opened.append(wb)
+
+            open_workbook = excel.open_workbook
+
+            with patch.object(excel, 'open_workbook', slow_open):
+                t = Thread(target=read_path2)
+                t.start()
+                self.assertTrue(parsing.wait(10))
+
+                with c.open(path) as wb:  # A hit, while the other thread is parsing
+                    self.assertIs(wb1, wb)
+
+                with patch.object(excel, 'open_workbook', open_workbook):
+                    with c.open(path2) as wb2:
+                        pass
+
+                release.set()
+                t.join()
+
+            self.assertEqual([True], released)
+            self.assertIs(wb2, opened[0])
+            self.assertFalse(wb2.closed)
+            self.assertEqual(2, len(c))
+            c.clear()
+
+            workbook_cache.clear()
+            rows = iter(ExcelSource(parse_app_url(path + '#1').get_resource().get_target()))
+            next(rows)
+            workbook_cache.evict(path)
+            self.assertTrue(len(list(rows)) > 0)
+            c.clear()
+
+    def test_parallel(self):
+        import csv
+        from tempfile import TemporaryDirectory
+        from os.path import join
+        from rowgenerators.table import Table
+        from rowgenerators.generator.parallel import record_ranges
+
+        rows = [['id', 'note', 'value']] + [[str(i), 'a "quoted"\n,\nvalue' if i % 3 else 'plain', str(i * 1.5)]
+                                            for i in range(2000)]
+
+        t = Table()
+        t.add_column('id', int, 6)
+        t.add_column('name', str, 10)
+
+        with TemporaryDirectory() as d:
+            fn = join(d, 'parallel.csv')
+
+            with open(fn, 'w', newline='') as f:
+                csv.writer(f).writerows(rows)
+
+            # Ranges are contiguous, and never start inside a quoted field
+            ranges = record_ranges(fn, 0, 1000, quotechar=b'"', max_workers=2)
+            self.assertEqual([r[1] for r in ranges[:-1]], [r[0] for r in ranges[1:]])
+            with open(fn, 'rb') as f:
+                data = f.read()
+            self.assertTrue(all(data[s:e].count(b'"') % 2 == 0 for s, e in ranges))
+
+            g = get_file(fn).generator
+
+            self.assertEqual(rows, list(g.iter_parallel(max_workers=2, chunk_size=1000)))
+
+            unordered = list(g.iter_parallel(max_workers=2, chunk_size=1000, ordered=False))
+            self.assertEqual(rows[0], unordered[0])
+            self.assertEqual(rows[1:], sorted(unordered[1:], key=lambda r: int(r[0])))
+
+            batches = list(g.iter_parallel(max_workers=2, chunk_size=10000, batches=True, batch_size=100))
+            self.assertEqual(rows[0], batches[0])
+            self.assertEqual([r[1] for r in rows[1:]], [v for b in batches[1:] for v in b[1]])
+            self.assertEqual(100, max(len(b[0]) for b in batches[1:]))
+
+            fn = join(d, 'parallel.txt')
+
+            with open(fn, 'w') as f:
+                f.writelines('{:>6}{:<10}\n'.format(i, 'name-{}'.format(i)) for i in range(2000))
+
+            u = parse_app_url('fixed+file:' + fn)
+
+            self.assertEqual(list(get_generator(u, table=t)),
+                             list(get_generator(u, table=t).iter_parallel(max_workers=2, chunk_size=1000)))
+
+            batches = list(get_generator(u, table=t).iter_parallel(max_workers=2, chunk_size=10000, batches=True,
+                                                                   batch_size=100))
+            self.assertEqual(['id', 'name'], batches[0])
+            self.assertEqual(100, max(len(b[0]) for b in batches[1:]))
+            self.assertEqual(list(range(2000)), [v for b in batches[1:] for v in b[0].tolist()])
+
+            self.assertEqual(1999000, get_generator(u, table=t, max_workers=2).dataframe().id.sum())
+
+    def test_batches(self):
+        import pandas as pd
+        from tempfile import TemporaryDirectory
+        from os.path import join
+        from rowgenerators.source import batch_to_rows
+        from rowgenerators.generator.python import PandasDataframeSource
+
+        def check(g, batch_size=7):
+            rows = list(g)
+            batches = list(g.iter_batches(batch_size))
+
+            self.assertEqual(rows[0], batches[0])
+            self.assertTrue(all(len(b) == len(rows[0]) for b in batches[1:]))
+            self.assertTrue(all(len(b[0]) <= batch_size for b in batches[1:]))
+            self.assertEqual(rows[1:], [r for b in batches[1:] for r in batch_to_rows(b)])
+
+            return batches
+
+        # The default implementation, from the row iterator, pads short rows
+        check(get_generator([['a', 'b']] + [[i, str(i)] for i in range(20)]))
+        batches = list(get_generator([['a', 'b'], [1, 2], [3]]).iter_batches())
+        self.assertEqual([[1, 3], [2, None]], [c.tolist() for c in batches[1]])
+
+        for fn in ('renter_cost_excel07.xlsx', 'renter_cost_excel97.xls'):
+            check(get_file(data_path('public.source.civicknowledge.com/example.com/sources/' + fn)).generator, 1000)
+
+        check(parse_app_url(data_path('small_demo.h5') + '#nlsy97_all_1997-2013;1,2,3').generator)
+
+        df = pd.DataFrame({'a': range(20), 'b': [str(i) for i in range(20)],
+                           'c': pd.Categorical(['x', 'y'] * 10)})
+
+        batches = check(PandasDataframeSource('<df>', df, None))
+        self.assertEqual(['a', 'b', 'c'], batches[0])
+        check(PandasDataframeSource('<df>', df.set_index('b'), None))
+
+        with TemporaryDirectory() as d:
+            fn = join(d, 'batches.dta')
+            df.to_stata(fn, write_index=False)
+            check(get_file(fn).generator)
+
+    def test_dataframe(self):
+        import json
+        import tracemalloc
+        import pandas as pd
+        from tempfile import TemporaryDirectory
+        from os.path import join
+        from rowgenerators.table import Table
+        from rowgenerators.generator.json import JsonRowSource
+
+        headers = ['id', 'half', 'name', 'even', 'missing']
+
+        def rows(n):
+            yield headers
+            for i in range(n):
+                yield [i, i * 0.5, 'name-{}'.format(i % 100), i % 2 == 0, None if i % 7 == 0 else i]
+
+        def peak_memory(f):
+            tracemalloc.start()
+            try:
+                f()
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        df = get_generator(rows(1000)).dataframe(batch_size=64)
+        pd.testing.assert_frame_equal(pd.DataFrame(list(rows(1000))[1:], columns=headers), df)
+
+        list_peak = peak_memory(lambda: pd.DataFrame(list(rows(200000))[1:], columns=headers))
+        stream_peak = peak_memory(lambda: get_generator(rows(200000)).dataframe(batch_size=10000))
+
+        self.assertLess(stream_peak, list_peak / 3)
+
+        # Types from a dict or from a table schema
+        df = get_generator(rows(100)).dataframe(batch_size=30, dtype={'id': 'float32', 'missing': 'Int64'})
+        self.assertEqual('float32', str(df.id.dtype))
+        self.assertEqual('Int64', str(df.missing.dtype))
+
+        t = Table()
+        t.add_column('id', float)
+        t.add_column('missing', int)
+        df = get_generator(rows(100)).dataframe(dtype=t)
+        self.assertEqual(['float64', 'float64', 'Int64'], [str(df[c].dtype) for c in ('id', 'half', 'missing')])
+
+        self.assertEqual(headers, list(get_generator(rows(0)).dataframe().columns))
+
+        with TemporaryDirectory() as d:
+            fn = join(d, 'rows.json')
+
+            with open(fn, 'w') as f:
+                json.dump(list(rows(100)), f)
+
+            df = JsonRowSource(parse_app_url(fn)).dataframe()
+            self.assertEqual((100, 5), df.shape)
+            self.assertEqual(4950, df.id.sum())
+
     def test_entrypoints(self):
         from rowgenerators.generator.iterator import IteratorSource
         from rowgenerators.generator.generator import GeneratorSource
@@ -38,6 +509,64 @@ class BasicTests(RowGeneratorTest):
         self.assertIsInstance(get_generator(g()), GeneratorSource)
         self.assertIsInstance(get_generator(parse_app_url(us).get_resource().get_target()), CsvSource)
 
+    def test_generator_registry(self):
+        from rowgenerators import resolve_generator
+        from rowgenerators.core import generator_registry, refresh_generator_registry
+        from rowgenerators.generator.iterator import IteratorSource
+        from rowgenerators.generator.excel import ExcelSource
+
+        ref, names, candidates = resolve_generator([])
+
+        self.assertEqual(['<iterator>'], names)
+        self.assertEqual(('<iterator>', IteratorSource), (candidates[0][0], candidates[0][2]))
+
+        u = parse_app_url('file:foo/bar.xlsx#sheet1')
+        r = resolve_generator(u)
+
+        self.assertIn('.xlsx', r.names)
+        self.assertEqual(ExcelSource, r.candidates[0][2])
+
+        # Entries are sorted by priority, and classes are only loaded once
+        priorities = [p for n, p, c in generator_registry().resolve(['.csv', '<iterator>', 'program+'])]
+        self.assertEqual(sorted(priorities), priorities)
+        self.assertIs(generator_registry().classes('.csv'), generator_registry().classes('.csv'))
+
+        self.assertIsNot(generator_registry(), refresh_generator_registry())
+
+    def test_import_time(self):
+        """Importing the CLI and loading all of the entry points must not import pkg_resources or
+        the heavy optional modules, and importing the CLI must stay within a time budget. """
+        import subprocess
+
+        budget = 250000  # microseconds
+
+        heavy = {'pkg_resources', 'pandas', 'numpy', 'xlrd', 'openpyxl', 'fiona', 'shapely', 'pyproj',
+                 'geopandas', 'h5py', 'boto3', 'sqlalchemy', 'tableintuit', 'tabulate'}
+
+        code = ("import rowgenerators.cli\n"
+                "from rowgenerators.appurl.util import iter_entry_points\n"
+                "[ep.load() for g in ('rowgenerators', 'appurl.urls') for ep in iter_entry_points(g)]\n")
+
+        def import_times():
+            p = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                               stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+            times = {}
+            for line in p.stderr.splitlines():
+                try:
+                    _, cumulative, name = line.split('|')
+                    times[name.strip()] = int(cumulative)
+                except ValueError:  # The header line
+                    pass
+
+            return times
+
+        import_times()  # The first run may be compiling bytecode
+        times = import_times()
+
+        self.assertEqual(set(), {n.split('.')[0] for n in times} & heavy)
+        self.assertLess(times['rowgenerators.cli'], budget)
+
     def test_sources(self):
         from csv import DictReader
 
@@ -89,6 +618,155 @@ class BasicTests(RowGeneratorTest):
         self.assertIn('"prop2": "a"', rows['env-PROPERTIES'])
 
 
+    @unittest.skipIf(sys.platform.startswith("win"), "Program sources don't run on Windows")
+    def test_program_protocols(self):
+        from rowgenerators.exceptions import SourceError
+        from rowgenerators.generator.program import ProgramSource
+
+        u = parse_app_url(script_path('framed.py'))
+
+        expected = [['i', 'name', 'x']] + [[i, 'name-{}'.format(i), i / 2] for i in range(2500)]
+
+        def gen(protocol, **env):
+            return ProgramSource(u, working_dir=dirname(u.path), protocol=protocol, env=dict({'n': 2500}, **env))
+
+        rows = list(gen('csv'))
+        self.assertEqual([[str(v) for v in r] for r in expected], rows)
+
+        for protocol in ('msgpack', 'arrow'):
+            self.assertEqual(expected, list(gen(protocol)))
+
+        batches = list(gen('arrow').iter_batches())
+        self.assertEqual(['i', 'name', 'x'], batches[0])
+        self.assertEqual([1000, 1000, 500], [len(b[0]) for b in batches[1:]])
+
+        for protocol in ('csv', 'msgpack', 'arrow'):
+            with self.assertRaises(SourceError):
+                list(gen(protocol, EXIT_STATUS=3))
+
+        # Stopping early kills the program, without an error
+        g = gen('msgpack', n=10 ** 6)
+        self.assertEqual(expected[:3], [r for r, _ in zip(g, range(3))])
+
+        with self.assertRaises(SourceError):
+            gen('parquet')
+
+    def test_sql(self):
+        import sqlite3
+        from tempfile import TemporaryDirectory
+        from os.path import join
+        from rowgenerators.exceptions import RowGeneratorError
+        from rowgenerators.generator.sql import SqlSource, get_engine, dispose_engines
+
+        with TemporaryDirectory() as d:
+            fn = join(d, 'test.db')
+
+            with sqlite3.connect(fn) as conn:
+                conn.execute('create table t (id integer, name text, x real)')
+                conn.executemany('insert into t values (?, ?, ?)',
+                                 [(i, 'name-{}'.format(i), i / 2) for i in range(2500)])
+
+            u = parse_app_url('sqlite:///{}#select * from t where id >= 10 and name != \'a;b\''.format(fn))
+
+            # The query is kept in the fragment when the URL is converted back to a string
+            self.assertEqual(u.sql, parse_app_url(str(u)).sql)
+            self.assertEqual(u.dsn, parse_app_url(str(u)).dsn)
+            self.assertEqual(u.sql, u.dict['fragment'])
+
+            g = u.generator
+            self.assertIsInstance(g, SqlSource)
+
+            rows = list(g)
+            self.assertEqual(['id', 'name', 'x'], rows[0])
+            self.assertEqual([10, 'name-10', 5.0], rows[1])
+            self.assertEqual(2491, len(rows))
+
+            batches = list(g.iter_batches(1000))
+            self.assertEqual(['id', 'name', 'x'], batches[0])
+            self.assertEqual([1000, 1000, 490], [len(b[0]) for b in batches[1:]])
+
+            # The engine is shared, and the connection is returned to the pool when iteration stops early
+            engine = get_engine(u.dsn)
+            self.assertIs(engine, get_engine(u.dsn))
+
+            itr = iter(SqlSource(u, batch_size=100))
+            next(itr), next(itr)
+            self.assertEqual(1, engine.pool.checkedout())
+            itr.close()
+            self.assertEqual(0, engine.pool.checkedout())
+
+            with self.assertRaises(RowGeneratorError):
+                list(parse_app_url('sqlite:///{}#select * from nope'.format(fn)).generator)
+
+            dispose_engines()
+
+    def test_sql_partitions(self):
+        import sqlite3
+        from unittest.mock import patch
+        from tempfile import TemporaryDirectory
+        from os.path import join
+        from rowgenerators.exceptions import RowGeneratorError
+        from rowgenerators.generator.sql import SqlSource, get_engine, dispose_engines
+
+        with TemporaryDirectory() as d:
+            fn = join(d, 'test.db')
+
+            data = [(i if i % 100 else None, 'name-{}'.format(i), i / 3) for i in range(1, 5001)]
+
+            with sqlite3.connect(fn) as conn:
+                conn.execute('create table t (id integer, name text, x real)')
+                conn.executemany('insert into t values (?, ?, ?)', data)
+
+            u = parse_app_url('sqlite:///{}#select * from t where name != \'name-7\''.format(fn))
+
+            expected = [list(r) for r in data if r[1] != 'name-7']
+            expected = [r for r in expected if r[0] is not None] + [r for r in expected if r[0] is None]
+
+            for kwargs in (dict(partition_column='id', partitions=3),
+                           dict(partition_column='id', partitions=7, partition_method='ntile', max_workers=2),
+                           dict(partition_column='x', partitions=5)):
+                g = SqlSource(u, batch_size=300, **kwargs)
+                rows = list(g)
+                self.assertEqual(['id', 'name', 'x'], rows[0])
+                self.assertEqual(sorted(expected, key=lambda r: r[1]), sorted(rows[1:], key=lambda r: r[1]))
+
+                if kwargs['partition_column'] == 'id':
+                    self.assertEqual(expected, rows[1:])
+
+            g = SqlSource(u, batch_size=300, partition_column='id', partitions=4, ordered=False)
+            batches = list(g.iter_batches())
+            self.assertEqual(len(expected), sum(len(b[0]) for b in batches[1:]))
+            self.assertEqual(sorted(r[1] for r in expected), sorted(v for b in batches[1:] for v in b[1]))
+
+            # Stopping early stops the workers and returns their connections
+            itr = iter(SqlSource(u, batch_size=10, partition_column='id', partitions=4))
+            self.assertEqual(['id', 'name', 'x'], next(itr))
+            next(itr)
+            itr.close()
+            self.assertEqual(0, get_engine(u.dsn).pool.checkedout())
+
+            with self.assertRaises(RowGeneratorError):
+                list(SqlSource(u, partition_column='nope'))
+
+            # With server side cursors, as with Postgres and MySQL drivers, stream_results uses a buffered cursor
+            dialect = get_engine(u.dsn).dialect
+
+            with patch.object(dialect, 'supports_server_side_cursors', True), \
+                    patch.object(dialect.execution_ctx_cls, 'create_server_side_cursor',
+                                 lambda ctx: ctx.create_default_cursor(), create=True):
+                rows = list(SqlSource(u, batch_size=300, partition_column='id', partitions=3))
+                self.assertEqual(expected, rows[1:])
+                self.assertEqual(len(expected) + 1, len(list(SqlSource(u, batch_size=300))))
+
+            # Ranges need numbers, but ntile works for any column that sorts
+            with self.assertRaises(RowGeneratorError):
+                list(SqlSource(u, partition_column='name'))
+
+            rows = list(SqlSource(u, partition_column='name', partition_method='ntile', partitions=3))
+            self.assertEqual(sorted(expected, key=lambda r: r[1]), sorted(rows[1:], key=lambda r: r[1]))
+
+            dispose_engines()
+
     @unittest.skip('Has local path')
     def test_fixed(self):
         from itertools import islice
@@ -117,6 +795,70 @@ class BasicTests(RowGeneratorTest):
         for row in islice(g,10):
             print(row)
 
+    def test_fixed_width(self):
+        from tempfile import TemporaryDirectory
+        from os.path import join
+        from rowgenerators.table import Table
+        from rowgenerators.exceptions import RowGeneratorError
+
+        t = Table()
+        t.add_column('id', int, 6)
+        t.add_column('name', str, 10)
+        t.add_column('value', float, 8)
+
+        lines = ['{:>6}{:<10}{:>8}'.format(i, 'name-{}'.format(i), '' if i % 5 == 0 else i * 1.5) for i in range(25)]
+
+        with TemporaryDirectory() as d:
+            for ending, last in (('\n', '\n'), ('\r\n', '\r\n'), ('\n', '')):
+                fn = join(d, 'fixed.txt')
+
+                with open(fn, 'w', newline='') as f:
+                    f.write(ending.join(lines) + last)
+
+                u = parse_app_url('fixed+file:' + fn)
+
+                rows = list(get_generator(u, table=t))
+                self.assertEqual(25, len(rows))
+                self.assertEqual(['1', 'name-1', '1.5'], rows[1])
+
+                batches = list(get_generator(u, table=t).iter_batches(10))
+                self.assertEqual(['id', 'name', 'value'], batches[0])
+                self.assertEqual([10, 10, 5], [len(b[0]) for b in batches[1:]])
+                self.assertEqual('int64', batches[1][0].dtype)
+
+                vrows = list(get_generator(u, table=t, vectorized=True))
+                self.assertEqual([int(r[0]) for r in rows], [r[0] for r in vrows])
+                self.assertEqual([r[1] for r in rows], [r[1] for r in vrows])
+                self.assertEqual([float(r[2] or 'nan') for r in rows[1:5]], [r[2] for r in vrows[1:5]])
+
+                df = get_generator(u, table=t).dataframe()
+                self.assertEqual(300, df.id.sum())
+
+            with open(fn, 'w') as f:
+                f.write('\n'.join(lines + ['short']))
+
+            with self.assertRaises(RowGeneratorError):
+                list(get_generator(u, table=t, vectorized=True))
+
+            # Each way of reading calls start() and finish() once, including for an empty file
+            calls = []
+
+            for content in ('\n'.join(lines), ''):
+                with open(fn, 'w') as f:
+                    f.write(content)
+
+                for kwargs in ({}, {'vectorized': True}, {'max_workers': 2}):
+                    g = get_generator(u, table=t, **kwargs)
+                    g.start, g.finish = (lambda: calls.append('start')), (lambda: calls.append('finish'))
+
+                    del calls[:]
+                    list(g)
+                    self.assertEqual(['start', 'finish'], calls, (content, kwargs))
+
+                    del calls[:]
+                    list(g.iter_batches())
+                    self.assertEqual(['start', 'finish'], calls, (content, kwargs))
+
     def test_google(self):
 
         from hashlib import md5
@@ -185,6 +927,7 @@ class BasicTests(RowGeneratorTest):
         import pandas as pd
         from rowgenerators.appurl.file.hdf5 import Hdf5Url
         from rowgenerators.generator.hdf5 import Hdf5Source
+        from rowgenerators.exceptions import RowGeneratorError
 
         #fn_base = data_path('small_demo.h5')+'#nlsy97_all_1997-2013;'
         fn_base = '/Users/eric/proj/virt-proj/data-project/sdrdl-data-projects/nlsinfo.org/' \
@@ -210,3 +953,145 @@ class BasicTests(RowGeneratorTest):
         self.assertEqual(['B0000300', 'B0000400', 'B0000500', 'B0000600'], list(df.columns))
 
 
+
+    def test_hdf5_source(self):
+        import h5py
+        import numpy as np
+        from tempfile import TemporaryDirectory
+        from os.path import join
+        from rowgenerators.generator.hdf5 import Hdf5Source
+        from rowgenerators.exceptions import RowGeneratorError
+
+        with TemporaryDirectory() as d:
+            fn = join(d, 'demo.h5')
+
+            data = np.arange(1000 * 6, dtype='int32').reshape(1000, 6)
+            names = ['v{}'.format(i) for i in range(6)]
+
+            with h5py.File(fn, 'w') as f:
+                f.create_dataset('demo', data=data, chunks=(64, 6))
+                f['demo_headers'] = np.array(['h{}'.format(i) for i in range(6)], dtype='S')
+                f['demo_variable_labels'] = np.array([[n, str(i)] for i, n in enumerate(names)], dtype='S')
+                f['demo_variable_labels_headers'] = np.array(['variable_name_nd', 'col_no'], dtype='S')
+
+            def gen(frag):
+                g = parse_app_url(fn + '#demo;' + frag).generator
+                self.assertIsInstance(g, Hdf5Source)
+                return g
+
+            rows = list(gen('1:3'))
+            self.assertEqual(['h1', 'h2'], rows[0])
+            self.assertEqual(data[:, 1:3].tolist(), rows[1:])
+
+            # Names, numbers and repeated columns, in any order
+            self.assertEqual(data[:, [4, 0, 4]].tolist(), list(gen('v4,v0,v4'))[1:])
+            self.assertEqual(['h5', 'h2'], next(iter(gen('5,2'))))
+            self.assertEqual(data[:, 2:5].tolist(), list(gen('v2:v5'))[1:])
+
+            with self.assertRaises(RowGeneratorError):
+                list(gen('v1,nope'))
+
+            # Row ranges, with the end row included
+            self.assertEqual(data[100:201, [1]].tolist(), list(gen('1&start_row=100&end_row=200'))[1:])
+
+            # Blocks are read on chunk boundaries, but every batch except the last is full
+            batches = list(gen('0:6&start_row=10').iter_batches(100))
+            self.assertEqual([100] * 9 + [90], [len(b[0]) for b in batches[1:]])
+            self.assertEqual(data[10:, 0].tolist(), np.concatenate([b[0] for b in batches[1:]]).tolist())
+
+            df = gen('v0,v3').dataframe(limit=5)
+            self.assertEqual(['h0', 'h3'], list(df.columns))
+            self.assertEqual(data[:5, [0, 3]].tolist(), df.values.tolist())
+
+    def test_frame_rows(self):
+        import numpy as np
+        import pandas as pd
+        from rowgenerators.generator.python import PandasDataframeSource
+        from rowgenerators.generator.frame import iter_frame_rows
+
+        n = 25
+        df = pd.DataFrame({'a': range(n), 'b': [str(i) for i in range(n)],
+                           'c': pd.Categorical(['x', 'y', None, 'z', 'x'] * 5),
+                           'd': pd.date_range('2020-01-01', periods=n),
+                           'e': np.linspace(0, 1, n)})
+
+        def iterrows(df, with_index):
+            rows = []
+            for index, row in df.iterrows():
+                index = list(index) if isinstance(index, tuple) else [index]
+                rows.append((index if with_index else []) + list(row))
+            return rows
+
+        rows = list(PandasDataframeSource('<df>', df, None))
+        self.assertEqual(['a', 'b', 'c', 'd', 'e'], rows[0])
+        self.assertEqual(iterrows(df, False), rows[1:])
+        self.assertIsInstance(rows[1][3], pd.Timestamp)
+        self.assertIs(type(rows[1][0]), int)
+
+        # Named, string and multi-level indexes are included in the rows
+        for idf, header in ((df.set_index('b'), ['b', 'a', 'c', 'd', 'e']),
+                            (df.set_index(['b', 'a']), ['b', 'a', 'c', 'd', 'e']),
+                            (df.set_index(df.b.rename(None)), ['index0', 'a', 'b', 'c', 'd', 'e'])):
+            rows = list(iter_frame_rows(idf, chunk_size=7))
+            self.assertEqual(header, rows[0])
+            self.assertEqual(iterrows(idf, True), rows[1:])
+
+        self.assertEqual([['a', 'b', 'c', 'd', 'e']], list(iter_frame_rows(df.iloc[:0])))
+
+    def test_stata_chunks(self):
+        import pandas as pd
+        from tempfile import TemporaryDirectory
+        from os.path import join
+        from rowgenerators.generator.frame import iter_frame_rows
+        from rowgenerators.generator.stata import stata_metadata, extract_categories, _metadata
+
+        n = 1000
+        df = pd.DataFrame({'a': range(n), 'label': [i % 4 for i in range(n)], 'f': [i / 2 for i in range(n)]})
+
+        with TemporaryDirectory() as d:
+            fn = join(d, 'chunks.dta')
+            # Value 3 has no label
+            df.to_stata(fn, write_index=False, value_labels={'label': {0: 'zero', 1: 'one', 2: 'two'}},
+                        variable_labels={'a': 'The A'})
+
+            g = get_file(fn).generator
+
+            full = pd.read_stata(fn)
+            rows = list(g._iter_chunks(iter_frame_rows, 64))
+            self.assertEqual(list(iter_frame_rows(full)), rows)
+            self.assertEqual(['a', 'label', 'f'], rows[0])
+            self.assertEqual(['zero', 'one', 'two', 3], [r[1] for r in rows[1:5]])
+
+            meta = stata_metadata(fn)
+            self.assertEqual({'label': {0: 'zero', 1: 'one', 2: 'two'}}, meta['value_labels'])
+            self.assertEqual('The A', meta['variable_labels']['a'])
+
+            cols = extract_categories(fn)
+            self.assertEqual({0: 'zero', 1: 'one', 2: 'two', 3: 3}, cols[1]['values'])
+            self.assertFalse(cols[1]['ordered'])
+            self.assertIs(meta, stata_metadata(fn, scan=True))
+
+            g = parse_app_url(fn + '#values=codes').generator
+            codes = list(g._iter_chunks(iter_frame_rows, 64))
+            self.assertEqual(full.label.cat.codes.tolist(), [r[1] for r in codes[1:]])
+
+            # A label set with a different name than its variable, as in files written by Stata
+            fn = join(d, 'renamed.dta')
+            pd.DataFrame({'bbbb': [0, 1, 1, 0]}).to_stata(fn, write_index=False, version=118,
+                                                           value_labels={'bbbb': {0: 'no', 1: 'yes'}})
+
+            with open(fn, 'rb') as f:
+                data = f.read()
+
+            for tag in (b'value_label_names', b'value_labels'):
+                start, end = data.index(b'<' + tag + b'>'), data.index(b'</' + tag + b'>')
+                data = data[:start] + data[start:end].replace(b'bbbb\x00', b'zzzz\x00') + data[end:]
+
+            with open(fn, 'wb') as f:
+                f.write(data)
+
+            self.assertEqual(['no', 'yes', 'yes', 'no'], pd.read_stata(fn).bbbb.tolist())
+            self.assertEqual(['no', 'yes', 'yes', 'no'], [r[0] for r in list(get_file(fn).generator)[1:]])
+            self.assertEqual({0: 'no', 1: 'yes'}, extract_categories(fn)[0]['values'])
+
+        _metadata.clear()
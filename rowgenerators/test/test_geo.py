@@ -60,4 +60,92 @@ class TestGeo(unittest.TestCase):
         us = 'shape+http://public.source.civicknowledge.com/sangis.org/Subregional_Areas_2010.zip'
         u = parse_app_url(us)
 
-        print(u.generator.geoframe().geometry.total_bounds)
\ No newline at end of file
+        print(u.generator.geoframe().geometry.total_bounds)
+
+    @unittest.skipIf(not test_geo, "These tests require modules: fiona, pyproj, shapely")
+    def test_projection(self):
+        import fiona
+        import shapely
+        import geopandas as gpd
+        from fiona.crs import CRS
+        from tempfile import TemporaryDirectory
+        from os.path import join
+
+        with TemporaryDirectory() as d:
+            fn = join(d, 'mercator.geojson')
+
+            schema = {'geometry': 'Polygon', 'properties': {'name': 'str'}}
+
+            with fiona.open(fn, 'w', driver='GeoJSON', crs=CRS.from_epsg(3857), schema=schema) as f:
+                for i in range(25):
+                    x, y = i * 100000, i * 50000
+                    f.write({'geometry': {'type': 'Polygon',
+                                          'coordinates': [[(x, y), (x + 1000, y), (x + 1000, y + 1000), (x, y)]]},
+                             'properties': {'name': 'p{}'.format(i)}})
+
+            t = parse_app_url(fn).get_resource().get_target()
+
+            expected = gpd.read_file(fn).to_crs(4326).geometry.tolist()
+
+            g = get_generator(t, batch_size=7)
+            rows = list(g)
+
+            self.assertEqual(['id', 'name', 'geometry'], rows[0])
+            self.assertEqual(25, len(rows[1:]))
+            self.assertEqual('epsg:3857', g.meta['source_projection'])
+
+            for row, geometry in zip(rows[1:], expected):
+                self.assertTrue(shapely.equals_exact(geometry, row[-1], tolerance=1e-9))
+
+            g = get_generator(t, env={'geometry_format': 'wkb', 'projection': '<source>'})
+            rows = list(g)
+
+            self.assertIsInstance(rows[1][-1], bytes)
+            self.assertEqual((0, 0, 1000, 1000), shapely.from_wkb(rows[1][-1]).bounds)
+            self.assertEqual('epsg:3857', g.meta['projection'])
+
+    @unittest.skipIf(not test_geo, "These tests require modules: fiona, pyproj, shapely")
+    def test_pushdown(self):
+        import fiona
+        from fiona.crs import CRS
+        from tempfile import TemporaryDirectory
+        from zipfile import ZipFile
+        from os.path import join
+        from rowgenerators.exceptions import RowGeneratorError
+
+        with TemporaryDirectory() as d:
+
+            schema = {'geometry': 'Point', 'properties': {'name': 'str', 'county': 'str', 'n': 'int'}}
+
+            def write(fn, driver):
+                with fiona.open(fn, 'w', driver=driver, crs=CRS.from_epsg(3857), schema=schema) as f:
+                    for i in range(100):
+                        f.write({'geometry': {'type': 'Point', 'coordinates': (i * 10000, i * 10000)},
+                                 'properties': {'name': 'p{}'.format(i), 'county': 'c{}'.format(i % 5), 'n': i}})
+
+            write(join(d, 'points.geojson'), 'GeoJSON')
+            write(join(d, 'points.shp'), 'ESRI Shapefile')
+
+            with ZipFile(join(d, 'points.zip'), 'w') as zf:
+                for ext in ('shp', 'shx', 'dbf', 'prj', 'cpg'):
+                    zf.write(join(d, 'points.' + ext), 'points.' + ext)
+
+            for url in (join(d, 'points.geojson'), 'shape+file://' + join(d, 'points.zip')):
+
+                # The bbox is in the target projection, epsg:4326, and covers the points 10 to 20
+                rows = list(parse_app_url(url + '#&bbox=0.85,0.85,1.85,1.85').generator)
+                self.assertEqual(['p{}'.format(i) for i in range(10, 21)], [r[1] for r in rows[1:]])
+
+                rows = list(parse_app_url(url + '#&bbox=0.85,0.85,1.85,1.85&start_feature=2&end_feature=4&columns=n').generator)
+                self.assertEqual(['id', 'n', 'geometry'], rows[0])
+                self.assertEqual([12, 13, 14], [r[1] for r in rows[1:]])
+
+                g = get_generator(parse_app_url(url).get_resource().get_target(),
+                                  where="county = 'c3'", columns=['county', 'name'], env={'projection': '<source>'})
+                rows = list(g)
+                self.assertEqual(['id', 'name', 'county', 'geometry'], rows[0])
+                self.assertEqual(['p{}'.format(i) for i in range(3, 100, 5)], [r[1] for r in rows[1:]])
+                self.assertEqual((30000, 30000), rows[1][-1].coords[0])
+
+                with self.assertRaises(RowGeneratorError):
+                    get_generator(parse_app_url(url).get_resource().get_target(), columns='nope')
@@ -47,14 +47,17 @@ setup(
         'requests',
         'tabulate',
         'xlrd<2',
+        'openpyxl',
         'aniso8601',
         'geopandas',
         'pyyaml',
         'h5py',
-        'wrapt'
+        'wrapt',
+        'importlib_metadata>=3.6; python_version < "3.10"'
     ],
     extras_require={
-        'geo': ['fiona', 'shapely','pyproj', 'pyproject']
+        'geo': ['fiona', 'shapely','pyproj', 'pyproject'],
+        'program': ['msgpack', 'pyarrow']
     },
     test_requires=['aniso8601', 'dateutil', 'fiona', 'shapely','pyproj', 'pyproject', 'contexttimer'],
     entry_points={
@@ -62,6 +65,7 @@ setup(
             'rowgen=rowgenerators.cli:rowgen',
             'rowgen-generators=rowgenerators.cli:listrowgen',
             'rowgen-urls=rowgenerators.appurl.cli:appurl',
+            'rowgen-cache=rowgenerators.appurl.cli:rowgen_cache',
             'rowgen-valuestypes=rowgenerators.valuetype.cli:valuetypes'
         ],
 
@@ -95,6 +99,8 @@ setup(
 
             #Sql Alchemy
             "oracle: = rowgenerators.appurl.sql:OracleSql",
+            "sqlite: = rowgenerators.appurl.sql:SqliteSql",
+            "postgresql: = rowgenerators.appurl.sql:PostgresSql",
             "sql: = rowgenerators.appurl.sql:InlineSqlUrl",
             ".h5 = rowgenerators.appurl.file.hdf5:Hdf5Url",
             ".hdf5 = rowgenerators.appurl.file.hdf5:Hdf5Url",
@@ -118,6 +124,8 @@ setup(
             "<Sql> = rowgenerators.generator.sql:SqlSource",
             ".h5 = rowgenerators.generator.hdf5:Hdf5Source",
             ".hdf5 = rowgenerators.generator.hdf5:Hdf5Source",
+            ".jsonl = rowgenerators.generator.json:JsonLinesSource",
+            ".ndjson = rowgenerators.generator.json:JsonLinesSource",
         ],
     },
 